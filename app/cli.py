@@ -1,35 +1,261 @@
 from __future__ import annotations
 
+import json
 import logging
+import re
 from pathlib import Path
 
 import click
 
+from app.daemon import DEFAULT_PORT, BuildServer, run_server, send_request
 from config.parser import load_json_or_jsonc
-from core.interpreter import ConfigInterpreter
+from core.cache import DEFAULT_CACHE_DIRNAME, DEFAULT_MAX_SIZE, ArtifactCache
+from core.materialize import MATERIALIZE_STRATEGIES
+
+# The interpreter (and the transforms it loads) are imported by the commands that
+# build: `mapack --help`, `trigger` and `cache prune` are often scripted and
+# should start fast.
 
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 logger = logging.getLogger("mapack")
 
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+class ByteSize(click.ParamType):
+    name = "size"
+
+    def convert(self, value, param, ctx) -> int:
+        if isinstance(value, int):
+            return value
+        match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kKmMgGtT]?)i?[bB]?\s*", str(value))
+        if match is None:
+            self.fail(f"{value!r} is not a size (e.g. 512M, 10G)", param, ctx)
+        return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()])
+
+
+class DefaultCommandGroup(click.Group):
+    """Group that runs `default_command` when the first argument is not a subcommand.
+
+    Keeps `mapack <config.jsonc>` working next to `mapack cache prune`.
+    """
+
+    default_command = "build"
+
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        if args and args[0] not in self.commands and args[0] not in ctx.help_option_names:
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultCommandGroup, context_settings={"help_option_names": ["-h", "--help"]})
+def main() -> None:
+    """Pack maps from a JSON/JSONC config file."""
+
+
+def _build_options(fn):
+    """Options shared by `build`, `watch` and `serve`."""
+    options = [
+        click.option(
+            "--target",
+            "targets",
+            multiple=True,
+            help="Target(s) to execute. If omitted, all targets are executed.",
+        ),
+        click.option(
+            "-j",
+            "--jobs",
+            type=click.IntRange(min=1),
+            default=1,
+            show_default=True,
+            help="Maximum number of independent artifacts built concurrently.",
+        ),
+        click.option(
+            "--no-cache", is_flag=True, default=False, help="Rebuild everything without reading or filling the cache."
+        ),
+        click.option(
+            "--cache-dir",
+            type=click.Path(file_okay=False, path_type=Path),
+            default=None,
+            help=f"Artifact cache location. Defaults to {DEFAULT_CACHE_DIRNAME}/ next to the config file.",
+        ),
+        click.option(
+            "--cache-max-size",
+            type=ByteSize(),
+            default=DEFAULT_MAX_SIZE,
+            help="Evict least recently used cache entries beyond this size (e.g. 512M, 10G).",
+        ),
+        click.option(
+            "--cache-hash-contents",
+            is_flag=True,
+            default=False,
+            help="Fingerprint sources by content hash instead of size and modification time.",
+        ),
+        click.option(
+            "--materialize",
+            type=click.Choice(MATERIALIZE_STRATEGIES),
+            default="auto",
+            show_default=True,
+            help="How workdirs are populated from sources: reflink when supported (auto), hardlinks or plain copies. "
+            "Artifacts may override it with a 'materialize' field.",
+        ),
+        click.option(
+            "--zip-jobs",
+            type=click.IntRange(min=1),
+            default=None,
+            help="Threads compressing entries of each zip export. Defaults to the number of CPUs.",
+        ),
+    ]
+    for option in reversed(options):
+        fn = option(fn)
+    return fn
+
+
+def _cache_root(config_path: Path, cache_dir: Path | None) -> Path:
+    return (cache_dir or config_path.parent / DEFAULT_CACHE_DIRNAME).resolve()
 
-@click.command(context_settings={"help_option_names": ["-h", "--help"]})
+
+def _open_cache(
+    config_path: Path, no_cache: bool, cache_dir: Path | None, cache_max_size: int, cache_hash_contents: bool
+) -> ArtifactCache | None:
+    if no_cache:
+        return None
+    return ArtifactCache(
+        _cache_root(config_path, cache_dir), max_size=cache_max_size, hash_contents=cache_hash_contents
+    )
+
+
+@main.command("build")
 @click.argument("config_file", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@_build_options
+@click.option("--dry-run", is_flag=True, default=False, help="Build plan without writing output files.")
 @click.option(
-    "--target",
-    "targets",
-    multiple=True,
-    help="Target(s) to execute. If omitted, all targets are executed.",
+    "--profile",
+    "profile_trace",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Write a Chrome trace-event file of the build steps (chrome://tracing, ui.perfetto.dev) and print a summary.",
 )
-@click.option("--dry-run", is_flag=True, default=False, help="Build plan without writing output files.")
-def main(config_file: Path, targets: tuple[str, ...], dry_run: bool) -> None:
-    """Pack maps from a JSON/JSONC config file."""
+@click.option(
+    "--profile-report",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Write the timing, CPU, I/O and file counts of every build step as JSON and print a summary.",
+)
+@click.option("--profile-summary", is_flag=True, default=False, help="Print the slowest build steps.")
+def build(
+    config_file: Path,
+    targets: tuple[str, ...],
+    dry_run: bool,
+    jobs: int,
+    no_cache: bool,
+    cache_dir: Path | None,
+    cache_max_size: int,
+    cache_hash_contents: bool,
+    materialize: str,
+    zip_jobs: int | None,
+    profile_trace: Path | None,
+    profile_report: Path | None,
+    profile_summary: bool,
+) -> None:
+    """Build the artifacts of CONFIG_FILE."""
+    from core.history import HISTORY_FILENAME, BuildHistory
+    from core.interpreter import ConfigInterpreter
+    from core.profiling import Profiler
+
     config_path = config_file.resolve()
-    config = load_json_or_jsonc(config_path)
 
-    interpreter = ConfigInterpreter(config=config, config_path=config_path)
-    outputs_by_target = interpreter.run(list(targets) if targets else None, dry_run=dry_run)
+    cache = _open_cache(config_path, no_cache, cache_dir, cache_max_size, cache_hash_contents)
+    # parsed configs are kept next to the other blobs, keyed by the file's content
+    config = load_json_or_jsonc(
+        config_path, cache_dir=cache.blobs("config").root if cache else None, update_cache=not dry_run
+    )
+
+    report = bool(profile_trace or profile_report or profile_summary)
+    # step timings for `mapack plan` are kept with the cache
+    history = BuildHistory(cache.root / HISTORY_FILENAME) if cache is not None and not dry_run else None
+    profiler = Profiler(enabled=report or history is not None)
+    interpreter = ConfigInterpreter(
+        config=config,
+        config_path=config_path,
+        jobs=jobs,
+        cache=cache,
+        materialize=materialize,
+        zip_jobs=zip_jobs,
+        profiler=profiler,
+    )
+    try:
+        outputs_by_target = interpreter.run(list(targets) if targets else None, dry_run=dry_run)
+    finally:
+        # also written for failed builds, which are often the ones worth looking at
+        if report:
+            click.echo(profiler.summary())
+        if profile_trace is not None:
+            profiler.write_trace(profile_trace)
+        if profile_report is not None:
+            profiler.write_report(profile_report)
+        if history is not None:
+            history.record(profiler)
+            try:
+                history.save()
+            except OSError as exc:
+                logger.warning("could not save build history: %s", exc)
 
     click.echo("Build finished.")
+    _echo_outputs(outputs_by_target)
+
+
+@main.command("plan")
+@click.argument("config_file", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option("--target", "targets", multiple=True, help="Target(s) to plan. If omitted, all targets are planned.")
+@click.option("--no-cache", is_flag=True, default=False, help="Plan a build that does not use the cache.")
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help=f"Artifact cache location. Defaults to {DEFAULT_CACHE_DIRNAME}/ next to the config file.",
+)
+@click.option(
+    "--cache-hash-contents",
+    is_flag=True,
+    default=False,
+    help="Fingerprint sources by content hash instead of size and modification time (as the build would).",
+)
+@click.option("--json", "as_json", is_flag=True, default=False, help="Print the plan as JSON.")
+def plan(
+    config_file: Path,
+    targets: tuple[str, ...],
+    no_cache: bool,
+    cache_dir: Path | None,
+    cache_hash_contents: bool,
+    as_json: bool,
+) -> None:
+    """Show what building CONFIG_FILE would do and how long it should take, without building.
+
+    Durations are estimated from the timings of previous builds that used the cache.
+    """
+    from core.history import HISTORY_FILENAME, BuildHistory
+    from core.interpreter import ConfigInterpreter
+    from core.plan import format_plan, plan_build
+
+    config_path = config_file.resolve()
+    cache_root = _cache_root(config_path, cache_dir)
+    cache = _open_cache(config_path, no_cache, cache_dir, DEFAULT_MAX_SIZE, cache_hash_contents)
+    # planning leaves no trace: the parse cache is only read
+    config = load_json_or_jsonc(
+        config_path, cache_dir=cache.blobs("config").root if cache else None, update_cache=False
+    )
+    interpreter = ConfigInterpreter(config=config, config_path=config_path, cache=cache)
+    build_plan = plan_build(
+        interpreter, list(targets) if targets else None, history=BuildHistory(cache_root / HISTORY_FILENAME)
+    )
+    if as_json:
+        click.echo(json.dumps(build_plan.to_dict(), indent=2, default=str))
+    else:
+        click.echo(format_plan(build_plan))
+
+
+def _echo_outputs(outputs_by_target: dict[str, list]) -> None:
     for target_name, outputs in outputs_by_target.items():
         click.echo(f"- target={target_name}")
         if outputs:
@@ -39,5 +265,118 @@ def main(config_file: Path, targets: tuple[str, ...], dry_run: bool) -> None:
             click.echo("  - (no exported artifacts)")
 
 
+def _port_option(fn):
+    return click.option(
+        "--port",
+        type=click.IntRange(min=0, max=65535),
+        default=DEFAULT_PORT,
+        show_default=True,
+        help="Local TCP port of the build server.",
+    )(fn)
+
+
+def _build_server(config_file: Path, targets: tuple[str, ...], jobs: int, no_cache: bool, **options) -> BuildServer:
+    config_path = config_file.resolve()
+    cache = _open_cache(
+        config_path,
+        no_cache,
+        options.pop("cache_dir"),
+        options.pop("cache_max_size"),
+        options.pop("cache_hash_contents"),
+    )
+    return BuildServer(config_path, cache=cache, jobs=jobs, targets=list(targets) or None, **options)
+
+
+@main.command("watch")
+@click.argument("config_file", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@_build_options
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0.05),
+    default=1.0,
+    show_default=True,
+    help="Seconds between checks of the config and sources for changes.",
+)
+@_port_option
+@click.option("--no-server", is_flag=True, default=False, help="Do not accept `mapack trigger` requests.")
+def watch(config_file: Path, interval: float, port: int, no_server: bool, **options) -> None:
+    """Build CONFIG_FILE, then rebuild whenever it or its sources change.
+
+    Workdirs stay in place between builds, so only artifacts whose spec or
+    sources changed (and their dependents) are rebuilt.
+    """
+    run_server(_build_server(config_file, **options), port=None if no_server else port, watch_interval=interval)
+
+
+@main.command("serve")
+@click.argument("config_file", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@_build_options
+@_port_option
+def serve(config_file: Path, port: int, **options) -> None:
+    """Build CONFIG_FILE, then keep it loaded and rebuild on `mapack trigger` requests."""
+    run_server(_build_server(config_file, **options), port=port)
+
+
+@main.command("trigger")
+@click.option("--target", "targets", multiple=True, help="Target(s) to build. Defaults to the server's targets.")
+@_port_option
+@click.option("--status", is_flag=True, default=False, help="Show the server's state instead of building.")
+@click.option("--stop", is_flag=True, default=False, help="Stop the server.")
+def trigger(targets: tuple[str, ...], port: int, status: bool, stop: bool) -> None:
+    """Ask a running `mapack watch`/`mapack serve` to build."""
+    if stop:
+        request: dict = {"command": "stop"}
+    elif status:
+        request = {"command": "status"}
+    else:
+        request = {"command": "build", "targets": list(targets)}
+    try:
+        response = send_request(request, port=port)
+    except OSError as exc:
+        raise click.ClickException(f"No build server on port {port}: {exc}") from None
+    if not response.get("ok"):
+        raise click.ClickException(response.get("error") or "build failed")
+
+    if stop:
+        click.echo("Server stopped.")
+    elif status:
+        click.echo(json.dumps({k: v for k, v in response.items() if k != "ok"}, indent=2))
+    else:
+        click.echo("Build finished.")
+        _echo_outputs(response["outputs"])
+
+
+@main.group("cache")
+def cache_group() -> None:
+    """Manage the artifact cache."""
+
+
+@cache_group.command("prune")
+@click.argument("config_file", required=False, type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help=f"Artifact cache location. Defaults to {DEFAULT_CACHE_DIRNAME}/ next to CONFIG_FILE.",
+)
+@click.option(
+    "--max-size",
+    type=ByteSize(),
+    default=DEFAULT_MAX_SIZE,
+    help="Keep at most this many bytes of cache entries (0 empties the cache).",
+)
+def cache_prune(config_file: Path | None, cache_dir: Path | None, max_size: int) -> None:
+    """Evict least recently used entries from the cache of CONFIG_FILE (or --cache-dir)."""
+    if config_file is None and cache_dir is None:
+        raise click.UsageError("Pass the config file whose cache to prune, or --cache-dir.")
+    root = _cache_root(config_file.resolve(), cache_dir) if config_file is not None else cache_dir.resolve()
+    if not root.is_dir():
+        click.echo(f"No cache at {root}.")
+        return
+    cache = ArtifactCache(root, max_size=max_size)
+    removed, freed = cache.prune()
+    click.echo(f"Removed {removed} cache entries ({freed} bytes).")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import json
+import logging
+import socket
+import socketserver
+import threading
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING, Any
+
+from config.parser import load_json_or_jsonc
+from core.cache import ArtifactCache, fingerprint_tree
+from core.workspace import Workspace
+
+if TYPE_CHECKING:
+    from core.interpreter import ConfigInterpreter
+
+logger = logging.getLogger("mapack")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 47655
+
+
+class BuildServer:
+    """Keeps a config, its caches and its workdirs loaded between builds.
+
+    The config is parsed again only when the file changes, and workdirs live in
+    a `Workspace` for the lifetime of the server, so a rebuild only redoes the
+    artifacts whose spec or sources changed (and whatever depends on them).
+    """
+
+    def __init__(
+        self,
+        config_path: Path,
+        *,
+        cache: ArtifactCache | None = None,
+        jobs: int = 1,
+        materialize: str = "auto",
+        zip_jobs: int | None = None,
+        targets: list[str] | None = None,
+    ) -> None:
+        self.config_path = config_path
+        self.cache = cache
+        self.jobs = jobs
+        self.materialize = materialize
+        self.zip_jobs = zip_jobs
+        self.targets = targets
+        self.builds = 0
+        self.last_error: str | None = None
+        self._tmp = TemporaryDirectory(prefix="mapack-serve-")
+        self.workspace = Workspace(Path(self._tmp.name))
+        self._config: dict[str, Any] | None = None
+        self._config_stamp: tuple[int, int] | None = None
+        self._inputs: set[Path] = {config_path}
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._tmp.cleanup()
+
+    def _load_config(self) -> dict[str, Any]:
+        stat = self.config_path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if self._config is None or stamp != self._config_stamp:
+            cache_dir = self.cache.blobs("config").root if self.cache is not None else None
+            self._config = load_json_or_jsonc(self.config_path, cache_dir=cache_dir)
+            self._config_stamp = stamp
+        return self._config
+
+    def _interpreter(self) -> ConfigInterpreter:
+        # not imported with the module: `mapack trigger` only needs the client
+        from core.interpreter import ConfigInterpreter
+
+        return ConfigInterpreter(
+            config=self._load_config(),
+            config_path=self.config_path,
+            jobs=self.jobs,
+            cache=self.cache,
+            materialize=self.materialize,
+            zip_jobs=self.zip_jobs,
+            workspace=self.workspace,
+        )
+
+    def build(self, targets: list[str] | None = None) -> dict[str, list[str]]:
+        """Build `targets` (the server's targets if None); concurrent requests are serialized."""
+        targets = targets or self.targets
+        with self._lock:
+            start = time.perf_counter()
+            try:
+                interpreter = self._interpreter()
+                outputs = interpreter.run(targets)
+                self._inputs = interpreter.input_paths(targets)
+            except Exception as exc:
+                self.last_error = str(exc)
+                # keep watching the config so that fixing it triggers a build
+                self._inputs.add(self.config_path)
+                raise
+            self.builds += 1
+            self.last_error = None
+            logger.info("build %d finished in %.2fs", self.builds, time.perf_counter() - start)
+            return {target: [str(path) for path in paths] for target, paths in outputs.items()}
+
+    def snapshot(self) -> dict[Path, str]:
+        """Fingerprints of the inputs of the last build."""
+        with self._lock:
+            inputs = sorted(self._inputs)
+        return {path: fingerprint_tree(path) for path in inputs}
+
+    def watch(self, interval: float, stop: threading.Event) -> None:
+        """Poll the inputs of the last build every `interval` seconds and rebuild when they change."""
+        snapshot = self.snapshot()
+        while not stop.wait(interval):
+            current = self.snapshot()
+            changed = sorted(str(p) for p in current.keys() | snapshot.keys() if current.get(p) != snapshot.get(p))
+            if not changed:
+                continue
+            logger.info("changed: %s", ", ".join(changed))
+            try:
+                self.build()
+            except Exception:
+                logger.exception("build failed")
+            # taken after the build, so that its own writes do not trigger another one
+            snapshot = self.snapshot()
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "config": str(self.config_path),
+            "builds": self.builds,
+            "last_error": self.last_error,
+            "inputs": sorted(str(path) for path in self._inputs),
+        }
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """One JSON object per line in each direction: `{"command": "build" | "status" | "stop", ...}`."""
+
+    server: _Listener
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.dispatch(json.loads(line))
+            except Exception as exc:
+                response = {"ok": False, "error": str(exc)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class _Listener(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int], build_server: BuildServer, stop: threading.Event) -> None:
+        super().__init__(address, _RequestHandler)
+        self.build_server = build_server
+        self.stop = stop
+
+    def dispatch(self, request: dict[str, Any]) -> dict[str, Any]:
+        command = request.get("command")
+        if command == "build":
+            targets = request.get("targets") or None
+            return {"ok": True, "outputs": self.build_server.build(targets)}
+        if command == "status":
+            return {"ok": True, **self.build_server.status()}
+        if command == "stop":
+            self.stop.set()
+            return {"ok": True}
+        raise ValueError(f"Unknown command: {command!r}")
+
+
+def run_server(
+    build_server: BuildServer,
+    *,
+    host: str = DEFAULT_HOST,
+    port: int | None = DEFAULT_PORT,
+    watch_interval: float | None = None,
+) -> None:
+    """Build once, then answer build requests on `host:port` and/or rebuild on changes until stopped."""
+    stop = threading.Event()
+    listener = None
+    if port is not None:
+        listener = _Listener((host, port), build_server, stop)
+        threading.Thread(target=listener.serve_forever, name="mapack-listener", daemon=True).start()
+        logger.info("listening on %s:%d", host, listener.server_address[1])
+
+    try:
+        try:
+            build_server.build()
+        except Exception:
+            logger.exception("build failed")
+        if watch_interval is not None:
+            logger.info("watching %d inputs every %.1fs", len(build_server.status()["inputs"]), watch_interval)
+            build_server.watch(watch_interval, stop)
+        else:
+            stop.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if listener is not None:
+            listener.shutdown()
+            listener.server_close()
+        build_server.close()
+
+
+def send_request(request: dict[str, Any], *, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> dict[str, Any]:
+    """Send one request to a running server and return its response."""
+    with socket.create_connection((host, port)) as conn:
+        conn.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with conn.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError(f"No response from {host}:{port}")
+    return json.loads(line)
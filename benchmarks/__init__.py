@@ -0,0 +1 @@
+"""Benchmarks on synthetic maps: `python -m benchmarks run` / `python -m benchmarks compare`."""
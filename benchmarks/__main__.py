@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import json
+import logging
+import time
+from dataclasses import replace
+from pathlib import Path
+
+import click
+
+from .suite import compare, run_suite
+from .synthetic import SIZES, generate_config, generate_world
+
+DEFAULT_RESULTS_DIR = Path(".benchmarks")
+
+
+@click.group(context_settings={"help_option_names": ["-h", "--help"]})
+def main() -> None:
+    """Benchmark mapack on synthetic maps."""
+    # builds log every step at INFO level
+    logging.basicConfig(level=logging.WARNING, format="[%(levelname)s] %(message)s")
+
+
+def _size_options(fn):
+    for name in ("targets", "artifacts", "assets", "functions", "chunks", "regions"):
+        fn = click.option(f"--{name}", type=click.IntRange(min=0), default=None, help=f"Override the preset's {name}.")(fn)
+    return click.option("--size", type=click.Choice(list(SIZES)), default="small", show_default=True)(fn)
+
+
+def _world_size(size: str, overrides: dict[str, int | None]):
+    return replace(SIZES[size], **{k: v for k, v in overrides.items() if v is not None})
+
+
+@main.command("run")
+@_size_options
+@click.option("-r", "--repeat", type=click.IntRange(min=1), default=5, show_default=True, help="Timed runs per benchmark.")
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=1, show_default=True, help="Jobs of end-to-end builds.")
+@click.option("-k", "--select", "selected", multiple=True, help="Only run benchmarks starting with this prefix.")
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help=f"Results file. Defaults to {DEFAULT_RESULTS_DIR}/<size>-<timestamp>.json.",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Compare against these results and fail on regressions.",
+)
+@click.option("--threshold", type=float, default=0.10, show_default=True, help="Tolerated slowdown of medians.")
+def run_command(
+    size: str,
+    repeat: int,
+    jobs: int,
+    selected: tuple[str, ...],
+    output: Path | None,
+    baseline: Path | None,
+    threshold: float,
+    **overrides: int | None,
+) -> None:
+    """Generate a synthetic map and time builds, parsing, templating, copies and zips."""
+    results = run_suite(
+        _world_size(size, overrides),
+        repeat=repeat,
+        jobs=jobs,
+        selected=set(selected) or None,
+        progress=lambda name: click.echo(f"running {name} ...", err=True),
+    )
+
+    for name, timing in results["results"].items():
+        click.echo(f"{name:<20}  median {timing['median']:.4f}s  min {timing['min']:.4f}s  stdev {timing['stdev']:.4f}s")
+
+    output = output or DEFAULT_RESULTS_DIR / f"{size}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    click.echo(f"results written to {output}")
+
+    if baseline is not None:
+        _report(json.loads(baseline.read_text(encoding="utf-8")), results, threshold)
+
+
+@main.command("compare")
+@click.argument("baseline", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.argument("current", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option("--threshold", type=float, default=0.10, show_default=True, help="Tolerated slowdown of medians.")
+def compare_command(baseline: Path, current: Path, threshold: float) -> None:
+    """Compare two results files; exits with status 1 on regressions."""
+    _report(
+        json.loads(baseline.read_text(encoding="utf-8")),
+        json.loads(current.read_text(encoding="utf-8")),
+        threshold,
+    )
+
+
+@main.command("generate")
+@_size_options
+@click.argument("directory", type=click.Path(file_okay=False, path_type=Path))
+def generate_command(size: str, directory: Path, **overrides: int | None) -> None:
+    """Write a synthetic map and its config to DIRECTORY, e.g. to build or profile it by hand."""
+    world_size = _world_size(size, overrides)
+    generate_world(directory, world_size)
+    click.echo(f"config written to {generate_config(directory, world_size)}")
+
+
+def _report(baseline: dict, current: dict, threshold: float) -> None:
+    lines, regressed = compare(baseline, current, threshold=threshold)
+    click.echo("\n".join(lines))
+    if regressed:
+        raise click.ClickException(f"benchmarks regressed by more than {threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+from config.parser import load_json_or_jsonc
+from config.templating import resolve_templates
+from core.archive import EntryStore
+from core.cache import ArtifactCache
+from core.interpreter import ConfigInterpreter
+from core.overlay import Overlay
+
+from .synthetic import WorldSize, generate_config, generate_small_config, generate_world
+
+
+@dataclass(slots=True)
+class Timing:
+    runs: int
+    min: float
+    median: float
+    mean: float
+    stdev: float
+
+
+def measure(fn: Callable[[], Any], *, setup: Callable[[], Any] | None = None, repeat: int = 5, warmup: int = 1) -> Timing:
+    """Time `fn` `repeat` times after `warmup` untimed runs; `setup` runs untimed before each call."""
+    samples: list[float] = []
+    for i in range(warmup + repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            samples.append(elapsed)
+    return Timing(
+        runs=len(samples),
+        min=min(samples),
+        median=statistics.median(samples),
+        mean=statistics.fmean(samples),
+        stdev=statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    )
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_cli(*args: str) -> None:
+    """Run `mapack` in a fresh interpreter, as scripts invoking it do."""
+    root = Path(__file__).resolve().parent.parent
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(root), os.environ.get("PYTHONPATH")]))}
+    subprocess.run([sys.executable, "-m", "app.cli", *args], check=True, capture_output=True, env=env)
+
+
+def _reset_dir(path: Path) -> None:
+    shutil.rmtree(path, ignore_errors=True)
+    path.mkdir(parents=True)
+
+
+def run_suite(
+    size: WorldSize,
+    *,
+    repeat: int = 5,
+    jobs: int = 1,
+    selected: set[str] | None = None,
+    workdir: Path | None = None,
+    progress: Callable[[str], None] | None = None,
+) -> dict[str, Any]:
+    """Generate a synthetic project and time the end-to-end build and its hot paths."""
+    results: dict[str, dict[str, Any]] = {}
+
+    def bench(name: str, fn: Callable[[], Any], **kwargs: Any) -> None:
+        if selected is not None and not any(name.startswith(prefix) for prefix in selected):
+            return
+        if progress is not None:
+            progress(name)
+        results[name] = asdict(measure(fn, repeat=repeat, **kwargs))
+
+    with tempfile.TemporaryDirectory(prefix="mapack-bench-", dir=workdir) as tmp:
+        root = Path(tmp)
+        sources = generate_world(root, size)
+        config_path = generate_config(root, size)
+        config = load_json_or_jsonc(config_path)
+        out = root / "out"
+        cache_dir = root / "cache"
+
+        def cold_build() -> None:
+            ConfigInterpreter(config, config_path, jobs=jobs).run()
+
+        bench("e2e.cold", cold_build, setup=lambda: _reset_dir(out))
+
+        def cached_build() -> None:
+            ConfigInterpreter(config, config_path, jobs=jobs, cache=ArtifactCache(cache_dir)).run()
+
+        # the warmup run fills the cache; timed runs restore from it
+        bench("e2e.cached", cached_build)
+
+        bench("parse.jsonc", lambda: load_json_or_jsonc(config_path), warmup=2)
+
+        interpreter = ConfigInterpreter(config, config_path)
+        bench("targets.materialize", lambda: [interpreter._materialize_target(t) for t in interpreter._get_targets()])
+        target = next(iter(interpreter._get_targets()))
+        merged = interpreter._materialize_target(target)
+        state = interpreter._build_state_for_target(target, merged)
+        bench("templates.resolve", lambda: resolve_templates(merged["artifacts"], state.scope), warmup=2)
+
+        workdir_copy = root / "bench-copy"
+        for strategy in ("copy", "hardlink"):
+            bench(
+                f"copy.{strategy}",
+                lambda s=strategy: interpreter._copy_source_to_artifact_root(sources["map"], workdir_copy, s),
+                setup=lambda: _reset_dir(workdir_copy),
+            )
+        # virtual workdir: only the manifest is built
+        bench("copy.virtual", lambda: Overlay().add_tree(sources["map"]))
+
+        zip_path = root / "bench.zip"
+        bench(
+            "zip.full",
+            lambda: interpreter._zip_directory(sources["map"], zip_path, incremental=False),
+            setup=lambda: zip_path.unlink(missing_ok=True),
+        )
+        bench("zip.incremental", lambda: interpreter._zip_directory(sources["map"], zip_path, incremental=True))
+        overlay = Overlay()
+        overlay.add_tree(sources["map"])
+        bench(
+            "zip.overlay",
+            lambda: interpreter._zip_directory(overlay, zip_path, incremental=False),
+            setup=lambda: zip_path.unlink(missing_ok=True),
+        )
+        # another export of the same files in one build: the warmup fills the store
+        with EntryStore() as store:
+            interpreter.zip_entries = store
+            bench(
+                "zip.shared",
+                lambda: interpreter._zip_directory(sources["map"], zip_path, incremental=False),
+                setup=lambda: zip_path.unlink(missing_ok=True),
+            )
+            interpreter.zip_entries = None
+
+        # process startup: imports, CLI setup and loading the transforms a config uses
+        bench("startup.help", lambda: _run_cli("--help"))
+        small_config = generate_small_config(root)
+        bench("startup.build", lambda: _run_cli("build", str(small_config), "--no-cache"))
+
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "jobs": jobs,
+            "repeat": repeat,
+            "size": asdict(size),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any], *, threshold: float) -> tuple[list[str], bool]:
+    """Compare median timings; returns report lines and whether any benchmark regressed past `threshold`."""
+    lines = [f"{'benchmark':<20}  {'baseline s':>10}  {'current s':>10}  {'change':>8}"]
+    regressed = False
+    base_results = baseline.get("results", {})
+    for name, timing in current.get("results", {}).items():
+        base = base_results.get(name)
+        if base is None:
+            lines.append(f"{name:<20}  {'-':>10}  {timing['median']:>10.4f}  {'new':>8}")
+            continue
+        change = timing["median"] / base["median"] - 1 if base["median"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressed = True
+            flag = "  REGRESSION"
+        lines.append(f"{name:<20}  {base['median']:>10.4f}  {timing['median']:>10.4f}  {change:>+8.1%}{flag}")
+    if baseline.get("meta", {}).get("size") != current.get("meta", {}).get("size"):
+        lines.append("warning: results were produced with different world sizes")
+    return lines, regressed
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import gzip
+import json
+import random
+import struct
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+from transforms.anvil import SECTOR_SIZE
+
+
+@dataclass(slots=True)
+class WorldSize:
+    regions: int = 4
+    # chunks written per region file (at most 1024)
+    chunks: int = 256
+    functions: int = 200
+    assets: int = 300
+    artifacts: int = 4
+    targets: int = 2
+
+
+SIZES = {
+    "small": WorldSize(),
+    "medium": WorldSize(regions=16, chunks=512, functions=2000, assets=3000, artifacts=8, targets=4),
+    "large": WorldSize(regions=64, chunks=1024, functions=10000, assets=20000, artifacts=16, targets=8),
+}
+
+
+def _tag(kind: int, name: str, payload: bytes) -> bytes:
+    encoded = name.encode("utf-8")
+    return bytes((kind,)) + struct.pack(">H", len(encoded)) + encoded + payload
+
+
+def _string(value: str) -> bytes:
+    encoded = value.encode("utf-8")
+    return struct.pack(">H", len(encoded)) + encoded
+
+
+def _chunk_nbt(rng: random.Random, chunk_x: int, chunk_z: int) -> bytes:
+    sections = []
+    for y in range(-4, rng.randint(0, 8)):
+        # a few random block state longs followed by runs of identical ones, like real terrain
+        states = rng.randbytes(8 * rng.randint(16, 128)) + bytes(8 * 128)
+        sections.append(
+            _tag(1, "Y", struct.pack(">b", y))
+            + _tag(10, "block_states", _tag(12, "data", struct.pack(">i", len(states) // 8) + states) + b"\0")
+            + b"\0"
+        )
+    body = (
+        _tag(3, "DataVersion", struct.pack(">i", 4189))
+        + _tag(3, "xPos", struct.pack(">i", chunk_x))
+        + _tag(3, "zPos", struct.pack(">i", chunk_z))
+        + _tag(9, "sections", bytes((10,)) + struct.pack(">i", len(sections)) + b"".join(sections))
+        + _tag(8, "Status", _string(rng.choice(["minecraft:full"] * 4 + ["minecraft:features"])))
+        + _tag(4, "InhabitedTime", struct.pack(">q", rng.choice([0, 0, 20, 1200, 72000])))
+    )
+    return b"\x0a\x00\x00" + body + b"\0"
+
+
+def write_region(path: Path, region_x: int, region_z: int, chunks: int, rng: random.Random) -> None:
+    header = bytearray(2 * SECTOR_SIZE)
+    body = bytearray()
+    sector = 2
+    for index in sorted(rng.sample(range(1024), min(chunks, 1024))):
+        payload = zlib.compress(_chunk_nbt(rng, region_x * 32 + index % 32, region_z * 32 + index // 32), 6)
+        record = struct.pack(">IB", len(payload) + 1, 2) + payload
+        sectors = -(-len(record) // SECTOR_SIZE)
+        struct.pack_into(">I", header, index * 4, (sector << 8) | sectors)
+        struct.pack_into(">I", header, SECTOR_SIZE + index * 4, 1_700_000_000)
+        body += record + bytes(sectors * SECTOR_SIZE - len(record))
+        sector += sectors
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(bytes(header + body))
+
+
+def _png(rng: random.Random, width: int = 16, height: int = 16) -> bytes:
+    def chunk(kind: bytes, body: bytes) -> bytes:
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+    palette = [rng.randbytes(4) for _ in range(rng.randint(2, 8))]
+    raw = b"".join(b"\0" + b"".join(rng.choice(palette) for _ in range(width)) for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        + chunk(b"tEXt", b"Software\0synthetic")
+        + chunk(b"IDAT", zlib.compress(raw, 1))
+        + chunk(b"IEND", b"")
+    )
+
+
+def generate_world(root: Path, size: WorldSize, *, seed: int = 0) -> dict[str, Path]:
+    """Write a synthetic map, resource pack and icon under `root` and return their paths."""
+    rng = random.Random(seed)
+    world = root / "map"
+    level = _tag(10, "Data", _tag(8, "LevelName", _string("bench")) + _tag(3, "version", struct.pack(">i", 19133)))
+    world.mkdir(parents=True, exist_ok=True)
+    (world / "level.dat").write_bytes(gzip.compress(b"\x0a\x00\x00" + level + b"\0\0", mtime=0))
+
+    side = max(1, int(size.regions**0.5))
+    for i in range(size.regions):
+        region_x, region_z = i % side - side // 2, i // side - side // 2
+        write_region(world / "region" / f"r.{region_x}.{region_z}.mca", region_x, region_z, size.chunks, rng)
+    for i in range(max(1, size.regions // 4)):
+        write_region(world / "DIM-1" / "region" / f"r.{i}.0.mca", i, 0, size.chunks // 4, rng)
+
+    functions = world / "datapacks" / "bench" / "data" / "bench" / "function"
+    for i in range(size.functions):
+        path = functions / f"group{i % 32}" / f"f{i}.mcfunction"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lines = [
+            f"execute as @a[tag=bench{rng.randint(0, 99)}] at @s run setblock ~ ~{j} ~ minecraft:stone"
+            for j in range(rng.randint(5, 40))
+        ]
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    (world / "datapacks" / "bench" / "pack.mcmeta").write_text(
+        json.dumps({"pack": {"pack_format": 61, "description": "bench"}}, indent=4), encoding="utf-8"
+    )
+
+    pack = root / "rp"
+    for i in range(size.assets):
+        if i % 3 == 0:
+            path = pack / "assets" / "bench" / "textures" / "block" / f"t{i}.png"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(_png(rng))
+        else:
+            model = {
+                "parent": "minecraft:block/cube_all",
+                # a few textures only, so that some models are duplicates
+                "textures": {"all": f"bench:block/t{rng.randrange(0, max(3, size.assets // 50)) * 3}"},
+            }
+            path = pack / "assets" / "bench" / "models" / "block" / f"m{i}.json"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(model, indent=4), encoding="utf-8")
+    (pack / "pack.mcmeta").write_text(
+        json.dumps({"pack": {"pack_format": 46, "description": "bench"}}, indent=4), encoding="utf-8"
+    )
+
+    icon = root / "icon.png"
+    icon.write_bytes(_png(rng, 64, 64))
+    return {"map": world, "rp": pack, "icon": icon}
+
+
+def generate_config(root: Path, size: WorldSize) -> Path:
+    """Write a JSONC config with `size.artifacts` variants of the map and `size.targets` targets."""
+    artifacts: dict[str, object] = {
+        "world": {
+            "src": "{sources.map}",
+            "transforms": [
+                {"type": "copy", "id": "copy_icon", "src": "{sources.icon}", "dest": "icon.png"},
+                {
+                    "type": "mc:feature",
+                    "id": "delete_dims",
+                    "feature": "delete_dimensions",
+                    "args": {"keep": ["minecraft:overworld"]},
+                },
+            ],
+        },
+        "rp": {
+            "src": "{sources.rp}",
+            "transforms": [{"type": "pack:optimize", "id": "optimize_rp", "dedupe_models": True}],
+            "export": {"enabled": True, "dest": "{target.directory}/[RP] {artifact.basename}", "zipped": True},
+        },
+    }
+    for i in range(size.artifacts):
+        artifacts[f"variant_{i}"] = {
+            "depends_on": ["world", "rp"],
+            "src": {"artifact": "world"},
+            "transforms": [
+                {
+                    "type": "copy",
+                    "id": f"copy_rp_{i}",
+                    "src": {"artifact": "rp", "output": True},
+                    "dest": "resources.zip",
+                },
+                {"type": "log", "id": f"log_{i}", "message": "variant {map.name} " + str(i)},
+            ],
+            "export": {
+                "enabled": True,
+                "dest": "{target.directory}/[Variant " + str(i) + "] {artifact.basename}",
+                "zipped": i % 4 != 3,
+            },
+        }
+
+    targets: dict[str, object] = {}
+    for i in range(size.targets):
+        targets[f"target_{i}"] = {
+            "use_global": {"use_all": True},
+            "variables": {"target": {"name": f"target_{i}", "directory": f"./out/target_{i}"}},
+        }
+
+    config = {
+        "globals": {
+            "variables": {
+                "map": {"name": "Bench", "version": "1.0.0", "mc_version": "1.21.4"},
+                "target": {"name": "global", "directory": "./out"},
+                "sources": {"map": "./map", "rp": "./rp", "icon": "./icon.png"},
+            },
+            "precomputed_vars": {
+                "map.semver": "{map.version}+{target.name}-{map.mc_version}",
+                "artifact.basename": "{map.name} {map.semver}.zip",
+            },
+            "artifacts": artifacts,
+        },
+        "targets": targets,
+    }
+    text = json.dumps(config, indent="\t")
+    # exercise the JSONC parser: comments between entries
+    text = text.replace('\t"targets": {', '\t// generated targets\n\t/* one per simulated release channel */\n\t"targets": {')
+    path = root / "bench.jsonc"
+    path.write_text(text + "\n", encoding="utf-8")
+    return path
+
+
+def generate_small_config(root: Path) -> Path:
+    """Write a config with a single artifact (the icon, zipped), to time a build that is mostly startup."""
+    config = {
+        "globals": {
+            "variables": {"target": {"name": "global", "directory": "./out-small"}},
+            "artifacts": {
+                "icon": {
+                    "src": "./icon.png",
+                    "transforms": [{"type": "log", "message": "small build"}],
+                    "export": {"enabled": True, "dest": "{target.directory}/icon.zip", "zipped": True},
+                }
+            },
+        },
+        "targets": {"small": {"use_global": {"use_all": True}}},
+    }
+    path = root / "small.json"
+    path.write_text(json.dumps(config, indent="\t") + "\n", encoding="utf-8")
+    return path
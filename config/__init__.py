@@ -1,12 +1,27 @@
-from .expressions import ExpressionContext, evaluate_expression
-from .parser import load_json_or_jsonc
-from .templating import get_dotted, render_template, resolve_templates, set_dotted
+from .expressions import ExpressionContext, evaluate_expression, expression_paths
+from .parser import ConfigSyntaxError, load_json_or_jsonc
+from .templating import (
+    TemplateResolver,
+    VariableCycleError,
+    compile_template,
+    get_dotted,
+    lazy_scope,
+    render_template,
+    resolve_templates,
+    set_dotted,
+)
 
 __all__ = [
+    "ConfigSyntaxError",
     "ExpressionContext",
+    "TemplateResolver",
+    "VariableCycleError",
+    "compile_template",
     "evaluate_expression",
+    "expression_paths",
     "load_json_or_jsonc",
     "get_dotted",
+    "lazy_scope",
     "render_template",
     "resolve_templates",
     "set_dotted",
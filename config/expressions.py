@@ -2,13 +2,21 @@ from __future__ import annotations
 
 import ast
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Callable
+from typing import TYPE_CHECKING, Any, Callable
+
+if TYPE_CHECKING:
+    from core.fsindex import FileIndex
 
 
 @dataclass(slots=True)
 class ExpressionContext:
     cwd: Path
+    # shared listings of the current build; a private index is used when None
+    index: FileIndex | None = None
+    # run before the first filesystem query, e.g. to write a virtual workdir to disk
+    prepare: Callable[[], None] | None = None
 
 
 _ALLOWED_BOOL_NAMES = {
@@ -50,23 +58,65 @@ class SafeExpressionEvaluator(ast.NodeVisitor):
         raise ValueError(f"Unsupported expression node: {type(node).__name__}")
 
 
+@lru_cache(maxsize=4096)
+def _parse(text: str) -> ast.Expression | SyntaxError:
+    # most strings that reach the evaluator are plain values, so failures are cached too
+    try:
+        return ast.parse(text, mode="eval")
+    except SyntaxError as exc:
+        return exc
+
+
+# functions of `evaluate_expression` reading the filesystem; their first argument (`path`) is the path read
+_PATH_FUNCTIONS = {"count_files", "total_size", "exists", "glob_count"}
+
+
+def expression_paths(text: str) -> list[str] | None:
+    """Paths an expression reads (as written), [] for a plain value; None if a path is not a constant."""
+    tree = _parse(text)
+    if isinstance(tree, SyntaxError):
+        return []
+    paths: list[str] = []
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _PATH_FUNCTIONS):
+            continue
+        arg = node.args[0] if node.args else next((kw.value for kw in node.keywords if kw.arg == "path"), None)
+        if not (isinstance(arg, ast.Constant) and isinstance(arg.value, str)):
+            return None
+        paths.append(arg.value)
+    return paths
+
+
 def evaluate_expression(text: str, *, context: ExpressionContext) -> Any:
+    tree = _parse(text)
+    if isinstance(tree, SyntaxError):
+        raise SyntaxError(*tree.args)
+
+    index = context.index
+    if index is None:
+        # imported here: core depends on this module
+        from core.fsindex import FileIndex
+
+        index = FileIndex()
+
+    def resolve(path: str) -> Path:
+        if context.prepare is not None:
+            context.prepare()
+        return (context.cwd / path).resolve()
+
     def count_files(path: str, recursive: bool = True, include_dirs: bool = False) -> int:
-        root = (context.cwd / path).resolve()
-        if not root.exists():
-            return 0
-
-        total = 0
-        if recursive:
-            for child in root.rglob("*"):
-                if child.is_file() or (include_dirs and child.is_dir()):
-                    total += 1
-        else:
-            for child in root.iterdir():
-                if child.is_file() or (include_dirs and child.is_dir()):
-                    total += 1
-        return total
-
-    tree = ast.parse(text, mode="eval")
-    evaluator = SafeExpressionEvaluator(functions={"count_files": count_files})
+        return index.count_files(resolve(path), recursive=recursive, include_dirs=include_dirs)
+
+    def total_size(path: str, recursive: bool = True) -> int:
+        return index.total_size(resolve(path), recursive=recursive)
+
+    def exists(path: str) -> bool:
+        return index.exists(resolve(path))
+
+    def glob_count(path: str, pattern: str, include_dirs: bool = False) -> int:
+        return index.glob_count(resolve(path), pattern, include_dirs=include_dirs)
+
+    evaluator = SafeExpressionEvaluator(
+        functions={"count_files": count_files, "total_size": total_size, "exists": exists, "glob_count": glob_count}
+    )
     return evaluator.visit(tree)
@@ -1,120 +1,105 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import marshal
+import os
+import re
+import sys
+import uuid
 from pathlib import Path
 
+# One match per run of plain text/strings or per comment/trailing comma, so cleaning
+# costs a handful of regex matches instead of a Python step per character. In the
+# trailing-comma lookahead, line comments must run to the end of the line: a `]` or
+# `}` inside one does not make the comma before it trailing.
+_JSONC_TOKEN = re.compile(
+    r"""
+    (?P<keep>(?:
+        [^"'/,]+
+      | "(?:[^"\\]|\\.)*"
+      | '(?:[^'\\]|\\.)*'
+      | /(?![/*])
+      | ,(?!(?:\s|//[^\n]*(?:\n|\Z)|/\*(?:[^*]|\*(?!/))*\*/)*[\]}])
+    )+)
+  | (?P<comment>//[^\n]*|/\*(?:[^*]|\*(?!/))*(?:\*/|\Z))
+  | (?P<comma>,)
+  | (?P<unterminated>["'].*)
+    """,
+    re.S | re.X,
+)
+_NOT_NEWLINE = re.compile(r"[^\n]")
+
+# bump when parsing changes so that cached results are not reused
+_CACHE_VERSION = 2
+
+
+class ConfigSyntaxError(ValueError):
+    def __init__(self, path: Path, line: int, column: int, message: str) -> None:
+        super().__init__(f"{path}:{line}:{column}: {message}")
+        self.path = path
+        self.line = line
+        self.column = column
+
+
+def _blank(match: re.Match[str]) -> str:
+    kind = match.lastgroup
+    if kind == "keep" or kind == "unterminated":
+        return match.group()
+    # same length and line breaks, so that error positions point into the original text
+    return _NOT_NEWLINE.sub(" ", match.group())
+
 
 def _strip_jsonc(text: str) -> str:
-    """Remove // and /* */ comments while preserving string literals."""
-    out: list[str] = []
-    i = 0
-    in_string = False
-    string_quote = ""
-    escaped = False
-    in_line_comment = False
-    in_block_comment = False
-
-    while i < len(text):
-        ch = text[i]
-        nxt = text[i + 1] if i + 1 < len(text) else ""
-
-        if in_line_comment:
-            if ch == "\n":
-                in_line_comment = False
-                out.append(ch)
-            i += 1
-            continue
-
-        if in_block_comment:
-            if ch == "*" and nxt == "/":
-                in_block_comment = False
-                i += 2
-            else:
-                i += 1
-            continue
-
-        if in_string:
-            out.append(ch)
-            if escaped:
-                escaped = False
-            elif ch == "\\":
-                escaped = True
-            elif ch == string_quote:
-                in_string = False
-            i += 1
-            continue
-
-        if ch in ('"', "'"):
-            in_string = True
-            string_quote = ch
-            out.append(ch)
-            i += 1
-            continue
-
-        if ch == "/" and nxt == "/":
-            in_line_comment = True
-            i += 2
-            continue
-
-        if ch == "/" and nxt == "*":
-            in_block_comment = True
-            i += 2
-            continue
-
-        out.append(ch)
-        i += 1
-
-    return "".join(out)
-
-
-def _strip_trailing_commas(text: str) -> str:
-    """Remove trailing commas before ] or } while preserving strings."""
-    out: list[str] = []
-    i = 0
-    in_string = False
-    string_quote = ""
-    escaped = False
-
-    while i < len(text):
-        ch = text[i]
-
-        if in_string:
-            out.append(ch)
-            if escaped:
-                escaped = False
-            elif ch == "\\":
-                escaped = True
-            elif ch == string_quote:
-                in_string = False
-            i += 1
-            continue
-
-        if ch in ('"', "'"):
-            in_string = True
-            string_quote = ch
-            out.append(ch)
-            i += 1
-            continue
-
-        if ch == ",":
-            j = i + 1
-            while j < len(text) and text[j] in " \t\r\n":
-                j += 1
-            if j < len(text) and text[j] in "]}":
-                i += 1
-                continue
-
-        out.append(ch)
-        i += 1
-
-    return "".join(out)
-
-
-def load_json_or_jsonc(config_path: Path) -> dict:
-    raw = config_path.read_text(encoding="utf-8")
-    cleaned = _strip_jsonc(raw)
-    cleaned = _strip_trailing_commas(cleaned)
-    data = json.loads(cleaned)
+    """Blank out // and /* */ comments and trailing commas before ] or }, preserving string literals."""
+    return _JSONC_TOKEN.sub(_blank, text)
+
+
+def _parse(text: str, config_path: Path) -> dict:
+    try:
+        # plain JSON needs no cleaning
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(_strip_jsonc(text))
+        except json.JSONDecodeError as exc:
+            raise ConfigSyntaxError(config_path, exc.lineno, exc.colno, exc.msg) from None
     if not isinstance(data, dict):
         raise ValueError("Top-level config must be an object")
     return data
+
+
+def _cache_file(cache_dir: Path, raw: bytes) -> Path:
+    digest = hashlib.sha256(raw)
+    digest.update(f"{_CACHE_VERSION}:{sys.version_info[:2]}:{marshal.version}".encode())
+    return cache_dir / f"{digest.hexdigest()}.marshal"
+
+
+def load_json_or_jsonc(config_path: Path, *, cache_dir: Path | None = None, update_cache: bool = True) -> dict:
+    """Load a JSON/JSONC config file.
+
+    With `cache_dir`, the parsed config is stored there keyed by the file's
+    content hash, and later loads of identical content skip parsing. With
+    `update_cache=False` the cache is only read, never written.
+    """
+    raw = config_path.read_bytes()
+    cached = _cache_file(cache_dir, raw) if cache_dir is not None else None
+    if cached is not None:
+        try:
+            data = marshal.loads(cached.read_bytes())
+            if isinstance(data, dict):
+                return data
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+    data = _parse(raw.decode("utf-8"), config_path)
+
+    if cached is not None and update_cache:
+        tmp = cached.with_name(f".{cached.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_bytes(marshal.dumps(data))
+            os.replace(tmp, cached)
+        except (OSError, ValueError):
+            tmp.unlink(missing_ok=True)
+    return data
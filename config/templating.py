@@ -2,17 +2,84 @@ from __future__ import annotations
 
 import copy
 import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Any
 
 _TOKEN = re.compile(r"\{([a-zA-Z0-9_.-]+)\}")
+_SCALARS = (str, int, float, bool, type(None))
+_MISSING = object()
+
+
+class VariableCycleError(ValueError):
+    def __init__(self, cycle: list[str]) -> None:
+        self.cycle = cycle
+        super().__init__(f"precomputed_vars cycle detected: {' -> '.join(cycle)}")
+
+
+class _LazyVars:
+    """Shared state of the deferred variables of one scope: evaluation lock and stack."""
+
+    def __init__(self, scope: dict[str, Any]) -> None:
+        self.scope = scope
+        self.lock = threading.RLock()
+        self.stack: list[_Deferred] = []
+
+
+class _Deferred:
+    """A precomputed var, rendered against its scope on first access."""
+
+    __slots__ = ("dotted", "template", "shadowed", "owner", "value")
+
+    def __init__(self, dotted: str, template: str, shadowed: Any, owner: _LazyVars) -> None:
+        self.dotted = dotted
+        self.template = template
+        # the variable this one replaces, seen by the var's own template (`"v": "{v}-beta"`)
+        self.shadowed = shadowed
+        self.owner = owner
+        self.value: Any = _MISSING
+
+    def __repr__(self) -> str:
+        # shows up when a template renders a whole object holding precomputed vars
+        return repr(self.get())
+
+    def get(self) -> Any:
+        if self.value is not _MISSING:
+            return self.value
+        owner = self.owner
+        with owner.lock:
+            if self.value is not _MISSING:
+                return self.value
+            if self in owner.stack:
+                if owner.stack[-1] is self and self.shadowed is not _MISSING:
+                    return _force(self.shadowed)
+                start = owner.stack.index(self)
+                raise VariableCycleError([d.dotted for d in owner.stack[start:]] + [self.dotted])
+            owner.stack.append(self)
+            try:
+                self.value = render_template(self.template, owner.scope)
+            finally:
+                owner.stack.pop()
+        return self.value
+
+
+def _force(value: Any) -> Any:
+    return value.get() if isinstance(value, _Deferred) else value
 
 
 def get_dotted(mapping: dict[str, Any], dotted: str) -> Any:
+    return _lookup(mapping, tuple(dotted.split(".")), dotted)
+
+
+def _lookup(mapping: dict[str, Any], path: tuple[str, ...], dotted: str) -> Any:
     current: Any = mapping
-    for part in dotted.split("."):
+    for part in path:
         if not isinstance(current, dict) or part not in current:
             raise KeyError(dotted)
         current = current[part]
+        if isinstance(current, _Deferred):
+            current = current.get()
     return current
 
 
@@ -28,13 +95,69 @@ def set_dotted(mapping: dict[str, Any], dotted: str, value: Any) -> None:
     current[parts[-1]] = value
 
 
-def render_template(value: str, scope: dict[str, Any]) -> str:
-    def replace(match: re.Match[str]) -> str:
-        key = match.group(1)
-        resolved = get_dotted(scope, key)
-        return str(resolved)
+def lazy_scope(variables: dict[str, Any], precomputed: dict[str, Any]) -> dict[str, Any]:
+    """Overlay `precomputed` dotted vars on `variables` without copying or evaluating them.
+
+    Only the dicts on the path of a precomputed var are copied; everything else is
+    shared with `variables`. String values are templates rendered on first lookup,
+    so they may reference each other in any order; cycles raise VariableCycleError.
+    """
+    scope = dict(variables)
+    copied = {id(scope)}
+    owner = _LazyVars(scope)
+    for dotted, raw_value in precomputed.items():
+        parent, key = _overlay_parent(scope, dotted, copied)
+        if isinstance(raw_value, str):
+            raw_value = _Deferred(dotted, raw_value, parent.get(key, _MISSING), owner)
+        parent[key] = raw_value
+    return scope
+
+
+def _overlay_parent(scope: dict[str, Any], dotted: str, copied: set[int]) -> tuple[dict[str, Any], str]:
+    """Parent dict of `dotted` in `scope`, copying shared dicts on the way (ids in `copied` are owned)."""
+    parts = dotted.split(".")
+    current = scope
+    for part in parts[:-1]:
+        child = current.get(part)
+        if not isinstance(child, dict) or id(child) not in copied:
+            child = dict(child) if isinstance(child, dict) else {}
+            copied.add(id(child))
+            current[part] = child
+        current = child
+    return current, parts[-1]
+
+
+@dataclass(frozen=True, slots=True)
+class Template:
+    """A template string split into literal segments and `{dotted.key}` placeholders."""
+
+    literals: tuple[str, ...]
+    # (dotted key, pre-split path) between consecutive literals
+    fields: tuple[tuple[str, tuple[str, ...]], ...]
+    keys: frozenset[str]
 
-    return _TOKEN.sub(replace, value)
+    def render(self, scope: dict[str, Any]) -> str:
+        if not self.fields:
+            return self.literals[0]
+        out = [self.literals[0]]
+        for (dotted, path), literal in zip(self.fields, self.literals[1:]):
+            out.append(str(_lookup(scope, path, dotted)))
+            out.append(literal)
+        return "".join(out)
+
+
+@lru_cache(maxsize=8192)
+def compile_template(value: str) -> Template:
+    pieces = _TOKEN.split(value)
+    return Template(
+        literals=tuple(pieces[0::2]),
+        fields=tuple((dotted, tuple(dotted.split("."))) for dotted in pieces[1::2]),
+        keys=frozenset(pieces[1::2]),
+    )
+
+
+def render_template(value: str, scope: dict[str, Any]) -> str:
+    return compile_template(value).render(scope)
 
 
 def resolve_templates(obj: Any, scope: dict[str, Any]) -> Any:
@@ -44,4 +167,70 @@ def resolve_templates(obj: Any, scope: dict[str, Any]) -> Any:
         return [resolve_templates(item, scope) for item in obj]
     if isinstance(obj, dict):
         return {k: resolve_templates(v, scope) for k, v in obj.items()}
-    return copy.deepcopy(obj)
+    return obj if isinstance(obj, _SCALARS) else copy.deepcopy(obj)
+
+
+class TemplateResolver:
+    """Resolves templates against one scope, memoizing results per spec object.
+
+    Specs are remembered by identity, so resolving an artifact spec also serves
+    later lookups of its transforms and exports. Results are shared between
+    callers and must not be modified. Each memoized spec records the scope keys
+    it depends on (`dependencies`); `set` changes the scope and drops the memo.
+    """
+
+    def __init__(self, scope: dict[str, Any]) -> None:
+        self.scope = scope
+        self.version = 0
+        self._strings: dict[str, str] = {}
+        # id(spec) -> (spec, resolved, keys); holding the spec keeps its id from being reused
+        self._specs: dict[int, tuple[Any, Any, frozenset[str]]] = {}
+        self._set_lock = threading.Lock()
+
+    def set(self, dotted: str, value: Any) -> None:
+        # the scope shares its dicts with the config (see `lazy_scope`); concurrent
+        # sets of sibling keys would otherwise each replace the same parent copy
+        with self._set_lock:
+            parent, key = _overlay_parent(self.scope, dotted, {id(self.scope)})
+            parent[key] = value
+            self.version += 1
+            self._strings = {}
+            self._specs = {}
+
+    def resolve(self, obj: Any) -> Any:
+        return self._resolve(obj)[0]
+
+    def dependencies(self, obj: Any) -> frozenset[str]:
+        """Scope keys referenced anywhere in `obj`."""
+        return self._resolve(obj)[1]
+
+    def _resolve(self, obj: Any) -> tuple[Any, frozenset[str]]:
+        if isinstance(obj, str):
+            template = compile_template(obj)
+            rendered = self._strings.get(obj)
+            if rendered is None:
+                rendered = self._strings[obj] = template.render(self.scope)
+            return rendered, template.keys
+        if not isinstance(obj, (list, dict)):
+            return (obj if isinstance(obj, _SCALARS) else copy.deepcopy(obj)), frozenset()
+
+        memo = self._specs.get(id(obj))
+        if memo is not None and memo[0] is obj:
+            return memo[1], memo[2]
+
+        keys: set[str] = set()
+        resolved: Any
+        if isinstance(obj, list):
+            resolved = []
+            for item in obj:
+                value, item_keys = self._resolve(item)
+                resolved.append(value)
+                keys |= item_keys
+        else:
+            resolved = {}
+            for k, item in obj.items():
+                resolved[k], item_keys = self._resolve(item)
+                keys |= item_keys
+        frozen = frozenset(keys)
+        self._specs[id(obj)] = (obj, resolved, frozen)
+        return resolved, frozen
@@ -1,4 +1,25 @@
-from .interpreter import ConfigInterpreter
-from .runtime import ArtifactResult, InterpreterState
+from __future__ import annotations
 
-__all__ = ["ConfigInterpreter", "ArtifactResult", "InterpreterState"]
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .interpreter import ConfigInterpreter
+    from .runtime import ArtifactResult, InterpreterState
+    from .scheduler import DependencyCycleError
+
+__all__ = ["ConfigInterpreter", "ArtifactResult", "InterpreterState", "DependencyCycleError"]
+
+# imported on first access, so that e.g. `core.cache` does not pull in the interpreter and its dependencies
+_EXPORTS = {
+    "ConfigInterpreter": ".interpreter",
+    "ArtifactResult": ".runtime",
+    "InterpreterState": ".runtime",
+    "DependencyCycleError": ".scheduler",
+}
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
@@ -0,0 +1,670 @@
+from __future__ import annotations
+
+import hashlib
+import itertools
+import os
+import shutil
+import struct
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from tempfile import SpooledTemporaryFile, TemporaryDirectory
+from typing import Any, BinaryIO, Iterator, Union
+
+from .globs import PathFilter, glob_match
+from .overlay import Overlay
+from .scheduler import OnceMap
+
+STORED = 0
+DEFLATED = 8
+
+_METHODS = {"store": STORED, "stored": STORED, "deflate": DEFLATED, "deflated": DEFLATED}
+_DEFAULT_LEVEL = 6
+
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP_COUNT_LIMIT = 0xFFFF
+_CHUNK_SIZE = 1024 * 1024
+# compressed entries up to this size stay in memory until written
+_SPOOL_MAX = 8 * 1024 * 1024
+# compressed entries an `EntryStore` keeps in memory (in total), larger ones go to disk
+_SHARED_MEMORY = 64 * 1024 * 1024
+
+
+@dataclass(frozen=True, slots=True)
+class RawRange:
+    """`length` bytes at `offset` of `path`, copied verbatim into the archive."""
+
+    path: Path
+    offset: int
+    length: int
+
+
+EntryData = Union[bytes, BinaryIO, Path, RawRange]
+
+# earliest timestamp a zip entry can carry: 1980-01-01T00:00:00Z
+_DOS_EPOCH = 315532800
+
+
+@dataclass(frozen=True, slots=True)
+class CompressionRule:
+    pattern: str
+    method: int = DEFLATED
+    level: int = _DEFAULT_LEVEL
+
+
+DEFAULT_COMPRESSION = (CompressionRule("**"),)
+
+
+def _parse_setting(pattern: str, setting: Any) -> CompressionRule:
+    level = _DEFAULT_LEVEL
+    if isinstance(setting, dict):
+        method_name = str(setting.get("method", "deflate"))
+        level = int(setting.get("level", _DEFAULT_LEVEL))
+    else:
+        method_name, _, level_raw = str(setting).partition(":")
+        if level_raw:
+            level = int(level_raw)
+
+    method = _METHODS.get(method_name.strip().lower())
+    if method is None:
+        raise ValueError(f"Unsupported compression method for '{pattern}': {method_name}")
+    if not 0 <= level <= 9:
+        raise ValueError(f"Compression level for '{pattern}' must be between 0 and 9")
+    return CompressionRule(pattern=pattern, method=method, level=level)
+
+
+def parse_compression(spec: Any) -> tuple[CompressionRule, ...]:
+    """Parse `export.compression` into rules, first matching glob wins.
+
+    Accepts `{"*.mca": "store", "*.json": "deflate:9"}` or a list of
+    `{"glob": ..., "method": ..., "level": ...}` objects. Files matching no rule
+    are deflated at the default level.
+    """
+    if spec is None:
+        return DEFAULT_COMPRESSION
+    rules: list[CompressionRule] = []
+    if isinstance(spec, dict):
+        for pattern, setting in spec.items():
+            rules.append(_parse_setting(str(pattern), setting))
+    elif isinstance(spec, list):
+        for item in spec:
+            if not isinstance(item, dict) or not isinstance(item.get("glob"), str):
+                raise ValueError("export.compression list entries must be objects with a string 'glob'")
+            rules.append(_parse_setting(item["glob"], item))
+    else:
+        raise ValueError("export.compression must be an object or a list")
+    return (*rules, *DEFAULT_COMPRESSION)
+
+
+def rule_for(rel_path: str, rules: tuple[CompressionRule, ...]) -> CompressionRule:
+    for rule in rules:
+        if glob_match(rel_path, rule.pattern):
+            return rule
+    return DEFAULT_COMPRESSION[0]
+
+
+@dataclass(slots=True)
+class ZipEntry:
+    name: str
+    method: int = STORED
+    crc: int = 0
+    compress_size: int = 0
+    file_size: int = 0
+    date_time: tuple[int, int, int, int, int, int] = (1980, 1, 1, 0, 0, 0)
+    external_attr: int = 0
+    header_offset: int = 0
+
+
+def _dos_datetime(date_time: tuple[int, ...]) -> tuple[int, int]:
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+class ZipWriter:
+    """Minimal ZIP/ZIP64 writer taking already-compressed entry data.
+
+    Unlike `zipfile.ZipFile` it never compresses anything itself, which lets
+    callers compress entries on other threads (or reuse compressed bytes) and
+    only serialize them here, in order.
+    """
+
+    def __init__(self, fh: BinaryIO) -> None:
+        self._fh = fh
+        self._offset = 0
+        self._entries: list[ZipEntry] = []
+
+    def _write(self, data: bytes) -> None:
+        self._fh.write(data)
+        self._offset += len(data)
+
+    def add(self, entry: ZipEntry, data: EntryData = b"") -> None:
+        entry.header_offset = self._offset
+        name = entry.name.encode("utf-8")
+        flags = 0 if entry.name.isascii() else 0x800
+
+        compress_size, file_size = entry.compress_size, entry.file_size
+        extra = b""
+        version = 20
+        if file_size >= _ZIP64_LIMIT or compress_size >= _ZIP64_LIMIT:
+            extra = struct.pack("<HHQQ", 0x0001, 16, file_size, compress_size)
+            compress_size = file_size = _ZIP64_LIMIT
+            version = 45
+
+        dostime, dosdate = _dos_datetime(entry.date_time)
+        self._write(
+            struct.pack(
+                "<IHHHHHIIIHH",
+                0x04034B50,
+                version,
+                flags,
+                entry.method,
+                dostime,
+                dosdate,
+                entry.crc,
+                compress_size,
+                file_size,
+                len(name),
+                len(extra),
+            )
+        )
+        self._write(name + extra)
+
+        if isinstance(data, bytes):
+            self._write(data)
+        elif isinstance(data, Path):
+            with open(data, "rb") as fh:
+                self._copy_stream(fh)
+        elif isinstance(data, RawRange):
+            with open(data.path, "rb") as fh:
+                fh.seek(data.offset)
+                self._copy_stream(fh, data.length)
+        else:
+            data.seek(0)
+            self._copy_stream(data)
+        self._entries.append(entry)
+
+    def _copy_stream(self, fh: BinaryIO, length: int | None = None) -> None:
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = fh.read(_CHUNK_SIZE if remaining is None else min(_CHUNK_SIZE, remaining))
+            if not chunk:
+                if remaining:
+                    raise ValueError("Unexpected end of data while copying a zip entry")
+                break
+            self._write(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+
+    def close(self, comment: bytes = b"") -> None:
+        cd_start = self._offset
+        for entry in self._entries:
+            name = entry.name.encode("utf-8")
+            flags = 0 if entry.name.isascii() else 0x800
+
+            zip64_fields: list[int] = []
+            file_size, compress_size, offset = entry.file_size, entry.compress_size, entry.header_offset
+            if file_size >= _ZIP64_LIMIT:
+                zip64_fields.append(file_size)
+                file_size = _ZIP64_LIMIT
+            if compress_size >= _ZIP64_LIMIT:
+                zip64_fields.append(compress_size)
+                compress_size = _ZIP64_LIMIT
+            if offset >= _ZIP64_LIMIT:
+                zip64_fields.append(offset)
+                offset = _ZIP64_LIMIT
+            extra = b""
+            version = 20
+            if zip64_fields:
+                extra = struct.pack(f"<HH{len(zip64_fields)}Q", 0x0001, 8 * len(zip64_fields), *zip64_fields)
+                version = 45
+
+            dostime, dosdate = _dos_datetime(entry.date_time)
+            self._write(
+                struct.pack(
+                    "<IHHHHHHIIIHHHHHII",
+                    0x02014B50,
+                    (3 << 8) | version,  # made by: UNIX, so external_attr carries the mode bits
+                    version,
+                    flags,
+                    entry.method,
+                    dostime,
+                    dosdate,
+                    entry.crc,
+                    compress_size,
+                    file_size,
+                    len(name),
+                    len(extra),
+                    0,
+                    0,
+                    0,
+                    entry.external_attr,
+                    offset,
+                )
+            )
+            self._write(name + extra)
+
+        cd_size = self._offset - cd_start
+        count = len(self._entries)
+        if count >= _ZIP_COUNT_LIMIT or cd_start >= _ZIP64_LIMIT or cd_size >= _ZIP64_LIMIT:
+            zip64_end = self._offset
+            self._write(struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, cd_size, cd_start))
+            self._write(struct.pack("<IIQI", 0x07064B50, 0, zip64_end, 1))
+
+        self._write(
+            struct.pack(
+                "<IHHHHIIH",
+                0x06054B50,
+                0,
+                0,
+                min(count, _ZIP_COUNT_LIMIT),
+                min(count, _ZIP_COUNT_LIMIT),
+                min(cd_size, _ZIP64_LIMIT),
+                min(cd_start, _ZIP64_LIMIT),
+                len(comment),
+            )
+        )
+        self._write(comment)
+        self._fh.flush()
+
+
+@dataclass(slots=True)
+class _SourceFile:
+    name: str
+    path: Path
+    is_dir: bool
+    stat: os.stat_result
+
+
+def _walk(
+    root: Path, prefix: str = "", path_filter: PathFilter | None = None, selected: bool = True
+) -> Iterator[_SourceFile]:
+    with os.scandir(root) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        name = f"{prefix}{entry.name}"
+        if entry.is_dir():
+            child_selected = selected
+            if path_filter is not None:
+                descend, child_selected = path_filter.enter(name, selected)
+                if not descend:
+                    continue
+            # parents of kept files without their own entry are implied by the entry names
+            if child_selected:
+                yield _SourceFile(f"{name}/", Path(entry.path), True, entry.stat())
+            yield from _walk(Path(entry.path), f"{name}/", path_filter, child_selected)
+        elif path_filter is None or path_filter.keep(name, selected):
+            yield _SourceFile(name, Path(entry.path), False, entry.stat())
+
+
+def _walk_overlay(overlay: Overlay, path_filter: PathFilter | None = None) -> Iterator[_SourceFile]:
+    # same entries and order as `_walk` over the materialized overlay, read from the original files
+    for rel, src, is_dir in overlay.walk(path_filter):
+        yield _SourceFile(f"{rel}/" if is_dir else rel, src, is_dir, os.stat(src))
+
+
+def reproducible_date_time(epoch: int | None = None) -> tuple[int, int, int, int, int, int]:
+    """Entry timestamp for reproducible archives: `epoch`, else $SOURCE_DATE_EPOCH, else 1980-01-01 (UTC)."""
+    if epoch is None:
+        env = os.environ.get("SOURCE_DATE_EPOCH")
+        epoch = int(env) if env and env.strip().isdigit() else _DOS_EPOCH
+    return tuple(time.gmtime(max(int(epoch), _DOS_EPOCH))[:6])  # type: ignore[return-value]
+
+
+def _entry_for(source: _SourceFile, fixed_date_time: tuple[int, int, int, int, int, int] | None) -> ZipEntry:
+    if fixed_date_time is not None:
+        # reproducible: only the executable bit of the mode survives
+        mode = 0o40755 if source.is_dir else (0o100755 if source.stat.st_mode & 0o111 else 0o100644)
+        date_time = fixed_date_time
+    else:
+        mode = source.stat.st_mode & 0xFFFF
+        date_time = time.localtime(source.stat.st_mtime)[:6]
+        if date_time[0] < 1980:
+            date_time = (1980, 1, 1, 0, 0, 0)
+    external_attr = mode << 16
+    if source.is_dir:
+        external_attr |= 0x10  # MS-DOS directory flag
+    return ZipEntry(name=source.name, date_time=date_time, external_attr=external_attr)
+
+
+def compress_file(path: Path, entry: ZipEntry, rule: CompressionRule) -> EntryData:
+    """Fill in `entry` sizes/CRC/method for `path` and return the data to write.
+
+    Deflated output that is not smaller than the input is stored instead.
+    """
+    if rule.method == STORED:
+        crc = 0
+        size = 0
+        with open(path, "rb") as fh:
+            while chunk := fh.read(_CHUNK_SIZE):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+        entry.method, entry.crc, entry.file_size, entry.compress_size = STORED, crc, size, size
+        return path
+
+    compressor = zlib.compressobj(rule.level, zlib.DEFLATED, -15)
+    out = SpooledTemporaryFile(max_size=_SPOOL_MAX)
+    crc = 0
+    size = 0
+    with open(path, "rb") as fh:
+        while chunk := fh.read(_CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            out.write(compressor.compress(chunk))
+    out.write(compressor.flush())
+    compress_size = out.tell()
+
+    entry.crc, entry.file_size = crc, size
+    if compress_size >= size:
+        out.close()
+        entry.method, entry.compress_size = STORED, size
+        return path
+    entry.method, entry.compress_size = DEFLATED, compress_size
+    return out
+
+
+def compression_tag(rules: tuple[CompressionRule, ...]) -> bytes:
+    """Archive comment recording the compression settings its entries were produced with."""
+    settings = ";".join(f"{r.pattern}={r.method}:{r.level}" for r in rules)
+    return b"mapack:" + hashlib.sha1(settings.encode("utf-8")).hexdigest().encode("ascii")
+
+
+class PreviousArchive:
+    """Index of an existing archive whose compressed entries can be copied verbatim.
+
+    Only archives written with the same compression settings (see
+    `compression_tag`) are used; anything unreadable is ignored.
+    """
+
+    def __init__(self, path: Path, entries: dict[str, zipfile.ZipInfo]) -> None:
+        self.path = path
+        self._entries = entries
+
+    @classmethod
+    def open(cls, path: Path, rules: tuple[CompressionRule, ...]) -> PreviousArchive | None:
+        try:
+            with zipfile.ZipFile(path) as zf:
+                if zf.comment != compression_tag(rules):
+                    return None
+                return cls(path, {info.filename: info for info in zf.infolist()})
+        except (OSError, zipfile.BadZipFile):
+            return None
+
+    def find(self, name: str, size: int) -> zipfile.ZipInfo | None:
+        info = self._entries.get(name)
+        # under the same settings a stored entry means deflating it did not pay off
+        if info is None or info.file_size != size or info.compress_type not in (STORED, DEFLATED):
+            return None
+        return info
+
+    def raw_range(self, info: zipfile.ZipInfo) -> RawRange | None:
+        with open(self.path, "rb") as fh:
+            fh.seek(info.header_offset)
+            header = fh.read(30)
+        if len(header) != 30 or header[:4] != b"PK\x03\x04":
+            return None
+        name_len, extra_len = struct.unpack("<HH", header[26:30])
+        return RawRange(self.path, info.header_offset + 30 + name_len + extra_len, info.compress_size)
+
+
+def _file_crc(path: Path) -> int:
+    crc = 0
+    with open(path, "rb") as fh:
+        while chunk := fh.read(_CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _content_digest(path: Path) -> bytes:
+    hasher = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as fh:
+        while chunk := fh.read(_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.digest()
+
+
+@dataclass(frozen=True, slots=True)
+class _Compressed:
+    method: int
+    crc: int
+    file_size: int
+    compress_size: int
+    # None when the entry is stored: the data is the source file itself
+    data: bytes | RawRange | None
+
+
+class EntryStore:
+    """Compressed entries shared by the archives written during one build.
+
+    A file is deflated once per content and compression level, however many
+    archives contain it; the others copy its compressed bytes. Contents are
+    identified by a blake2b digest, computed once per file (same device, inode,
+    size and mtime). Results are kept in memory up to a budget, then spilled to
+    a temporary directory removed by `close`.
+    """
+
+    def __init__(self) -> None:
+        self._digests: dict[tuple[int, int, int, int], bytes] = {}
+        self._entries: OnceMap[_Compressed] = OnceMap()
+        self._lock = threading.Lock()
+        self._memory = 0
+        self._names = itertools.count()
+        self._tmp: TemporaryDirectory[str] | None = None
+
+    def __enter__(self) -> EntryStore:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            tmp, self._tmp = self._tmp, None
+            self._digests.clear()
+            self._entries = OnceMap()
+            self._memory = 0
+        if tmp is not None:
+            tmp.cleanup()
+
+    def _digest(self, source: _SourceFile) -> bytes:
+        st = source.stat
+        ident = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            known = self._digests.get(ident)
+        if known is None:
+            known = _content_digest(source.path)
+            with self._lock:
+                self._digests[ident] = known
+        return known
+
+    def _compress(self, path: Path, rule: CompressionRule) -> _Compressed:
+        scratch = ZipEntry(name="")
+        data = compress_file(path, scratch, rule)
+        fields = (scratch.method, scratch.crc, scratch.file_size, scratch.compress_size)
+        if isinstance(data, Path):
+            return _Compressed(*fields, None)
+        try:
+            data.seek(0)
+            with self._lock:
+                inline = self._memory + scratch.compress_size <= _SHARED_MEMORY
+                if inline:
+                    self._memory += scratch.compress_size
+                else:
+                    if self._tmp is None:
+                        self._tmp = TemporaryDirectory(prefix="mapack-zip-")
+                    spill = Path(self._tmp.name) / f"{next(self._names)}.deflate"
+            if inline:
+                return _Compressed(*fields, data.read())
+            with open(spill, "wb") as fh:
+                shutil.copyfileobj(data, fh, _CHUNK_SIZE)
+            return _Compressed(*fields, RawRange(spill, 0, scratch.compress_size))
+        finally:
+            data.close()
+
+    def compress(self, source: _SourceFile, entry: ZipEntry, rule: CompressionRule) -> tuple[EntryData, bool]:
+        """Like `compress_file` for `source`; also tells whether the result was produced for another entry."""
+        digest = self._digest(source)
+        key = (digest, source.stat.st_size, rule.method, rule.level)
+        compressed, ran = self._entries.get_or_run(key, lambda: self._compress(source.path, rule))
+        entry.method, entry.crc = compressed.method, compressed.crc
+        entry.file_size, entry.compress_size = compressed.file_size, compressed.compress_size
+        return (compressed.data if compressed.data is not None else source.path), not ran
+
+
+def _prepare(
+    source: _SourceFile,
+    rules: tuple[CompressionRule, ...],
+    fixed_date_time: tuple[int, int, int, int, int, int] | None,
+    previous: PreviousArchive | None,
+    shared: EntryStore | None = None,
+) -> tuple[ZipEntry, EntryData, bool, bool]:
+    """Return the entry for `source`, its data, and whether that data was reused / shared."""
+    entry = _entry_for(source, fixed_date_time)
+    if source.is_dir:
+        return entry, b"", False, False
+
+    rule = rule_for(source.name, rules)
+    if previous is not None and rule.method == DEFLATED:
+        # reuse the previous compressed bytes when the file is unchanged (same path, size and CRC)
+        info = previous.find(source.name, source.stat.st_size)
+        if info is not None and _file_crc(source.path) == info.CRC:
+            raw = previous.raw_range(info)
+            if raw is not None:
+                entry.method, entry.crc = info.compress_type, info.CRC
+                entry.file_size, entry.compress_size = info.file_size, info.compress_size
+                return entry, raw, True, False
+
+    if shared is not None and rule.method == DEFLATED:
+        data, was_shared = shared.compress(source, entry, rule)
+        return entry, data, False, was_shared
+    return entry, compress_file(source.path, entry, rule), False, False
+
+
+class _HashingWriter:
+    """File wrapper feeding everything written through it to hashlib digests."""
+
+    def __init__(self, fh: BinaryIO, algorithms: tuple[str, ...]) -> None:
+        self._fh = fh
+        self._hashers = {name: hashlib.new(name) for name in algorithms}
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        for hasher in self._hashers.values():
+            hasher.update(data)
+        self.size += len(data)
+        return self._fh.write(data)
+
+    def flush(self) -> None:
+        self._fh.flush()
+
+    def hexdigests(self) -> dict[str, str]:
+        return {name: hasher.hexdigest() for name, hasher in self._hashers.items()}
+
+
+@dataclass(slots=True)
+class ArchiveResult:
+    path: Path
+    entries: int
+    size: int
+    digests: dict[str, str]
+    # False when an identical archive was already in place and left untouched
+    replaced: bool = True
+    # entries copied compressed from the previous archive
+    reused: int = 0
+    # entries whose compressed data was produced for another archive (see `EntryStore`)
+    shared: int = 0
+
+
+def write_zip(
+    source_dir: Path | Overlay,
+    zip_path: Path,
+    *,
+    compression: tuple[CompressionRule, ...] = DEFAULT_COMPRESSION,
+    jobs: int | None = None,
+    reproducible: bool = False,
+    source_date_epoch: int | None = None,
+    digests: tuple[str, ...] = (),
+    keep_if_sha256: str | None = None,
+    incremental: bool = False,
+    path_filter: PathFilter | None = None,
+    shared: EntryStore | None = None,
+) -> ArchiveResult:
+    """Archive the contents of `source_dir` into `zip_path`.
+
+    Entries are compressed on up to `jobs` threads (zlib releases the GIL) and
+    streamed into the archive in sorted path order; at most a few entries per
+    worker are held at once. The archive is written next to `zip_path` and
+    renamed into place once complete, unless its sha256 equals `keep_if_sha256`,
+    in which case the existing file is kept as is.
+
+    `reproducible` pins entry timestamps (see `reproducible_date_time`) and
+    permissions so that identical inputs give byte-identical archives.
+    `incremental` copies the compressed data of unchanged files from the archive
+    currently at `zip_path` instead of compressing them again. `path_filter`
+    selects the archived files; skipped subtrees are not walked. An `Overlay`
+    is archived as if it had been materialized, straight from its source files.
+    With a `shared` store, files already compressed for another archive are
+    not compressed again.
+    """
+    workers = max(1, jobs or os.cpu_count() or 1)
+    zip_path.parent.mkdir(parents=True, exist_ok=True)
+    partial = zip_path.with_name(f".{zip_path.name}.{os.getpid()}.partial")
+    fixed_date_time = reproducible_date_time(source_date_epoch) if reproducible else None
+    algorithms = tuple(dict.fromkeys((*digests, *(("sha256",) if keep_if_sha256 else ()))))
+
+    previous = PreviousArchive.open(zip_path, compression) if incremental and zip_path.is_file() else None
+
+    count = 0
+    reused = 0
+    shared_count = 0
+    window: deque[Future[tuple[ZipEntry, EntryData, bool, bool]]] = deque()
+    try:
+        with open(partial, "wb") as raw, ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mapack-zip") as pool:
+            fh = _HashingWriter(raw, algorithms)
+            writer = ZipWriter(fh)  # type: ignore[arg-type]
+
+            def flush_one() -> None:
+                nonlocal reused, shared_count
+                entry, data, was_reused, was_shared = window.popleft().result()
+                writer.add(entry, data)
+                if hasattr(data, "close"):
+                    data.close()
+                reused += was_reused
+                shared_count += was_shared
+
+            if isinstance(source_dir, Overlay):
+                sources = _walk_overlay(source_dir, path_filter)
+            else:
+                root_selected = path_filter.root_selected if path_filter is not None else True
+                sources = _walk(source_dir, "", path_filter, root_selected)
+            for source in sources:
+                window.append(pool.submit(_prepare, source, compression, fixed_date_time, previous, shared))
+                if len(window) >= workers * 2:
+                    flush_one()
+                count += 1
+            while window:
+                flush_one()
+            writer.close(comment=compression_tag(compression))
+
+        hexdigests = fh.hexdigests()
+        if (
+            keep_if_sha256 is not None
+            and hexdigests.get("sha256") == keep_if_sha256
+            and zip_path.is_file()
+            and zip_path.stat().st_size == fh.size
+        ):
+            partial.unlink()
+            return ArchiveResult(
+                zip_path, count, fh.size, hexdigests, replaced=False, reused=reused, shared=shared_count
+            )
+        os.replace(partial, zip_path)
+    except BaseException:
+        for future in window:
+            future.cancel()
+        partial.unlink(missing_ok=True)
+        raise
+    return ArchiveResult(zip_path, count, fh.size, hexdigests, reused=reused, shared=shared_count)
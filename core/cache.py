@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from .materialize import materialize_file, materialize_tree
+from .overlay import Overlay
+
+logger = logging.getLogger("mapack")
+
+DEFAULT_CACHE_DIRNAME = ".mapack-cache"
+DEFAULT_MAX_SIZE = 10 * 1024**3
+
+_META = "meta.json"
+
+
+@dataclass(slots=True)
+class CacheEntry:
+    key: str
+    path: Path
+    size: int
+    last_used: float
+
+    @property
+    def workdir(self) -> Path:
+        return self.path / "workdir"
+
+
+def fingerprint_tree(path: Path, *, contents: bool = False) -> str:
+    """Hash the paths, sizes and mtimes (optionally contents) of a file or directory tree."""
+    digest = hashlib.sha256()
+
+    def add_file(rel: str, entry_path: str, stat: os.stat_result) -> None:
+        digest.update(f"f:{rel}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8", "surrogateescape"))
+        if contents:
+            with open(entry_path, "rb") as fh:
+                for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                    digest.update(chunk)
+
+    def walk(directory: str, prefix: str) -> None:
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        for entry in entries:
+            rel = f"{prefix}{entry.name}"
+            if entry.is_dir(follow_symlinks=True):
+                digest.update(f"d:{rel}\n".encode("utf-8", "surrogateescape"))
+                walk(entry.path, f"{rel}/")
+            else:
+                add_file(rel, entry.path, entry.stat(follow_symlinks=True))
+
+    if not path.exists():
+        digest.update(b"missing")
+    elif path.is_dir():
+        walk(str(path), "")
+    else:
+        add_file(path.name, str(path), path.stat())
+    return digest.hexdigest()
+
+
+def _tree_size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name), follow_symlinks=False).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _copy_any(src: Path, dest: Path) -> None:
+    if src.is_dir():
+        materialize_tree(src, dest, "auto")
+    else:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        materialize_file(src, dest, "auto")
+
+
+class BlobStore:
+    """Files keyed by hex digest, shared across builds (e.g. per-file transform results).
+
+    Blobs count towards the cache size and are evicted together with artifact entries.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        tmp = path.with_name(f".{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+
+
+class ArtifactCache:
+    """Content-addressed store of artifact workdirs and exports, evicted least-recently-used first.
+
+    Layout: `<root>/artifacts/<key>/{meta.json, workdir/, outputs/<output_key>/{meta.json, <name>}}`,
+    plus `<root>/blobs/<namespace>/` for `BlobStore`s and other `directory()`s such as `<root>/git/`.
+    Entries are staged under `<root>/tmp` and renamed into place, so a crashed or
+    concurrent build never leaves a half-written entry behind.
+    """
+
+    def __init__(self, root: Path, *, max_size: int = DEFAULT_MAX_SIZE, hash_contents: bool = False) -> None:
+        self.root = root
+        self.max_size = max_size
+        self.hash_contents = hash_contents
+
+    @property
+    def _entries_dir(self) -> Path:
+        return self.root / "artifacts"
+
+    def _entry_dir(self, key: str) -> Path:
+        return self._entries_dir / key
+
+    def _staging_dir(self) -> Path:
+        path = self.root / "tmp" / uuid.uuid4().hex
+        path.mkdir(parents=True)
+        return path
+
+    def blobs(self, namespace: str) -> BlobStore:
+        return BlobStore(self.root / "blobs" / namespace)
+
+    def directory(self, name: str) -> Path:
+        """Directory for data managed by its user (e.g. git mirrors), not subject to eviction."""
+        path = self.root / name
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def get(self, key: str) -> CacheEntry | None:
+        path = self._entry_dir(key)
+        meta_path = path / _META
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        now = time.time()
+        try:
+            os.utime(meta_path, (now, now))
+        except OSError:
+            pass
+        return CacheEntry(key=key, path=path, size=int(meta.get("size", 0)), last_used=now)
+
+    def contains(self, key: str, output_key: str | None = None) -> bool:
+        """Whether `key` (and its export `output_key`) is cached; unlike `get`, does not count as a use."""
+        path = self._entry_dir(key)
+        if output_key is not None:
+            path = path / "outputs" / output_key
+        return (path / _META).is_file()
+
+    def put_workdir(self, key: str, workdir: Path | Overlay) -> None:
+        if self._entry_dir(key).exists():
+            return
+        staging = self._staging_dir()
+        try:
+            # never hardlink: the workdir may share inodes with user sources
+            if isinstance(workdir, Overlay):
+                workdir.materialize(staging / "workdir", "auto")
+            else:
+                materialize_tree(workdir, staging / "workdir", "auto")
+            meta = {"key": key, "size": _tree_size(staging), "created": time.time()}
+            (staging / _META).write_text(json.dumps(meta), encoding="utf-8")
+            self._entries_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(staging, self._entry_dir(key))
+        except OSError:
+            # another process stored the same key first, or the disk is full
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def restore_workdir(self, entry: CacheEntry, workdir: Path, strategy: str = "auto") -> None:
+        # hardlinks into the cache are fine: workdir writes break links first
+        materialize_tree(entry.workdir, workdir, strategy)
+
+    def get_output(self, key: str, output_key: str) -> tuple[Path, dict[str, Any]] | None:
+        """Return a cached export and the metadata stored with it."""
+        output_dir = self._entry_dir(key) / "outputs" / output_key
+        try:
+            meta = json.loads((output_dir / _META).read_text(encoding="utf-8"))
+            return output_dir / meta["name"], meta
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put_output(self, key: str, output_key: str, output: Path, meta: dict[str, Any] | None = None) -> None:
+        entry_dir = self._entry_dir(key)
+        if not entry_dir.is_dir():
+            return
+        target = entry_dir / "outputs" / output_key
+        if target.exists():
+            return
+        staging = self._staging_dir()
+        try:
+            _copy_any(output, staging / output.name)
+            (staging / _META).write_text(json.dumps({**(meta or {}), "name": output.name}), encoding="utf-8")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staging, target)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+
+        meta_path = entry_dir / _META
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            meta["size"] = _tree_size(entry_dir)
+            meta_path.write_text(json.dumps(meta), encoding="utf-8")
+        except (OSError, ValueError):
+            pass
+
+    def _remove_stale_staging(self, max_age: float = 3600.0) -> None:
+        staging_root = self.root / "tmp"
+        if not staging_root.is_dir():
+            return
+        cutoff = time.time() - max_age
+        for path in staging_root.iterdir():
+            try:
+                if path.stat().st_mtime < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+    def entries(self) -> list[CacheEntry]:
+        if not self._entries_dir.is_dir():
+            return []
+        found: list[CacheEntry] = []
+        for path in self._entries_dir.iterdir():
+            meta_path = path / _META
+            try:
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                last_used = meta_path.stat().st_mtime
+            except (OSError, ValueError):
+                continue
+            found.append(CacheEntry(key=path.name, path=path, size=int(meta.get("size", 0)), last_used=last_used))
+        return found
+
+    def _blob_entries(self) -> list[CacheEntry]:
+        found: list[CacheEntry] = []
+        for root, _dirs, files in os.walk(self.root / "blobs"):
+            for name in files:
+                path = Path(root) / name
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                found.append(CacheEntry(key=name, path=path, size=stat.st_size, last_used=stat.st_mtime))
+        return found
+
+    def prune(self, max_size: int | None = None) -> tuple[int, int]:
+        """Evict least recently used entries until the cache fits `max_size` bytes.
+
+        Returns `(removed_entries, freed_bytes)`.
+        """
+        limit = self.max_size if max_size is None else max_size
+        self._remove_stale_staging()
+
+        entries = sorted([*self.entries(), *self._blob_entries()], key=lambda e: e.last_used)
+        total = sum(e.size for e in entries)
+        removed = 0
+        freed = 0
+        for entry in entries:
+            if total <= limit:
+                break
+            if entry.path.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                entry.path.unlink(missing_ok=True)
+            total -= entry.size
+            freed += entry.size
+            removed += 1
+
+        if removed:
+            logger.info("cache pruned %d entries (%d bytes) from %s", removed, freed, self.root)
+        return removed, freed
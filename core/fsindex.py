@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .globs import glob_match
+
+
+@dataclass(slots=True)
+class _Entry:
+    rel_path: str
+    is_dir: bool
+    size: int
+
+
+@dataclass(slots=True)
+class _Tree:
+    entries: list[_Entry] = field(default_factory=list)
+    top_names: set[str] = field(default_factory=set)
+    # totals as (recursive, top level only)
+    files: list[int] = field(default_factory=lambda: [0, 0])
+    dirs: list[int] = field(default_factory=lambda: [0, 0])
+    size: list[int] = field(default_factory=lambda: [0, 0])
+    globs: dict[tuple[str, bool], int] = field(default_factory=dict)
+
+    def add(self, entry: _Entry, top_level: bool) -> None:
+        self.entries.append(entry)
+        for i in (0, 1) if top_level else (0,):
+            if entry.is_dir:
+                self.dirs[i] += 1
+            else:
+                self.files[i] += 1
+                self.size[i] += entry.size
+        if top_level:
+            self.top_names.add(entry.rel_path)
+
+
+def _scan(root: Path) -> _Tree:
+    tree = _Tree()
+    pending: list[tuple[str, str]] = [(str(root), "")]
+    while pending:
+        directory, prefix = pending.pop()
+        try:
+            it = os.scandir(directory)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                rel_path = prefix + entry.name
+                try:
+                    is_dir = entry.is_dir()
+                    size = 0 if is_dir else entry.stat().st_size
+                except OSError:
+                    continue
+                tree.add(_Entry(rel_path, is_dir, size), top_level=not prefix)
+                if is_dir and not entry.is_symlink():
+                    pending.append((entry.path, rel_path + "/"))
+    return tree
+
+
+class FileIndex:
+    """Directory listings backing expression functions such as `count_files`, scanned once per build.
+
+    Each queried root is walked once with `os.scandir`; later queries on it are
+    answered from memory until `invalidate` is called for a path inside or above it
+    (the interpreter does so after every transform that writes into a workdir).
+    """
+
+    def __init__(self) -> None:
+        self._trees: dict[Path, _Tree | None] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, path: Path | None = None) -> None:
+        """Forget listings of `path`, its subdirectories and the directories containing it (all if None)."""
+        with self._lock:
+            if path is None:
+                self._trees.clear()
+                return
+            for root in list(self._trees):
+                if root == path or root.is_relative_to(path) or path.is_relative_to(root):
+                    del self._trees[root]
+
+    def _tree(self, root: Path) -> _Tree | None:
+        with self._lock:
+            if root in self._trees:
+                return self._trees[root]
+        tree = _scan(root) if root.is_dir() else None
+        with self._lock:
+            return self._trees.setdefault(root, tree)
+
+    def count_files(self, root: Path, *, recursive: bool = True, include_dirs: bool = False) -> int:
+        tree = self._tree(root)
+        if tree is None:
+            return 0
+        i = 0 if recursive else 1
+        return tree.files[i] + (tree.dirs[i] if include_dirs else 0)
+
+    def total_size(self, root: Path, *, recursive: bool = True) -> int:
+        tree = self._tree(root)
+        if tree is None:
+            return root.stat().st_size if root.is_file() else 0
+        return tree.size[0 if recursive else 1]
+
+    def exists(self, path: Path) -> bool:
+        # answered from the parent's listing when it is indexed
+        with self._lock:
+            parent = self._trees.get(path.parent)
+        if parent is not None:
+            return path.name in parent.top_names
+        return path.exists()
+
+    def glob_count(self, root: Path, pattern: str, *, include_dirs: bool = False) -> int:
+        tree = self._tree(root)
+        if tree is None:
+            return 0
+        key = (pattern, include_dirs)
+        count = tree.globs.get(key)
+        if count is None:
+            count = tree.globs[key] = sum(
+                1
+                for e in tree.entries
+                if (include_dirs or not e.is_dir) and glob_match(e.rel_path, pattern, is_dir=e.is_dir)
+            )
+        return count
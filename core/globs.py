@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+
+@lru_cache(maxsize=512)
+def _compile(pattern: str) -> tuple[re.Pattern[str], bool]:
+    dir_only = pattern.endswith("/")
+    pattern = pattern.strip("/")
+    anchored = "/" in pattern
+
+    out: list[str] = []
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if ch == "*":
+            out.append("[^/]*")
+        elif ch == "?":
+            out.append("[^/]")
+        elif ch == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(ch))
+            else:
+                body = pattern[i + 1 : end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end
+        else:
+            out.append(re.escape(ch))
+        i += 1
+
+    prefix = "" if anchored else "(?:.*/)?"
+    return re.compile(f"{prefix}{''.join(out)}"), dir_only
+
+
+def glob_match(rel_path: str, pattern: str, *, is_dir: bool = False) -> bool:
+    """Match a `/`-separated path relative to a tree root against a gitignore-like glob.
+
+    `*` and `?` stay within one path segment, `**` spans directories, a pattern
+    without `/` matches the name at any depth, and a trailing `/` only matches
+    directories.
+    """
+    regex, dir_only = _compile(pattern)
+    if dir_only and not is_dir:
+        return False
+    return regex.fullmatch(rel_path) is not None
+
+
+def _segment_may_match(pattern: str, rel_dir: str) -> bool:
+    """Whether an anchored `pattern` can match `rel_dir` or something below it."""
+    pattern_parts = pattern.strip("/").split("/")
+    for i, part in enumerate(rel_dir.split("/")):
+        if i >= len(pattern_parts):
+            # the pattern matched an ancestor directory
+            return True
+        if "**" in pattern_parts[i]:
+            return True
+        if not _compile(pattern_parts[i])[0].fullmatch(part):
+            return False
+    return True
+
+
+@dataclass(frozen=True, slots=True)
+class PathFilter:
+    """`include`/`exclude` glob lists (see `glob_match`) applied while walking a tree.
+
+    Excluded files are skipped and excluded directories are not entered at all.
+    With `include`, only matching files and the contents of matching directories
+    are kept, and directories that cannot contain a match are not entered either.
+    Walkers start with `selected = not include` and pass down what `enter` returns.
+    """
+
+    include: tuple[str, ...] = ()
+    exclude: tuple[str, ...] = ()
+
+    @classmethod
+    def from_spec(cls, spec: Any, where: str) -> PathFilter | None:
+        """Read the `include`/`exclude` lists of a spec object; None when it has neither."""
+        if not isinstance(spec, dict):
+            return None
+        lists: dict[str, tuple[str, ...]] = {}
+        for key in ("include", "exclude"):
+            value = spec.get(key)
+            if value is None:
+                continue
+            if isinstance(value, str):
+                value = [value]
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                raise ValueError(f"{where}.{key} must be a glob or a list of globs")
+            lists[key] = tuple(value)
+        return cls(**lists) if lists else None
+
+    @property
+    def root_selected(self) -> bool:
+        return not self.include
+
+    def _included(self, rel_path: str, is_dir: bool) -> bool:
+        return any(glob_match(rel_path, pattern, is_dir=is_dir) for pattern in self.include)
+
+    def _excluded(self, rel_path: str, is_dir: bool) -> bool:
+        return any(glob_match(rel_path, pattern, is_dir=is_dir) for pattern in self.exclude)
+
+    def enter(self, rel_dir: str, selected: bool) -> tuple[bool, bool]:
+        """Whether to walk into `rel_dir`, and whether everything below it is selected."""
+        if self._excluded(rel_dir, True):
+            return False, False
+        if selected or self._included(rel_dir, True):
+            return True, True
+        may_match = any("/" not in p.strip("/") or _segment_may_match(p, rel_dir) for p in self.include)
+        return may_match, False
+
+    def keep(self, rel_path: str, selected: bool) -> bool:
+        """Whether to keep the file `rel_path`, found in a directory with the given selection."""
+        if self._excluded(rel_path, False):
+            return False
+        return selected or self._included(rel_path, False)
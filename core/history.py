@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import json
+import os
+import statistics
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from .profiling import Profiler
+
+HISTORY_FILENAME = "history.json"
+_VERSION = 1
+# samples kept per step; estimates are their median
+_SAMPLES = 5
+# span categories worth predicting, and the step kind they are recorded as
+_STEP_KINDS = {"source": "src", "transform": "transform", "export": "export", "cache": "cache"}
+
+
+def step_key(target: str | None, artifact: str, kind: str, name: str) -> str:
+    """History key of a build step; a None target matches the step in any target."""
+    return "\t".join((target or "*", artifact, kind, name))
+
+
+@dataclass(frozen=True, slots=True)
+class StepEstimate:
+    wall: float
+    files: int
+    bytes_written: int | None
+    runs: int
+
+
+class BuildHistory:
+    """Wall times of the build steps of previous runs, kept in `<cache dir>/history.json`.
+
+    Every executed source copy, transform, export and cache restore is recorded
+    under its target, artifact and name (`step_key`), and again for any target
+    so that a step never run in one target can borrow the timing of another.
+    Steps skipped thanks to the cache leave no samples, so estimates describe
+    the cost of actually running a step.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._steps: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("version") == _VERSION and isinstance(data.get("steps"), dict):
+                self._steps = data["steps"]
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def record(self, profiler: Profiler) -> int:
+        """Add the steps profiled during a build; returns the number of samples added."""
+        added = 0
+        with self._lock:
+            for span in profiler.spans:
+                kind = _STEP_KINDS.get(span.category)
+                artifact = span.args.get("artifact")
+                if kind is None or artifact is None:
+                    continue
+                # an export's file name changes with versions, its artifact does not
+                name = "export" if kind == "export" else span.name
+                for target in (span.args.get("target"), None):
+                    step = self._steps.setdefault(step_key(target, str(artifact), kind, name), {"wall": []})
+                    step["wall"] = [*step["wall"], round(span.wall, 6)][-_SAMPLES:]
+                    step["files"] = span.files
+                    step["bytes_written"] = span.bytes_written
+                added += 1
+        return added
+
+    def estimate(self, target: str, artifact: str, kind: str, name: str) -> StepEstimate | None:
+        with self._lock:
+            step = self._steps.get(step_key(target, artifact, kind, name))
+            if step is None:
+                step = self._steps.get(step_key(None, artifact, kind, name))
+        if not step or not step.get("wall"):
+            return None
+        return StepEstimate(
+            wall=statistics.median(step["wall"]),
+            files=int(step.get("files") or 0),
+            bytes_written=step.get("bytes_written"),
+            runs=len(step["wall"]),
+        )
+
+    def save(self) -> None:
+        with self._lock:
+            payload = json.dumps({"version": _VERSION, "steps": self._steps}, sort_keys=True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(payload, encoding="utf-8")
+        os.replace(tmp, self.path)
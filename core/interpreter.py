@@ -1,64 +1,400 @@
 from __future__ import annotations
 
-import copy
+import hashlib
+import json
 import logging
 import shutil
+from collections import Counter
+from contextlib import nullcontext
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Any
-
-from config.expressions import ExpressionContext, evaluate_expression
-from config.templating import render_template, resolve_templates, set_dotted
-from transforms import load_builtin_transforms
-from transforms.registry import run_transform
-from .runtime import ArtifactResult, InterpreterState
+from typing import Any, Callable
+
+from config.expressions import ExpressionContext, evaluate_expression, expression_paths
+from config.templating import lazy_scope
+from transforms.registry import registry, run_transform
+from .archive import (
+    DEFAULT_COMPRESSION,
+    STORED,
+    ArchiveResult,
+    CompressionRule,
+    EntryStore,
+    parse_compression,
+    reproducible_date_time,
+    write_zip,
+)
+from .cache import ArtifactCache, BlobStore, fingerprint_tree
+from .fsindex import FileIndex
+from .globs import PathFilter
+from .materialize import break_links, break_tree_links, check_strategy, materialize_file, materialize_tree
+from .overlay import Overlay, WorkTree
+from .profiling import Profiler
+from .runtime import ArtifactResult, ExportKeys, InterpreterState
+from .scheduler import OnceMap, once, run_graph, topological_order
+from .sync import SYNC_MODES, sync_tree, sync_tree_atomic
+from .workspace import Workspace
 
 logger = logging.getLogger("mapack")
 
 
+def _zip_output_path(dest_path: Path) -> Path:
+    if dest_path.suffix.lower() == ".zip":
+        return dest_path
+    return dest_path.with_name(dest_path.name + ".zip")
+
+
+def _checksum_path(archive: Path) -> Path:
+    return archive.with_name(archive.name + ".sha256")
+
+
+def _read_checksum_file(archive: Path) -> str | None:
+    try:
+        return _checksum_path(archive).read_text(encoding="utf-8").split()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def _write_checksum_file(archive: Path, sha256: str) -> None:
+    # `sha256sum -c` format
+    content = f"{sha256}  {archive.name}\n"
+    path = _checksum_path(archive)
+    try:
+        if path.read_text(encoding="utf-8") == content:
+            return
+    except OSError:
+        pass
+    path.write_text(content, encoding="utf-8")
+
+
+def _export_options(export: dict[str, Any]) -> dict[str, Any]:
+    """What the contents of an export depend on besides its artifact: the resolved export minus `dest`."""
+    options = {k: v for k, v in export.items() if k != "dest"}
+    if options.get("reproducible", False):
+        # entry timestamps may come from $SOURCE_DATE_EPOCH
+        epoch = options.get("source_date_epoch")
+        options["date_time"] = list(reproducible_date_time(int(epoch) if epoch is not None else None))
+    return options
+
+
+def _export_digests(export: dict[str, Any]) -> tuple[str, ...]:
+    """Names listed in `export.digests`: hashlib algorithms, or `size`."""
+    raw = export.get("digests") or []
+    if not isinstance(raw, list):
+        raise ValueError("export.digests must be a list")
+    names: list[str] = []
+    for item in raw:
+        name = str(item).lower()
+        if name != "size" and (name not in hashlib.algorithms_guaranteed or name.startswith("shake_")):
+            raise ValueError(f"export.digests: unsupported digest {item!r}")
+        names.append(name)
+    return tuple(dict.fromkeys(names))
+
+
+def _write_manifest(path: Path, info: dict[str, Any]) -> None:
+    content = json.dumps(info, indent=2, sort_keys=True) + "\n"
+    try:
+        if path.read_text(encoding="utf-8") == content:
+            return
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+
+
+def _collect_inputs(
+    value: Any, refs: set[str], paths: list[str], types: set[str], unknown: list[str] | None = None
+) -> None:
+    """Gather artifact references, local source paths and transform types of a resolved spec.
+
+    Paths outside the workdir read by `conditional` expressions count as sources;
+    expressions reading paths that cannot be told in advance go to `unknown`.
+    """
+    if isinstance(value, list):
+        for item in value:
+            _collect_inputs(item, refs, paths, types, unknown)
+        return
+    if not isinstance(value, dict):
+        return
+
+    if value.get("artifact") is not None:
+        refs.add(str(value["artifact"]))
+    if isinstance(value.get("type"), str):
+        types.add(value["type"])
+    src = value.get("src")
+    if isinstance(src, str):
+        paths.append(src)
+    elif isinstance(src, dict) and isinstance(src.get("path"), str):
+        paths.append(src["path"])
+    if value.get("type") == "conditional":
+        for operand in (value.get("a"), value.get("b")):
+            if not isinstance(operand, str):
+                continue
+            read = expression_paths(operand)
+            for path in read or ():
+                if Path(path).is_absolute():
+                    paths.append(path)
+                elif Overlay.normalize(path) is None and unknown is not None:
+                    # relative to the workdir, but outside of it
+                    unknown.append(operand)
+            if read is None and unknown is not None:
+                unknown.append(operand)
+
+    for item in value.values():
+        _collect_inputs(item, refs, paths, types, unknown)
+
+
+# part of every artifact key: bump when a change to the interpreter or a built-in
+# transform changes what the workdir of an unchanged spec contains
+_KEY_VERSION = 1
+
+
+@lru_cache(maxsize=None)
+def _mapack_version() -> str:
+    # installed versions differ between releases; source checkouts rely on `_KEY_VERSION`
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("mapack")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def _digest(value: Any) -> str:
+    payload = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 @dataclass(slots=True)
 class TransformContext:
     interpreter: "ConfigInterpreter"
     state: InterpreterState
     artifact_name: str
-    workdir: Path
+    tree: WorkTree
+    materialize: str = "auto"
+
+    @property
+    def workdir(self) -> Path:
+        """The workdir on disk; a virtual workdir is written out first."""
+        return self.tree.realize()
+
+    @property
+    def overlay(self) -> Overlay | None:
+        """Contents of a virtual workdir, edited in place by transforms registered with `virtual=True`."""
+        return self.tree.overlay
+
+    def break_links(self, path: Path) -> None:
+        """Call before modifying a workdir file (or the files of a directory) in place.
+
+        With hardlink materialization the file may share its inode with a source;
+        it is given its own copy first. Transforms doing this for every file they
+        modify in place are registered with `link_safe=True`.
+        """
+        if self.materialize != "hardlink":
+            return
+        if path.is_dir():
+            break_tree_links(path)
+        else:
+            break_links(path)
 
     def resolve_value(self, value: Any) -> Any:
         return self.interpreter._resolve_value(value, self.state)
 
     def resolve_expr_or_value(self, value: Any) -> Any:
-        return self.interpreter._resolve_expr_or_value(value, self.state, self.workdir)
+        return self.interpreter._resolve_expr_or_value(value, self.state, self.tree.path, prepare=self.tree.realize)
 
     def resolve_source(self, source_spec: Any, *, allow_artifact_output: bool) -> Path:
         return self.interpreter._resolve_source(source_spec, self.state, allow_artifact_output=allow_artifact_output)
 
     def run_nested_transform(self, spec: dict[str, Any]) -> None:
-        self.interpreter._run_transform(spec, self.state, self.artifact_name, self.workdir)
+        self.interpreter._run_transform(spec, self.state, self.artifact_name, self.tree, materialize=self.materialize)
+
+    def copy_file(self, src: Path, dst: Path) -> None:
+        materialize_file(src, dst, self.materialize)
+        self.interpreter.profiler.count(1)
+
+    def copy_tree(self, src: Path, dst: Path, path_filter: PathFilter | None = None) -> None:
+        self.interpreter.profiler.count(materialize_tree(src, dst, self.materialize, path_filter))
+
+    def path_filter(self, spec: dict[str, Any], where: str) -> PathFilter | None:
+        """The `include`/`exclude` globs of a transform spec, if any."""
+        return PathFilter.from_spec(spec, where)
+
+    def blob_store(self, namespace: str) -> BlobStore | None:
+        """Per-file store shared across builds, or None when the cache is disabled."""
+        cache = self.interpreter.cache
+        return cache.blobs(namespace) if cache is not None else None
+
+    def cache_dir(self, name: str) -> Path | None:
+        """Cache subdirectory managed by the caller, or None when the cache is disabled."""
+        cache = self.interpreter.cache
+        return cache.directory(name) if cache is not None else None
+
+
+@dataclass(slots=True)
+class _TargetPlan:
+    state: InterpreterState
+    artifacts: dict[str, Any]
+    requested: list[str]
 
 
 class ConfigInterpreter:
-    def __init__(self, config: dict[str, Any], config_path: Path) -> None:
+    def __init__(
+        self,
+        config: dict[str, Any],
+        config_path: Path,
+        *,
+        jobs: int = 1,
+        cache: ArtifactCache | None = None,
+        materialize: str = "auto",
+        zip_jobs: int | None = None,
+        profiler: Profiler | None = None,
+        workspace: Workspace | None = None,
+    ) -> None:
         self.config = config
         self.config_path = config_path.resolve()
-        load_builtin_transforms()
+        self.jobs = max(1, jobs)
+        self.cache = cache
+        self.materialize = check_strategy(materialize)
+        self.zip_jobs = zip_jobs
+        self.profiler = profiler if profiler is not None else Profiler(enabled=False)
+        # directory listings for expression functions (`count_files`, ...), shared by the build
+        self.fs_index = FileIndex()
+        # workdirs kept between runs by long-running processes; a temporary directory otherwise
+        self.workspace = workspace
+        # compressed zip entries shared by the exports of the current run, if several may share them
+        self.zip_entries: EntryStore | None = None
 
     def run(self, targets: list[str] | None = None, *, dry_run: bool = False) -> dict[str, list[Path]]:
+        self.fs_index.invalidate()
+        plans, order, dependencies_of = self._plan_graph(targets)
+        builds: OnceMap[tuple[Path, Callable[[], None] | None, Overlay | None]] = OnceMap()
+        exports: OnceMap[dict[str, str]] = OnceMap()
+
+        work_root = TemporaryDirectory(prefix="mapack-") if self.workspace is None else nullcontext(self.workspace.root)
+        # hashing every file for the store only pays off when another archive can reuse its entries
+        shared_entries = EntryStore() if self._zip_exports_overlap(plans, order) else nullcontext(None)
+        with (
+            self.profiler.span("build", "build", targets=",".join(plans)),
+            work_root as tmpdir,
+            shared_entries as zip_entries,
+        ):
+            tmp_root = Path(tmpdir)
+            self.zip_entries = zip_entries
+
+            def build_node(node: tuple[str, str]) -> ArtifactResult:
+                target_name, artifact_name = node
+                with self.profiler.span(artifact_name, "artifact", target=target_name, artifact=artifact_name):
+                    return self._build_artifact(
+                        artifact_name,
+                        state=plans[target_name].state,
+                        target_artifacts=plans[target_name].artifacts,
+                        temp_root=tmp_root / target_name,
+                        dry_run=dry_run,
+                        builds=builds,
+                        exports=exports,
+                    )
+
+            try:
+                run_graph(order, dependencies_of, build_node, jobs=self.jobs)
+            finally:
+                self.zip_entries = None
+
+        if self.cache is not None and not dry_run:
+            self.cache.prune()
+
+        outputs_by_target: dict[str, list[Path]] = {}
+        for target_name, plan in plans.items():
+            produced: list[Path] = []
+            for artifact_name in plan.requested:
+                output_path = plan.state.artifact_results[artifact_name].output_path
+                if output_path:
+                    produced.append(output_path)
+            outputs_by_target[target_name] = produced
+
+        return outputs_by_target
+
+    def source_paths(self, resolved_spec: dict[str, Any]) -> list[str]:
+        """Local source paths (as written) read by a resolved artifact spec, including those of its transforms."""
+        paths: list[str] = []
+        _collect_inputs(resolved_spec, set(), paths, set())
+        return list(dict.fromkeys(paths))
+
+    def export_keys(self, key: str | None, resolved_export: dict[str, Any]) -> ExportKeys:
+        """Identify the export `resolved_export` of the artifact with key `key`."""
+        options = _export_options(resolved_export)
+        return ExportKeys(
+            cache=_digest(options),
+            output=_digest([key, options]) if key is not None else None,
+            build=_digest([key, resolved_export]) if key is not None else None,
+        )
+
+    def _zip_exports_overlap(self, plans: dict[str, _TargetPlan], order: list[tuple[str, str]]) -> bool:
+        """Whether two different zipped exports of a build deflate files at a common level (see `EntryStore`)."""
+        levels: dict[str, set[int]] = {}
+        for target_name, artifact_name in order:
+            export = plans[target_name].artifacts[artifact_name].get("export")
+            if not isinstance(export, dict):
+                continue
+            try:
+                resolved = self._resolve_value(export, plans[target_name].state)
+            except KeyError:
+                # refers to variables set during the build
+                resolved = export
+            if not resolved.get("enabled", False) or not resolved.get("zipped", True):
+                continue
+            try:
+                rules = parse_compression(resolved.get("compression"))
+            except ValueError:
+                continue
+            # identical exports (same dest) are written once
+            levels[_digest(resolved)] = {rule.level for rule in rules if rule.method != STORED}
+        counts = Counter(level for found in levels.values() for level in found)
+        return any(count > 1 for count in counts.values())
+
+    def _plan_graph(
+        self, targets: list[str] | None
+    ) -> tuple[dict[str, _TargetPlan], list[tuple[str, str]], Callable[[tuple[str, str]], list[tuple[str, str]]]]:
+        """Resolve the selected targets and order their `(target, artifact)` nodes, dependencies first."""
         available_targets = self._get_targets()
         selected = targets or list(available_targets.keys())
 
-        outputs_by_target: dict[str, list[Path]] = {}
+        plans: dict[str, _TargetPlan] = {}
         for target_name in selected:
             if target_name not in available_targets:
                 raise KeyError(f"Unknown target: {target_name}")
 
             merged_target = self._materialize_target(target_name)
             state = self._build_state_for_target(target_name, merged_target)
-            outputs_by_target[target_name] = self._execute_target(state, merged_target, dry_run=dry_run)
-
-        return outputs_by_target
+            plans[target_name] = self._plan_target(state, merged_target)
+
+        # Every target contributes its artifacts to a single graph so independent
+        # work of different targets overlaps, and artifacts resolving to the same
+        # spec with the same inputs are only built (and exported) once.
+        def dependencies_of(node: tuple[str, str]) -> list[tuple[str, str]]:
+            target_name, artifact_name = node
+            deps = self._artifact_dependencies(artifact_name, plans[target_name].artifacts)
+            return [(target_name, dep) for dep in deps]
+
+        roots = [(target_name, name) for target_name, plan in plans.items() for name in plan.requested]
+        return plans, topological_order(roots, dependencies_of), dependencies_of
+
+    def input_paths(self, targets: list[str] | None = None) -> set[Path]:
+        """The config file and the local sources referenced by the artifacts of `targets` (all if None)."""
+        paths = {self.config_path}
+        for target_name in targets or list(self._get_targets()):
+            merged_target = self._materialize_target(target_name)
+            state = self._build_state_for_target(target_name, merged_target)
+            for artifact_spec in (merged_target.get("artifacts") or {}).values():
+                try:
+                    resolved = self._resolve_value(artifact_spec, state)
+                except KeyError:
+                    continue
+                paths.update(self._resolve_path(raw) for raw in self.source_paths(resolved))
+        return paths
 
-    def _execute_target(self, state: InterpreterState, target_config: dict[str, Any], *, dry_run: bool) -> list[Path]:
+    def _plan_target(self, state: InterpreterState, target_config: dict[str, Any]) -> _TargetPlan:
         artifacts = target_config.get("artifacts")
         if not isinstance(artifacts, dict):
             raise ValueError("target.artifacts must be an object")
@@ -71,21 +407,23 @@ class ConfigInterpreter:
             if isinstance(export, dict) and export.get("enabled", False):
                 requested.append(name)
 
-        produced: list[Path] = []
-        with TemporaryDirectory(prefix=f"mapack-{state.target_name}-") as tmpdir:
-            tmp_root = Path(tmpdir)
-            for artifact_name in requested:
-                result = self._build_artifact(
-                    artifact_name,
-                    state=state,
-                    target_artifacts=artifacts,
-                    temp_root=tmp_root,
-                    dry_run=dry_run,
-                )
-                if result.output_path:
-                    produced.append(result.output_path)
+        return _TargetPlan(state=state, artifacts=artifacts, requested=requested)
+
+    def _artifact_dependencies(self, artifact_name: str, target_artifacts: dict[str, Any]) -> list[str]:
+        if artifact_name not in target_artifacts:
+            raise KeyError(f"Unknown artifact: {artifact_name}")
 
-        return produced
+        artifact_spec = target_artifacts[artifact_name]
+        if not isinstance(artifact_spec, dict):
+            raise ValueError(f"Artifact '{artifact_name}' definition must be an object")
+
+        depends_on = artifact_spec.get("depends_on", [])
+        if depends_on is None:
+            depends_on = []
+        if not isinstance(depends_on, list):
+            raise ValueError(f"Artifact '{artifact_name}' depends_on must be a list")
+
+        return [str(dep) for dep in depends_on]
 
     def _build_artifact(
         self,
@@ -95,44 +433,79 @@ class ConfigInterpreter:
         target_artifacts: dict[str, Any],
         temp_root: Path,
         dry_run: bool,
+        builds: OnceMap[tuple[Path, Callable[[], None] | None, Overlay | None]],
+        exports: OnceMap[dict[str, str]],
     ) -> ArtifactResult:
         existing = state.artifact_results.get(artifact_name)
         if existing is not None:
             return existing
 
-        if artifact_name not in target_artifacts:
-            raise KeyError(f"Unknown artifact: {artifact_name}")
-
+        # dependencies are scheduled beforehand by `run_graph`
         artifact_spec = target_artifacts[artifact_name]
-        if not isinstance(artifact_spec, dict):
-            raise ValueError(f"Artifact '{artifact_name}' definition must be an object")
-
-        depends_on = artifact_spec.get("depends_on", [])
-        if depends_on is None:
-            depends_on = []
-        if not isinstance(depends_on, list):
-            raise ValueError(f"Artifact '{artifact_name}' depends_on must be a list")
-
-        for dep in depends_on:
-            dep_name = str(dep)
-            self._build_artifact(dep_name, state=state, target_artifacts=target_artifacts, temp_root=temp_root, dry_run=dry_run)
+        key, cacheable = self._artifact_key(artifact_spec, state)
+        cache = self.cache if cacheable and not dry_run else None
+        strategy = self._materialize_strategy(artifact_name, artifact_spec, state)
+        workspace = self.workspace
+        reusable = workspace is not None and cacheable and not dry_run
+
+        def build() -> tuple[Path, Callable[[], None] | None, Overlay | None]:
+            workdir = temp_root / artifact_name
+            if workspace is None:
+                workdir.mkdir(parents=True, exist_ok=True)
+            elif reusable and workspace.holds(workdir, key):
+                logger.info(
+                    "target=%s artifact=%s workdir up to date (key=%s)", state.target_name, artifact_name, key[:12]
+                )
+                return workdir, None, None
+            else:
+                workspace.reset(workdir)
+
+            if cache is not None:
+                entry = cache.get(key)
+                if entry is not None:
+                    logger.info("target=%s artifact=%s cache hit (key=%s)", state.target_name, artifact_name, key[:12])
+
+                    def restore() -> None:
+                        with self.profiler.span("restore", "cache", target=state.target_name, artifact=artifact_name):
+                            cache.restore_workdir(entry, workdir, strategy)
+                        if reusable:
+                            workspace.record(workdir, key)
+
+                    # restored on first use only: exports and dependents may be cache hits as well
+                    return workdir, once(restore), None
+
+            # workspace workdirs are kept on disk between builds, other workdirs start out virtual
+            tree = WorkTree(
+                workdir,
+                Overlay() if workspace is None else None,
+                strategy=strategy,
+                on_realize=lambda files: self._on_realize(state, artifact_name, workdir, files),
+            )
+            self._populate_workdir(artifact_name, artifact_spec, state, tree, dry_run=dry_run)
+            if cache is not None:
+                with self.profiler.span("store", "cache", target=state.target_name, artifact=artifact_name):
+                    cache.put_workdir(key, tree.overlay if tree.overlay is not None else workdir)
+            if reusable:
+                workspace.record(workdir, key)
+            if tree.overlay is None:
+                return workdir, None, None
+            # still virtual: written to disk only for consumers that need real files
+            return workdir, once(tree.realize), tree.overlay
+
+        if key is None:
+            workdir, prepare, overlay = build()
+        else:
+            (workdir, prepare, overlay), built = builds.get_or_run(key, build)
+            if not built:
+                logger.info(
+                    "target=%s artifact=%s reused identical build (key=%s)", state.target_name, artifact_name, key[:12]
+                )
 
-        workdir = temp_root / artifact_name
-        workdir.mkdir(parents=True, exist_ok=True)
-        result = ArtifactResult(name=artifact_name, workdir=workdir)
+        result = ArtifactResult(
+            name=artifact_name, workdir=workdir, key=key, cacheable=cacheable, prepare=prepare, overlay=overlay
+        )
         state.artifact_results[artifact_name] = result
 
-        if not dry_run:
-            src_spec = artifact_spec.get("src")
-            if src_spec is not None:
-                src_path = self._resolve_source(src_spec, state, allow_artifact_output=False)
-                self._copy_source_to_artifact_root(src_path, workdir)
-
-            for transform in artifact_spec.get("transforms", []):
-                self._run_transform(transform, state, artifact_name, workdir)
-        else:
-            logger.info("artifact=%s dry-run: skipped source copy and transforms", artifact_name)
-
         export = artifact_spec.get("export")
         if isinstance(export, dict) and export.get("enabled", False):
             resolved_export = self._resolve_value(export, state)
@@ -145,21 +518,256 @@ class ConfigInterpreter:
             dest_path = self._resolve_path(dest_raw)
 
             zipped = bool(resolved_export.get("zipped", True))
-            if not dry_run:
-                if zipped:
-                    self._zip_directory(workdir, dest_path)
+            export_keys = self.export_keys(key, resolved_export)
+            wanted = _export_digests(resolved_export)
+            manifest = resolved_export.get("manifest", False)
+            if not zipped and (wanted or manifest):
+                raise ValueError(f"Artifact '{artifact_name}': export.digests and export.manifest need a zipped export")
+
+            def write_export() -> dict[str, str]:
+                if dry_run:
+                    return {name: "" for name in wanted if name != "size"}
+                with self.profiler.span(dest_path.name, "export", target=state.target_name, artifact=artifact_name):
+                    digests = export_output()
+                self.fs_index.invalidate(dest_path)
+                return digests
+
+            # the file or directory written: archives get a `.zip` suffix if `dest` has none
+            output_path = _zip_output_path(dest_path) if zipped else dest_path
+
+            def export_output() -> dict[str, str]:
+                output_key = export_keys.cache
+                recorded = workspace.exported(output_path, key, output_key) if reusable else None
+                if recorded is not None:
+                    logger.info("target=%s artifact=%s export up to date", state.target_name, artifact_name)
+                    return recorded
+                cached = cache.get_output(key, output_key) if cache is not None else None
+                if cached is not None:
+                    cached_path, meta = cached
+                    written = self._restore_output(cached_path, dest_path, resolved_export)
+                    digests = meta.get("digests", {})
+                    logger.info("target=%s artifact=%s export restored from cache", state.target_name, artifact_name)
                 else:
-                    if dest_path.exists():
-                        shutil.rmtree(dest_path, ignore_errors=True)
-                    shutil.copytree(workdir, dest_path, dirs_exist_ok=True)
+                    # zips of virtual workdirs are read straight from the files the overlay points to
+                    source: Path | Overlay = overlay if overlay is not None and zipped else workdir
+                    if prepare is not None and source is workdir:
+                        prepare()
+                    written, digests = self._write_output(source, dest_path, resolved_export)
+                    if cache is not None:
+                        cache.put_output(key, output_key, written, {"digests": digests})
+
+                if zipped and resolved_export.get("reproducible", False):
+                    _write_checksum_file(written, digests["sha256"])
+                if reusable:
+                    workspace.record_export(output_path, key, output_key, digests)
+                return digests
+
+            if key is None:
+                digests = write_export()
+            else:
+                digests, _ = exports.get_or_run(export_keys.build, write_export)
+                result.output_key = export_keys.output
             result.output_path = dest_path
-            logger.info("artifact=%s exported -> %s", artifact_name, dest_path)
+            if zipped:
+                self._publish_digests(artifact_name, state, dest_path, digests, manifest, dry_run=dry_run)
+            logger.info("target=%s artifact=%s exported -> %s", state.target_name, artifact_name, dest_path)
         else:
-            logger.info("artifact=%s built (no export)", artifact_name)
+            logger.info("target=%s artifact=%s built (no export)", state.target_name, artifact_name)
 
         return result
 
-    def _run_transform(self, spec: dict[str, Any], state: InterpreterState, artifact_name: str, workdir: Path) -> None:
+    def _publish_digests(
+        self,
+        artifact_name: str,
+        state: InterpreterState,
+        dest_path: Path,
+        digests: dict[str, str],
+        manifest: Any,
+        *,
+        dry_run: bool,
+    ) -> None:
+        """Expose an archive's digests as `exports.<artifact>.*` variables and write its manifest."""
+        archive = _zip_output_path(dest_path)
+        info: dict[str, Any] = {"name": archive.name, "size": 0 if dry_run else archive.stat().st_size, **digests}
+        state.templates.set(f"exports.{artifact_name}", {"path": str(archive), **info})
+        if manifest and not dry_run:
+            if isinstance(manifest, str):
+                manifest_path = self._resolve_path(manifest)
+            else:
+                manifest_path = archive.with_name(archive.name + ".json")
+            _write_manifest(manifest_path, info)
+
+    def _write_output(
+        self, workdir: Path | Overlay, dest_path: Path, export: dict[str, Any]
+    ) -> tuple[Path, dict[str, str]]:
+        if bool(export.get("zipped", True)):
+            reproducible = bool(export.get("reproducible", False))
+            epoch = export.get("source_date_epoch")
+            archive = self._zip_directory(
+                workdir,
+                dest_path,
+                compression=parse_compression(export.get("compression")),
+                reproducible=reproducible,
+                source_date_epoch=int(epoch) if epoch is not None else None,
+                incremental=bool(export.get("incremental", True)),
+                path_filter=PathFilter.from_spec(export, "export"),
+                digests=tuple(name for name in _export_digests(export) if name != "size"),
+            )
+            return archive.path, archive.digests
+
+        if isinstance(workdir, Overlay):
+            raise TypeError("Directory exports are synced from a workdir on disk")
+        self._sync_directory(workdir, dest_path, export)
+        return dest_path, {}
+
+    def _sync_directory(self, source_dir: Path, dest_path: Path, export: dict[str, Any]) -> None:
+        mode = export.get("sync", "mtime")
+        if mode is False:
+            mode = "full"
+        if mode not in SYNC_MODES:
+            raise ValueError(f"export.sync must be one of {', '.join(SYNC_MODES)} (got {mode!r})")
+        path_filter = PathFilter.from_spec(export, "export")
+
+        if mode == "full":
+            if dest_path.exists():
+                shutil.rmtree(dest_path, ignore_errors=True)
+            # exports are handed to users: never share inodes with the workdir or its sources
+            self.profiler.count(materialize_tree(source_dir, dest_path, "auto", path_filter))
+            return
+
+        if bool(export.get("atomic", False)):
+            stats = sync_tree_atomic(source_dir, dest_path, compare=mode, path_filter=path_filter)
+        else:
+            stats = sync_tree(source_dir, dest_path, compare=mode, path_filter=path_filter)
+        self.profiler.count(stats.copied)
+        logger.info(
+            "%s synced: %d copied, %d deleted, %d unchanged", dest_path, stats.copied, stats.deleted, stats.unchanged
+        )
+
+    def _restore_output(self, cached: Path, dest_path: Path, export: dict[str, Any]) -> Path:
+        if not bool(export.get("zipped", True)):
+            self._sync_directory(cached, dest_path, export)
+            return dest_path
+
+        target = _zip_output_path(dest_path)
+        cached_stat = cached.stat()
+        try:
+            current = target.stat()
+            if current.st_size == cached_stat.st_size and current.st_mtime_ns == cached_stat.st_mtime_ns:
+                return target
+        except FileNotFoundError:
+            pass
+        target.parent.mkdir(parents=True, exist_ok=True)
+        materialize_file(cached, target, "auto")
+        return target
+
+    def _populate_workdir(
+        self,
+        artifact_name: str,
+        artifact_spec: dict[str, Any],
+        state: InterpreterState,
+        tree: WorkTree,
+        *,
+        dry_run: bool,
+    ) -> None:
+        if dry_run:
+            logger.info(
+                "target=%s artifact=%s dry-run: skipped source copy and transforms", state.target_name, artifact_name
+            )
+            return
+
+        src_spec = artifact_spec.get("src")
+        if src_spec is not None:
+            with self.profiler.span("src", "source", target=state.target_name, artifact=artifact_name):
+                resolved_src = self._resolve_value(src_spec, state)
+                path_filter = PathFilter.from_spec(resolved_src, "src")
+                ref_overlay = self._source_overlay(resolved_src, state)
+                if tree.overlay is not None and ref_overlay is not None:
+                    tree.overlay.add_overlay(ref_overlay, path_filter)
+                elif tree.overlay is not None:
+                    src_path = self._resolve_source(src_spec, state, allow_artifact_output=False)
+                    if not src_path.exists():
+                        raise FileNotFoundError(f"Artifact source does not exist: {src_path}")
+                    if src_path.is_file():
+                        tree.overlay.add_file(src_path, src_path.name)
+                    else:
+                        tree.overlay.add_tree(src_path, "", path_filter)
+                else:
+                    src_path = self._resolve_source(src_spec, state, allow_artifact_output=False)
+                    self._copy_source_to_artifact_root(src_path, tree.path, tree.strategy, path_filter)
+
+        for transform in artifact_spec.get("transforms", []):
+            self._run_transform(transform, state, artifact_name, tree, materialize=tree.strategy)
+
+    def _source_overlay(self, resolved_src: Any, state: InterpreterState) -> Overlay | None:
+        """The overlay of a virtual artifact used as `src` (`{"artifact": name}`), if any."""
+        if not isinstance(resolved_src, dict) or resolved_src.get("output", False):
+            return None
+        ref = state.artifact_results.get(str(resolved_src.get("artifact")))
+        return ref.overlay if ref is not None else None
+
+    def _on_realize(self, state: InterpreterState, artifact_name: str, workdir: Path, files: int) -> None:
+        logger.info("target=%s artifact=%s wrote virtual workdir (%d files)", state.target_name, artifact_name, files)
+        self.profiler.count(files)
+        self.fs_index.invalidate(workdir)
+
+    def _materialize_strategy(self, artifact_name: str, artifact_spec: dict[str, Any], state: InterpreterState) -> str:
+        strategy = self._resolve_value(artifact_spec.get("materialize", self.materialize), state)
+        try:
+            return check_strategy(str(strategy))
+        except ValueError as exc:
+            raise ValueError(f"Artifact '{artifact_name}': {exc}") from None
+
+    def _artifact_key(self, artifact_spec: dict[str, Any], state: InterpreterState) -> tuple[str | None, bool]:
+        """Identify what an artifact's workdir will contain and whether that may be cached.
+
+        The key covers the fully resolved spec (minus `export`, which only affects
+        where the result goes) and the keys of every referenced artifact, so two
+        artifacts with equal keys produce identical workdirs. With a cache or a
+        workspace, local sources are fingerprinted into the key as well. The key
+        is None when the spec cannot be resolved up front.
+        """
+        spec = {k: v for k, v in artifact_spec.items() if k != "export"}
+        try:
+            resolved = self._resolve_value(spec, state)
+        except KeyError:
+            return None, False
+
+        refs: set[str] = {str(dep) for dep in artifact_spec.get("depends_on") or []}
+        paths: list[str] = []
+        types: set[str] = set()
+        unknown: list[str] = []
+        _collect_inputs(resolved, refs, paths, types, unknown)
+
+        cacheable = resolved.get("cache", True) is not False and all(registry.is_cacheable(t) for t in types)
+        cacheable = cacheable and not unknown
+        inputs: list[Any] = []
+        for ref_name in sorted(refs):
+            ref = state.artifact_results.get(ref_name)
+            if ref is None or ref.key is None:
+                return None, False
+            cacheable = cacheable and ref.cacheable
+            inputs.append([ref_name, ref.key, ref.output_key])
+
+        sources: list[Any] = []
+        if cacheable and (self.cache is not None or self.workspace is not None):
+            contents = self.cache is not None and self.cache.hash_contents
+            for raw in paths:
+                path = self._resolve_path(raw)
+                sources.append([str(path), fingerprint_tree(path, contents=contents)])
+
+        payload = {"version": _KEY_VERSION, "mapack": _mapack_version(), "spec": resolved, "inputs": inputs}
+        return _digest({**payload, "sources": sources}), cacheable
+
+    def _run_transform(
+        self,
+        spec: dict[str, Any],
+        state: InterpreterState,
+        artifact_name: str,
+        tree: WorkTree,
+        *,
+        materialize: str = "auto",
+    ) -> None:
         if not isinstance(spec, dict):
             raise ValueError(f"Transform in '{artifact_name}' must be an object")
         transform_type = spec.get("type")
@@ -170,24 +778,46 @@ class ConfigInterpreter:
         if not isinstance(resolved_spec, dict):
             raise ValueError("Resolved transform spec must be an object")
 
-        logger.info("artifact=%s transform=%s id=%s", artifact_name, transform_type, resolved_spec.get("id"))
-        ctx = TransformContext(interpreter=self, state=state, artifact_name=artifact_name, workdir=workdir)
-        run_transform(transform_type, ctx, resolved_spec)
-
-    def _copy_source_to_artifact_root(self, src_path: Path, workdir: Path) -> None:
+        logger.info(
+            "target=%s artifact=%s transform=%s id=%s",
+            state.target_name,
+            artifact_name,
+            transform_type,
+            resolved_spec.get("id"),
+        )
+        ctx = TransformContext(
+            interpreter=self,
+            state=state,
+            artifact_name=artifact_name,
+            tree=tree,
+            materialize=materialize,
+        )
+        name = str(resolved_spec.get("id") or transform_type)
+        with self.profiler.span(name, "transform", target=state.target_name, artifact=artifact_name, type=transform_type):
+            info = registry.info(transform_type)
+            if not info.virtual:
+                tree.realize()
+            if materialize == "hardlink" and not info.link_safe:
+                # the transform may modify any file in place without calling `ctx.break_links` first
+                break_tree_links(tree.realize())
+            try:
+                run_transform(transform_type, ctx, resolved_spec)
+            finally:
+                if not info.read_only:
+                    self.fs_index.invalidate(tree.path)
+
+    def _copy_source_to_artifact_root(
+        self, src_path: Path, workdir: Path, strategy: str = "auto", path_filter: PathFilter | None = None
+    ) -> None:
         if not src_path.exists():
             raise FileNotFoundError(f"Artifact source does not exist: {src_path}")
 
         if src_path.is_file():
-            shutil.copy2(src_path, workdir / src_path.name)
+            materialize_file(src_path, workdir / src_path.name, strategy)
+            self.profiler.count(1)
             return
 
-        for child in src_path.iterdir():
-            dest = workdir / child.name
-            if child.is_dir():
-                shutil.copytree(child, dest, dirs_exist_ok=True)
-            else:
-                shutil.copy2(child, dest)
+        self.profiler.count(materialize_tree(src_path, workdir, strategy, path_filter))
 
     def _resolve_source(self, source_spec: Any, state: InterpreterState, *, allow_artifact_output: bool) -> Path:
         resolved = self._resolve_value(source_spec, state)
@@ -202,6 +832,8 @@ class ConfigInterpreter:
                 if ref_name not in state.artifact_results:
                     raise KeyError(f"Referenced artifact has not been built yet: {ref_name}")
                 ref = state.artifact_results[ref_name]
+                if ref.prepare is not None:
+                    ref.prepare()
                 wants_output = bool(resolved.get("output", False))
                 if wants_output:
                     if not allow_artifact_output:
@@ -222,39 +854,35 @@ class ConfigInterpreter:
             return path
         return (self.config_path.parent / path).resolve()
 
-    def _resolve_expr_or_value(self, value: Any, state: InterpreterState, cwd: Path) -> Any:
+    def _resolve_expr_or_value(
+        self, value: Any, state: InterpreterState, cwd: Path, prepare: Callable[[], None] | None = None
+    ) -> Any:
         resolved = self._resolve_value(value, state)
         if not isinstance(resolved, str):
             return resolved
 
         try:
-            return evaluate_expression(resolved, context=ExpressionContext(cwd=cwd))
+            context = ExpressionContext(cwd=cwd, index=self.fs_index, prepare=prepare)
+            return evaluate_expression(resolved, context=context)
         except Exception:
             return resolved
 
     def _resolve_value(self, value: Any, state: InterpreterState) -> Any:
-        return resolve_templates(value, state.scope)
+        return state.templates.resolve(value)
 
     def _build_state_for_target(self, target_name: str, target_config: dict[str, Any]) -> InterpreterState:
         variables = target_config.get("variables")
         if not isinstance(variables, dict):
             raise ValueError(f"target '{target_name}' missing object field: variables")
 
-        scope: dict[str, Any] = copy.deepcopy(variables)
-
         precomputed = target_config.get("precomputed_vars", {})
         if not isinstance(precomputed, dict):
             raise ValueError(f"target '{target_name}' precomputed_vars must be an object")
+        if not all(isinstance(dotted_key, str) for dotted_key in precomputed):
+            raise ValueError("precomputed_vars keys must be strings")
 
-        for dotted_key, raw_value in precomputed.items():
-            if not isinstance(dotted_key, str):
-                raise ValueError("precomputed_vars keys must be strings")
-            if not isinstance(raw_value, str):
-                set_dotted(scope, dotted_key, raw_value)
-                continue
-            rendered = render_template(raw_value, scope)
-            set_dotted(scope, dotted_key, rendered)
-
+        # rendered on first use, so a target only evaluates the vars its artifacts reference
+        scope = lazy_scope(variables, precomputed)
         return InterpreterState(config_path=self.config_path, target_name=target_name, scope=scope)
 
     def _materialize_target(self, target_name: str) -> dict[str, Any]:
@@ -262,10 +890,11 @@ class ConfigInterpreter:
         targets = self._get_targets()
         target_obj = targets[target_name]
 
+        # the merged target shares unchanged subtrees with the config: treat every node as read-only
         use_global = target_obj.get("use_global", {})
         merged: dict[str, Any]
         if isinstance(use_global, dict) and use_global.get("use_all", False):
-            merged = copy.deepcopy(globals_obj)
+            merged = globals_obj
         else:
             merged = {}
 
@@ -274,22 +903,26 @@ class ConfigInterpreter:
 
         artifacts = merged.get("artifacts")
         if isinstance(artifacts, dict):
-            for artifact_name, artifact_spec in list(artifacts.items()):
-                if not isinstance(artifact_spec, dict):
-                    continue
-                artifacts[artifact_name] = self._apply_mod_transforms(artifact_spec)
+            merged["artifacts"] = {
+                name: self._apply_mod_transforms(spec) if isinstance(spec, dict) else spec
+                for name, spec in artifacts.items()
+            }
 
         return merged
 
     def _apply_mod_transforms(self, artifact_spec: dict[str, Any]) -> dict[str, Any]:
-        out = copy.deepcopy(artifact_spec)
-        mod_ops = out.pop("mod_transforms", None)
+        if "mod_transforms" not in artifact_spec:
+            return artifact_spec
+        out = {k: v for k, v in artifact_spec.items() if k != "mod_transforms"}
+        mod_ops = artifact_spec["mod_transforms"]
         if not mod_ops:
             return out
 
         transforms = out.get("transforms", [])
         if not isinstance(transforms, list):
             raise ValueError("artifact.transforms must be a list")
+        # edits apply to a copy of the list; the transforms themselves are shared
+        transforms = list(transforms)
 
         for op in mod_ops:
             if not isinstance(op, dict):
@@ -322,14 +955,11 @@ class ConfigInterpreter:
 
     def _deep_merge(self, base: Any, override: Any) -> Any:
         if isinstance(base, dict) and isinstance(override, dict):
-            merged = copy.deepcopy(base)
+            merged = dict(base)
             for key, value in override.items():
-                if key in merged:
-                    merged[key] = self._deep_merge(merged[key], value)
-                else:
-                    merged[key] = copy.deepcopy(value)
+                merged[key] = self._deep_merge(merged[key], value) if key in merged else value
             return merged
-        return copy.deepcopy(override)
+        return override
 
     def _get_targets(self) -> dict[str, Any]:
         targets = self.config.get("targets")
@@ -337,11 +967,42 @@ class ConfigInterpreter:
             raise ValueError("config.targets must be an object")
         return targets
 
-    def _zip_directory(self, source_dir: Path, zip_path: Path) -> None:
-        zip_path.parent.mkdir(parents=True, exist_ok=True)
-        if zip_path.suffix.lower() == ".zip":
-            base_name = zip_path.with_suffix("")
-        else:
-            base_name = zip_path
-            zip_path = zip_path.with_suffix(".zip")
-        shutil.make_archive(str(base_name), "zip", root_dir=source_dir)
+    def _zip_directory(
+        self,
+        source_dir: Path | Overlay,
+        zip_path: Path,
+        *,
+        compression: tuple[CompressionRule, ...] = DEFAULT_COMPRESSION,
+        reproducible: bool = False,
+        source_date_epoch: int | None = None,
+        incremental: bool = False,
+        path_filter: PathFilter | None = None,
+        digests: tuple[str, ...] = (),
+    ) -> ArchiveResult:
+        zip_path = _zip_output_path(zip_path)
+        # a reproducible archive identical to the previous one is left untouched
+        previous = _read_checksum_file(zip_path) if reproducible else None
+        archive = write_zip(
+            source_dir,
+            zip_path,
+            compression=compression,
+            jobs=self.zip_jobs,
+            reproducible=reproducible,
+            source_date_epoch=source_date_epoch,
+            # computed while the archive is written
+            digests=tuple(dict.fromkeys((*digests, *(("sha256",) if reproducible else ())))),
+            keep_if_sha256=previous,
+            incremental=incremental,
+            path_filter=path_filter,
+            shared=self.zip_entries,
+        )
+        self.profiler.count(archive.entries)
+        if archive.reused:
+            logger.info("%s reused %d/%d compressed entries", zip_path.name, archive.reused, archive.entries)
+        if archive.shared:
+            logger.info(
+                "%s shared %d/%d compressed entries with other exports", zip_path.name, archive.shared, archive.entries
+            )
+        if not archive.replaced:
+            logger.info("%s unchanged (sha256=%s), kept existing archive", zip_path, previous[:12])
+        return archive
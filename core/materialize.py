@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+from pathlib import Path
+
+from .globs import PathFilter
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger("mapack")
+
+MATERIALIZE_STRATEGIES = ("auto", "reflink", "hardlink", "copy")
+
+# ioctl(dest_fd, FICLONE, src_fd) shares the source extents copy-on-write (btrfs, XFS, bcachefs, ...)
+_FICLONE = 0x40049409
+
+# (source device, destination device) pairs known not to support reflinks
+_no_reflink: set[tuple[int, int]] = set()
+
+
+def check_strategy(strategy: str) -> str:
+    if strategy not in MATERIALIZE_STRATEGIES:
+        raise ValueError(f"Unknown materialize strategy: {strategy} (expected one of {', '.join(MATERIALIZE_STRATEGIES)})")
+    return strategy
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        devices = (os.stat(src).st_dev, os.stat(dst.parent).st_dev)
+    except OSError:
+        return False
+    if devices in _no_reflink:
+        return False
+
+    try:
+        with open(src, "rb") as src_fh, open(dst, "wb") as dst_fh:
+            fcntl.ioctl(dst_fh.fileno(), _FICLONE, src_fh.fileno())
+    except OSError:
+        logger.debug("reflink unsupported from %s to %s, falling back", src.parent, dst.parent)
+        _no_reflink.add(devices)
+        dst.unlink(missing_ok=True)
+        return False
+
+    shutil.copystat(src, dst)
+    return True
+
+
+def materialize_file(src: Path, dst: Path, strategy: str = "auto") -> None:
+    """Populate `dst` with the contents of `src`.
+
+    `reflink` and `auto` clone extents when the filesystem supports it, `hardlink`
+    shares the inode; both fall back to a plain copy. An existing `dst` is
+    unlinked first so that a hardlinked file is replaced rather than written through.
+    """
+    if dst.is_symlink() or dst.exists():
+        dst.unlink()
+
+    if strategy in ("auto", "reflink"):
+        if _reflink(src, dst):
+            return
+    elif strategy == "hardlink":
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+
+    shutil.copy2(src, dst)
+
+
+def materialize_tree(
+    src_dir: Path, dst_dir: Path, strategy: str = "auto", path_filter: PathFilter | None = None
+) -> int:
+    """Populate `dst_dir` with the contents of `src_dir`, merging into existing directories.
+
+    With `path_filter`, skipped subtrees are never entered and directories are
+    only created for selected directories and the parents of kept files.
+    Returns the number of files written.
+    """
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    if path_filter is not None:
+        return _materialize_filtered(src_dir, dst_dir, strategy, path_filter, "", path_filter.root_selected)
+    with os.scandir(src_dir) as it:
+        entries = list(it)
+    files = 0
+    for entry in entries:
+        target = dst_dir / entry.name
+        if entry.is_dir():
+            files += materialize_tree(Path(entry.path), target, strategy)
+        else:
+            materialize_file(Path(entry.path), target, strategy)
+            files += 1
+    return files
+
+
+def _materialize_filtered(
+    src_dir: Path, dst_dir: Path, strategy: str, path_filter: PathFilter, prefix: str, selected: bool
+) -> int:
+    with os.scandir(src_dir) as it:
+        entries = list(it)
+    files = 0
+    for entry in entries:
+        rel_path = prefix + entry.name
+        target = dst_dir / entry.name
+        if entry.is_dir():
+            descend, child_selected = path_filter.enter(rel_path, selected)
+            if not descend:
+                continue
+            if child_selected:
+                target.mkdir(parents=True, exist_ok=True)
+            files += _materialize_filtered(Path(entry.path), target, strategy, path_filter, rel_path + "/", child_selected)
+        elif path_filter.keep(rel_path, selected):
+            if files == 0:
+                dst_dir.mkdir(parents=True, exist_ok=True)
+            materialize_file(Path(entry.path), target, strategy)
+            files += 1
+    return files
+
+
+def break_links(path: Path) -> None:
+    """Give `path` its own inode if it is hardlinked, before it is modified in place."""
+    if path.is_symlink() or not path.is_file() or path.stat().st_nlink <= 1:
+        return
+    private = path.with_name(f".{path.name}.mapack-cow")
+    shutil.copy2(path, private)
+    os.replace(private, path)
+
+
+def break_tree_links(root: Path) -> None:
+    for dirpath, _dirnames, filenames in os.walk(root):
+        for name in filenames:
+            break_links(Path(dirpath) / name)
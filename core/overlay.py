@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Iterator
+
+from .globs import PathFilter
+from .materialize import materialize_file
+
+
+def _parent(rel: str) -> str:
+    return rel.rpartition("/")[0]
+
+
+class Overlay:
+    """Contents of a workdir that has not been written to disk: relative path -> file it is read from.
+
+    Copying sources into a workdir and deleting from it only edit this manifest
+    (a deletion simply drops the entries, hiding them from the layers they came
+    from). The files are written with `materialize` once a transform needs a real
+    directory, and zip exports read them directly from where they are.
+    """
+
+    def __init__(self) -> None:
+        self.files: dict[str, Path] = {}
+        # directory -> directory its metadata (mode, mtime) comes from
+        self.dirs: dict[str, Path] = {}
+
+    @staticmethod
+    def normalize(rel: str) -> str | None:
+        """A workdir-relative path in the `a/b` form used as key; None if it leaves the workdir."""
+        parts = [part for part in rel.replace("\\", "/").split("/") if part not in ("", ".")]
+        if ".." in parts:
+            return None
+        return "/".join(parts)
+
+    def copy(self) -> Overlay:
+        other = Overlay()
+        other.files = dict(self.files)
+        other.dirs = dict(self.dirs)
+        return other
+
+    def _add_parents(self, rel: str, origin: Path) -> None:
+        parent = _parent(rel)
+        while parent and parent not in self.dirs:
+            self.dirs[parent] = origin
+            parent = _parent(parent)
+
+    def is_file(self, rel: str) -> bool:
+        return rel in self.files
+
+    def is_dir(self, rel: str) -> bool:
+        return rel == "" or rel in self.dirs
+
+    def add_file(self, src: Path, rel: str) -> None:
+        self.remove(rel)
+        self._add_parents(rel, src.parent)
+        self.files[rel] = src
+
+    def add_tree(self, src: Path, dest: str = "", path_filter: PathFilter | None = None) -> int:
+        """Add the contents of the directory `src` below `dest`; returns the number of files added."""
+        if dest and dest not in self.dirs:
+            self.remove(dest)
+            self._add_parents(dest, src)
+            self.dirs[dest] = src
+        selected = path_filter.root_selected if path_filter is not None else True
+        return self._add_dir(src, dest + "/" if dest else "", "", path_filter, selected)
+
+    def _add_dir(
+        self,
+        src: Path,
+        dest_prefix: str,
+        rel_prefix: str,
+        path_filter: PathFilter | None,
+        selected: bool,
+    ) -> int:
+        with os.scandir(src) as it:
+            entries = list(it)
+        added = 0
+        for entry in entries:
+            rel = rel_prefix + entry.name
+            target = dest_prefix + rel
+            if entry.is_dir():
+                child_selected = selected
+                if path_filter is not None:
+                    descend, child_selected = path_filter.enter(rel, selected)
+                    if not descend:
+                        continue
+                if target in self.files:
+                    del self.files[target]
+                if child_selected:
+                    self._add_parents(target, Path(entry.path))
+                    self.dirs.setdefault(target, Path(entry.path))
+                added += self._add_dir(Path(entry.path), dest_prefix, rel + "/", path_filter, child_selected)
+            elif path_filter is None or path_filter.keep(rel, selected):
+                if target in self.dirs:
+                    self.remove(target)
+                self._add_parents(target, src)
+                self.files[target] = Path(entry.path)
+                added += 1
+        return added
+
+    def add_overlay(self, other: Overlay, path_filter: PathFilter | None = None) -> int:
+        """Add the (selected) contents of another overlay at the root."""
+        added = 0
+        for rel, src, is_dir in other.walk(path_filter):
+            if is_dir:
+                self.dirs.setdefault(rel, src)
+            else:
+                self.files[rel] = src
+                added += 1
+        return added
+
+    def remove(self, rel: str) -> int:
+        """Delete a file or a directory tree; returns the number of files removed."""
+        if not rel:
+            removed = len(self.files)
+            self.files.clear()
+            self.dirs.clear()
+            return removed
+        if self.files.pop(rel, None) is not None:
+            return 1
+        if rel not in self.dirs:
+            return 0
+        prefix = rel + "/"
+        doomed = [path for path in self.files if path.startswith(prefix)]
+        for path in doomed:
+            del self.files[path]
+        for path in [path for path in self.dirs if path == rel or path.startswith(prefix)]:
+            del self.dirs[path]
+        return len(doomed)
+
+    def walk(self, path_filter: PathFilter | None = None) -> Iterator[tuple[str, Path, bool]]:
+        """Yield `(rel_path, source, is_dir)` in the order of a sorted depth-first directory walk.
+
+        Like a filtered walk on disk, directories are only listed when selected.
+        """
+        children: dict[str, list[tuple[str, bool]]] = {}
+        for rel in self.dirs:
+            children.setdefault(_parent(rel), []).append((rel, True))
+        for rel in self.files:
+            children.setdefault(_parent(rel), []).append((rel, False))
+        selected = path_filter.root_selected if path_filter is not None else True
+        yield from self._walk(children, "", path_filter, selected)
+
+    def _walk(
+        self,
+        children: dict[str, list[tuple[str, bool]]],
+        parent: str,
+        path_filter: PathFilter | None,
+        selected: bool,
+    ) -> Iterator[tuple[str, Path, bool]]:
+        for rel, is_dir in sorted(children.get(parent, ()), key=lambda item: item[0].rpartition("/")[2]):
+            if not is_dir:
+                if path_filter is None or path_filter.keep(rel, selected):
+                    yield rel, self.files[rel], False
+                continue
+            child_selected = selected
+            if path_filter is not None:
+                descend, child_selected = path_filter.enter(rel, selected)
+                if not descend:
+                    continue
+            if child_selected:
+                yield rel, self.dirs[rel], True
+            yield from self._walk(children, rel, path_filter, child_selected)
+
+    def materialize(self, root: Path, strategy: str = "auto") -> int:
+        """Write the overlay's files into `root`; returns the number of files written."""
+        root.mkdir(parents=True, exist_ok=True)
+        made = {""}
+        for rel in sorted(self.dirs):
+            (root / rel).mkdir(parents=True, exist_ok=True)
+            made.add(rel)
+        for rel, src in self.files.items():
+            parent = _parent(rel)
+            if parent not in made:
+                (root / parent).mkdir(parents=True, exist_ok=True)
+                made.add(parent)
+            materialize_file(src, root / rel, strategy)
+        return len(self.files)
+
+
+class WorkTree:
+    """An artifact workdir: on disk at `path`, or virtual while `overlay` is set.
+
+    `realize` writes a virtual workdir to disk (once) for transforms and exports
+    that need real files.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        overlay: Overlay | None = None,
+        *,
+        strategy: str = "auto",
+        on_realize: Callable[[int], None] | None = None,
+    ) -> None:
+        self.path = path
+        self.overlay = overlay
+        self.strategy = strategy
+        self._on_realize = on_realize
+        self._lock = threading.Lock()
+
+    def realize(self) -> Path:
+        with self._lock:
+            if self.overlay is not None:
+                written = self.overlay.materialize(self.path, self.strategy)
+                self.overlay = None
+                if self._on_realize is not None:
+                    self._on_realize(written)
+        return self.path
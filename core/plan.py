@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from .history import BuildHistory, StepEstimate
+from .profiling import format_size
+from .runtime import ArtifactResult
+
+if TYPE_CHECKING:
+    from .interpreter import ConfigInterpreter
+
+# what a build would do with an artifact
+BUILD = "build"  # populate the workdir and run its transforms
+CACHED = "cached"  # restore the workdir from the cache
+REUSED = "reused"  # identical to an artifact planned earlier: built once
+
+
+@dataclass(slots=True)
+class PlannedStep:
+    kind: str  # "src", "transform", "export" or "cache"
+    name: str
+    spec: Any
+    estimate: StepEstimate | None = None
+    # only for exports: restored from the cache instead of written
+    cached: bool = False
+
+
+@dataclass(slots=True)
+class SourceInfo:
+    path: str
+    exists: bool
+    files: int
+    size: int
+
+
+@dataclass(slots=True)
+class PlannedArtifact:
+    target: str
+    name: str
+    depends_on: list[str]
+    status: str
+    key: str | None
+    sources: list[SourceInfo] = field(default_factory=list)
+    steps: list[PlannedStep] = field(default_factory=list)
+
+    @property
+    def estimate(self) -> float:
+        """Predicted wall time of the steps with a history (see `unknown_steps`)."""
+        return sum(step.estimate.wall for step in self.steps if step.estimate is not None)
+
+    @property
+    def unknown_steps(self) -> int:
+        return sum(1 for step in self.steps if step.estimate is None)
+
+
+@dataclass(slots=True)
+class BuildPlan:
+    artifacts: list[PlannedArtifact]
+
+    @property
+    def estimate(self) -> float:
+        return sum(artifact.estimate for artifact in self.artifacts)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "estimate": self.estimate,
+            "artifacts": [
+                {**asdict(artifact), "estimate": artifact.estimate, "unknown_steps": artifact.unknown_steps}
+                for artifact in self.artifacts
+            ],
+        }
+
+
+def _try_resolve(interpreter: ConfigInterpreter, value: Any, state: Any) -> Any:
+    # values referring to variables set during the build (e.g. `exports.*`) stay unresolved
+    try:
+        return interpreter._resolve_value(value, state)
+    except KeyError:
+        return value
+
+
+def _source_info(interpreter: ConfigInterpreter, raw: str) -> SourceInfo:
+    path = interpreter._resolve_path(raw)
+    index = interpreter.fs_index
+    if path.is_dir():
+        return SourceInfo(str(path), True, index.count_files(path), index.total_size(path))
+    if path.is_file():
+        return SourceInfo(str(path), True, 1, path.stat().st_size)
+    return SourceInfo(str(path), False, 0, 0)
+
+
+def plan_build(
+    interpreter: ConfigInterpreter, targets: list[str] | None = None, *, history: BuildHistory | None = None
+) -> BuildPlan:
+    """Describe what `interpreter.run(targets)` would do, without building anything.
+
+    Artifacts are listed in build order with their resolved steps, the size of
+    their local sources and, when `history` has samples, the expected duration
+    of each step. With a cache, artifacts whose key is already stored are
+    planned as restores.
+    """
+    interpreter.fs_index.invalidate()
+    plans, order, _ = interpreter._plan_graph(targets)
+    cache = interpreter.cache
+    planned_keys: set[str] = set()
+    planned_exports: set[str] = set()
+    artifacts: list[PlannedArtifact] = []
+
+    def estimate(target: str, artifact: str, kind: str, name: str) -> StepEstimate | None:
+        return history.estimate(target, artifact, kind, name) if history is not None else None
+
+    for target_name, artifact_name in order:
+        state = plans[target_name].state
+        spec = plans[target_name].artifacts[artifact_name]
+        key, cacheable = interpreter._artifact_key(spec, state)
+
+        resolved = _try_resolve(interpreter, spec, state)
+
+        if key is not None and key in planned_keys:
+            status = REUSED
+        elif key is not None and cacheable and cache is not None and cache.contains(key):
+            status = CACHED
+        else:
+            status = BUILD
+
+        planned = PlannedArtifact(
+            target=target_name,
+            name=artifact_name,
+            depends_on=interpreter._artifact_dependencies(artifact_name, plans[target_name].artifacts),
+            status=status,
+            key=key,
+            sources=[_source_info(interpreter, raw) for raw in interpreter.source_paths(resolved) if "{" not in raw],
+        )
+        if status == CACHED:
+            planned.steps.append(
+                PlannedStep("cache", "restore", None, estimate(target_name, artifact_name, "cache", "restore"))
+            )
+        elif status == BUILD:
+            if resolved.get("src") is not None:
+                planned.steps.append(
+                    PlannedStep("src", "src", resolved["src"], estimate(target_name, artifact_name, "src", "src"))
+                )
+            for transform in resolved.get("transforms") or []:
+                name = str(transform.get("id") or transform.get("type")) if isinstance(transform, dict) else "?"
+                planned.steps.append(
+                    PlannedStep("transform", name, transform, estimate(target_name, artifact_name, "transform", name))
+                )
+
+        output_key = None
+        export = resolved.get("export")
+        if isinstance(export, dict) and export.get("enabled", False):
+            export_keys = interpreter.export_keys(key, export)
+            output_key = export_keys.output
+            # the same export of an identical artifact is written once per build
+            if export_keys.build not in planned_exports:
+                if export_keys.build is not None:
+                    planned_exports.add(export_keys.build)
+                cached = status != BUILD and cache is not None and cache.contains(key, export_keys.cache)
+                # restoring a cached export copies a single file
+                if cached:
+                    expected = StepEstimate(0.0, 1, None, 0)
+                else:
+                    expected = estimate(target_name, artifact_name, "export", "export")
+                planned.steps.append(
+                    PlannedStep("export", Path(str(export.get("dest"))).name, export, expected, cached=cached)
+                )
+
+        if key is not None:
+            planned_keys.add(key)
+        # what `_artifact_key` needs from the dependencies of later artifacts
+        state.artifact_results[artifact_name] = ArtifactResult(
+            name=artifact_name, workdir=Path(), key=key, cacheable=cacheable, output_key=output_key
+        )
+        artifacts.append(planned)
+
+    return BuildPlan(artifacts)
+
+
+def _format_duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "?"
+    if seconds < 60:
+        return f"{seconds:.2f}s"
+    return f"{int(seconds // 60)}m{seconds % 60:04.1f}s"
+
+
+def _format_spec(spec: Any, limit: int = 100) -> str:
+    text = json.dumps(spec, sort_keys=True, separators=(",", ":"), default=str)
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def format_plan(plan: BuildPlan) -> str:
+    """Human-readable plan: one block per artifact in build order, then totals per target."""
+    lines: list[str] = []
+    totals: dict[str, list[float]] = {}
+    for artifact in plan.artifacts:
+        total = totals.setdefault(artifact.target, [0.0, 0])
+        total[0] += artifact.estimate
+        total[1] += artifact.unknown_steps
+        deps = ", ".join(artifact.depends_on) or "-"
+        key = artifact.key[:12] if artifact.key else "unknown"
+        lines.append(f"{artifact.target}/{artifact.name}  [{artifact.status}]  key={key}  depends_on={deps}")
+        for source in artifact.sources:
+            found = f"{source.files} files, {format_size(source.size)}" if source.exists else "missing"
+            lines.append(f"    source {source.path} ({found})")
+        for step in artifact.steps:
+            wall = _format_duration(step.estimate.wall if step.estimate is not None else None)
+            label = step.kind if step.name == step.kind else f"{step.kind} {step.name}"
+            label += " (cached)" if step.cached else ""
+            detail = f"  {_format_spec(step.spec)}" if step.spec is not None else ""
+            lines.append(f"    {wall:>8}  {label}{detail}")
+    lines.append("")
+    for target, (wall, unknown) in totals.items():
+        suffix = f" + {unknown} steps without history" if unknown else ""
+        lines.append(f"target={target}: ~{_format_duration(wall)}{suffix}")
+    lines.append(f"total (serial): ~{_format_duration(plan.estimate)}")
+    return "\n".join(lines)
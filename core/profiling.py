@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Iterator
+
+_PROC_IO = Path("/proc/self/io")
+
+
+def _read_io() -> tuple[int, int] | None:
+    """Bytes read and written through syscalls by this process so far (Linux only)."""
+    try:
+        fields = dict(line.split(": ", 1) for line in _PROC_IO.read_text().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _cpu_time() -> float:
+    children = os.times()
+    return time.process_time() + children.children_user + children.children_system
+
+
+def format_size(size: int | None) -> str:
+    if size is None:
+        return "-"
+    if size < 1024:
+        return f"{size}B"
+    value = size / 1024
+    for unit in ("K", "M"):
+        if value < 1024:
+            return f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.1f}G"
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    category: str
+    start: float
+    thread: int
+    depth: int = 0
+    args: dict[str, Any] = field(default_factory=dict)
+    wall: float = 0.0
+    cpu: float = 0.0
+    bytes_read: int | None = None
+    bytes_written: int | None = None
+    files: int = 0
+
+    @property
+    def label(self) -> str:
+        owner = "/".join(str(self.args[k]) for k in ("target", "artifact") if k in self.args)
+        if not owner:
+            return self.category if self.name == self.category else f"{self.category} {self.name}"
+        if self.args.get("artifact") == self.name:
+            return f"{self.category} {owner}"
+        return f"{self.category} {owner} {self.name}"
+
+
+class Profiler:
+    """Records timed spans of a build: wall time, CPU time, bytes read/written and files.
+
+    CPU time (including subprocesses waited for) and I/O (`/proc/self/io`) are
+    process-wide, so spans running concurrently with `-j` also see each other's work.
+    File counts are reported explicitly by the code doing the work (`count`).
+    """
+
+    def __init__(self, *, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self._spans: list[Span] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> list[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[Span | None]:
+        if not self.enabled:
+            yield None
+            return
+
+        stack = self._stack()
+        span = Span(
+            name=name,
+            category=category,
+            start=time.perf_counter() - self.origin,
+            thread=threading.get_ident(),
+            depth=len(stack),
+            args={k: v for k, v in args.items() if v is not None},
+        )
+        io_start = _read_io()
+        cpu_start = _cpu_time()
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            stack.pop()
+            span.wall = time.perf_counter() - self.origin - span.start
+            span.cpu = _cpu_time() - cpu_start
+            io_end = _read_io()
+            if io_start is not None and io_end is not None:
+                span.bytes_read = io_end[0] - io_start[0]
+                span.bytes_written = io_end[1] - io_start[1]
+            with self._lock:
+                self._spans.append(span)
+
+    def count(self, files: int) -> None:
+        """Add `files` to the innermost span open on this thread."""
+        if not self.enabled:
+            return
+        stack = self._stack()
+        if stack:
+            stack[-1].files += files
+
+    @property
+    def spans(self) -> list[Span]:
+        with self._lock:
+            return sorted(self._spans, key=lambda s: (s.start, s.depth))
+
+    def report(self) -> dict[str, Any]:
+        spans = self.spans
+        totals: dict[str, dict[str, Any]] = {}
+        for span in spans:
+            total = totals.setdefault(
+                span.category, {"count": 0, "wall": 0.0, "cpu": 0.0, "bytes_read": 0, "bytes_written": 0, "files": 0}
+            )
+            total["count"] += 1
+            total["wall"] += span.wall
+            total["cpu"] += span.cpu
+            total["bytes_read"] += span.bytes_read or 0
+            total["bytes_written"] += span.bytes_written or 0
+            total["files"] += span.files
+        return {"spans": [asdict(span) for span in spans], "totals": totals}
+
+    def chrome_trace(self) -> dict[str, Any]:
+        """Trace Event Format, for chrome://tracing or https://ui.perfetto.dev."""
+        pid = os.getpid()
+        threads: dict[int, int] = {}
+        events: list[dict[str, Any]] = []
+        for span in self.spans:
+            tid = threads.setdefault(span.thread, len(threads))
+            args = {**span.args, "cpu_s": round(span.cpu, 6), "files": span.files}
+            if span.bytes_read is not None:
+                args.update(bytes_read=span.bytes_read, bytes_written=span.bytes_written)
+            events.append(
+                {
+                    "name": span.label,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": round(span.start * 1e6, 3),
+                    "dur": round(span.wall * 1e6, 3),
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+        for tid in threads.values():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": f"worker-{tid}"}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def summary(self, limit: int = 25) -> str:
+        spans = sorted(self.spans, key=lambda s: s.wall, reverse=True)[:limit]
+        if not spans:
+            return "(no profiled steps)"
+        width = max(len(span.label) for span in spans)
+        lines = [f"{'step':<{width}}  {'wall s':>8}  {'cpu s':>8}  {'read':>8}  {'written':>8}  {'files':>7}"]
+        for span in spans:
+            lines.append(
+                f"{span.label:<{width}}  {span.wall:>8.3f}  {span.cpu:>8.3f}  {format_size(span.bytes_read):>8}"
+                f"  {format_size(span.bytes_written):>8}  {span.files:>7}"
+            )
+        return "\n".join(lines)
+
+    def write_trace(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.chrome_trace()), encoding="utf-8")
+
+    def write_report(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.report(), indent=2), encoding="utf-8")
@@ -2,7 +2,12 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any, Callable
+
+from config.templating import TemplateResolver
+
+if TYPE_CHECKING:
+    from .overlay import Overlay
 
 
 @dataclass(slots=True)
@@ -10,6 +15,26 @@ class ArtifactResult:
     name: str
     workdir: Path
     output_path: Path | None = None
+    # identity of the workdir contents / exported output, shared by equivalent artifacts
+    key: str | None = None
+    output_key: str | None = None
+    cacheable: bool = False
+    # deferred workdir population (e.g. a cache restore), run before the workdir is read
+    prepare: Callable[[], None] | None = None
+    # contents of a virtual workdir (`prepare` writes them to `workdir`)
+    overlay: Overlay | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class ExportKeys:
+    """Identity of an artifact's export (see `ConfigInterpreter.export_keys`)."""
+
+    # cache entry of the export below the artifact's entry (`ArtifactCache.get_output`)
+    cache: str
+    # what artifacts referencing the export depend on (`ArtifactResult.output_key`); None without an artifact key
+    output: str | None
+    # exports written once per build: same artifact and same export, `dest` included
+    build: str | None
 
 
 @dataclass(slots=True)
@@ -18,6 +43,10 @@ class InterpreterState:
     target_name: str
     scope: dict[str, Any]
     artifact_results: dict[str, ArtifactResult] = field(default_factory=dict)
+    templates: TemplateResolver = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.templates = TemplateResolver(self.scope)
 
     @property
     def config_dir(self) -> Path:
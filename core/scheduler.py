@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Callable, Generic, Hashable, Iterable, TypeVar
+
+T = TypeVar("T")
+N = TypeVar("N", bound=Hashable)
+
+
+class DependencyCycleError(ValueError):
+    def __init__(self, cycle: list) -> None:
+        self.cycle = cycle
+        super().__init__(f"Dependency cycle detected: {' -> '.join(map(str, cycle))}")
+
+
+def topological_order(roots: Iterable[N], dependencies_of: Callable[[N], list[N]]) -> list[N]:
+    """Return `roots` and their transitive dependencies, dependencies first."""
+    order: list[N] = []
+    done: set[N] = set()
+    visiting: list[N] = []
+
+    def visit(node: N) -> None:
+        if node in done:
+            return
+        if node in visiting:
+            raise DependencyCycleError([*visiting[visiting.index(node) :], node])
+
+        visiting.append(node)
+        for dep in dependencies_of(node):
+            visit(dep)
+        visiting.pop()
+
+        done.add(node)
+        order.append(node)
+
+    for root in roots:
+        visit(root)
+    return order
+
+
+def run_graph(
+    order: list[N],
+    dependencies_of: Callable[[N], list[N]],
+    fn: Callable[[N], T],
+    *,
+    jobs: int = 1,
+) -> dict[N, T]:
+    """Run `fn` for every node of `order`, never before its dependencies finished.
+
+    `order` must be topologically sorted (see `topological_order`). Independent
+    nodes run concurrently on at most `jobs` threads. The first failure stops
+    scheduling new nodes and is re-raised once running nodes have settled.
+    """
+    results: dict[N, T] = {}
+    if jobs <= 1:
+        for node in order:
+            results[node] = fn(node)
+        return results
+
+    pending_deps = {node: set(dependencies_of(node)) for node in order}
+    dependents: dict[N, list[N]] = {node: [] for node in order}
+    for node, deps in pending_deps.items():
+        for dep in deps:
+            dependents[dep].append(node)
+
+    ready = [node for node in order if not pending_deps[node]]
+    running: dict[Future[T], N] = {}
+    error: BaseException | None = None
+
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="mapack") as pool:
+        while ready or running:
+            while ready and error is None:
+                node = ready.pop(0)
+                running[pool.submit(fn, node)] = node
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                exc = future.exception()
+                if exc is not None:
+                    error = error or exc
+                    continue
+                results[node] = future.result()
+                for dependent in dependents[node]:
+                    pending_deps[dependent].discard(node)
+                    if not pending_deps[dependent]:
+                        ready.append(dependent)
+
+    if error is not None:
+        raise error
+    return results
+
+
+class OnceMap(Generic[T]):
+    """Run a computation at most once per key; concurrent callers share its outcome."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._futures: dict[Hashable, Future[T]] = {}
+
+    def get_or_run(self, key: Hashable, fn: Callable[[], T]) -> tuple[T, bool]:
+        """Return `(value, ran)` where `ran` tells whether this call computed the value."""
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = self._futures[key] = Future()
+
+        if not owner:
+            return future.result(), False
+
+        try:
+            value = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        future.set_result(value)
+        return value, True
+
+
+def once(fn: Callable[[], None]) -> Callable[[], None]:
+    """Wrap `fn` so that it runs a single time, even when called from several threads."""
+    lock = Lock()
+    done = False
+
+    def wrapper() -> None:
+        nonlocal done
+        with lock:
+            if not done:
+                fn()
+                done = True
+
+    return wrapper
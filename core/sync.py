@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+
+from .globs import PathFilter
+from .materialize import materialize_file, materialize_tree
+
+SYNC_MODES = ("mtime", "hash", "full")
+
+
+@dataclass(slots=True)
+class SyncStats:
+    copied: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+
+
+def _file_digest(path: str) -> bytes:
+    digest = hashlib.blake2b()
+    with open(path, "rb") as fh:
+        while chunk := fh.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _same_file(src: os.DirEntry, dest: Path, compare: str) -> bool:
+    try:
+        dest_stat = dest.stat(follow_symlinks=False)
+    except FileNotFoundError:
+        return False
+    src_stat = src.stat()
+    if not dest.is_file() or dest.is_symlink() or dest_stat.st_size != src_stat.st_size:
+        return False
+    if compare == "hash":
+        return _file_digest(src.path) == _file_digest(str(dest))
+    return dest_stat.st_mtime_ns == src_stat.st_mtime_ns
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    else:
+        path.unlink()
+
+
+def sync_tree(
+    src: Path,
+    dest: Path,
+    *,
+    compare: str = "mtime",
+    stats: SyncStats | None = None,
+    path_filter: PathFilter | None = None,
+) -> SyncStats:
+    """Make `dest` mirror `src`, only writing files that differ and deleting stale ones.
+
+    Files are considered unchanged when their sizes match and either their
+    modification times (`mtime`) or their contents (`hash`) do. Written files
+    keep the source mtime, so a later `mtime` sync recognizes them. With
+    `path_filter`, `dest` mirrors the selected files only.
+    """
+    stats = stats if stats is not None else SyncStats()
+    if dest.exists() and not dest.is_dir():
+        dest.unlink()
+    dest.mkdir(parents=True, exist_ok=True)
+    selected = path_filter.root_selected if path_filter is not None else True
+    _sync(src, dest, compare, stats, path_filter, "", selected)
+    return stats
+
+
+def _sync(
+    src: Path, dest: Path, compare: str, stats: SyncStats, path_filter: PathFilter | None, prefix: str, selected: bool
+) -> None:
+    with os.scandir(src) as it:
+        entries = list(it)
+    wanted: set[str] = set()
+    for entry in entries:
+        rel_path = prefix + entry.name
+        target = dest / entry.name
+        if entry.is_dir():
+            child_selected = selected
+            if path_filter is not None:
+                descend, child_selected = path_filter.enter(rel_path, selected)
+                if not descend:
+                    continue
+            if target.is_symlink() or (target.exists() and not target.is_dir()):
+                _remove(target)
+                stats.deleted += 1
+            target.mkdir(exist_ok=True)
+            _sync(Path(entry.path), target, compare, stats, path_filter, rel_path + "/", child_selected)
+            if not child_selected and not any(target.iterdir()):
+                # only walked for selected files below it, and there were none
+                target.rmdir()
+                continue
+            wanted.add(entry.name)
+        elif path_filter is not None and not path_filter.keep(rel_path, selected):
+            continue
+        elif _same_file(entry, target, compare):
+            wanted.add(entry.name)
+            stats.unchanged += 1
+        else:
+            wanted.add(entry.name)
+            if target.is_dir() and not target.is_symlink():
+                shutil.rmtree(target)
+                stats.deleted += 1
+            materialize_file(Path(entry.path), target, "auto")
+            stats.copied += 1
+
+    with os.scandir(dest) as it:
+        stale = [Path(e.path) for e in it if e.name not in wanted]
+    for path in stale:
+        _remove(path)
+        stats.deleted += 1
+
+
+def sync_tree_atomic(
+    src: Path, dest: Path, *, compare: str = "mtime", path_filter: PathFilter | None = None
+) -> SyncStats:
+    """Like `sync_tree`, but prepare the result in a staging directory and swap it in.
+
+    The staging directory starts as hardlinks of the current `dest` (files are
+    replaced, never written through), so readers of `dest` never observe a
+    half-synced tree; only the two final renames are visible.
+    """
+    staging = dest.with_name(f".{dest.name}.mapack-staging")
+    previous = dest.with_name(f".{dest.name}.mapack-previous")
+    for leftover in (staging, previous):
+        if leftover.exists():
+            _remove(leftover)
+
+    if dest.is_dir():
+        materialize_tree(dest, staging, "hardlink")
+    stats = sync_tree(src, staging, compare=compare, path_filter=path_filter)
+
+    if dest.exists():
+        os.replace(dest, previous)
+    os.replace(staging, dest)
+    if previous.exists():
+        _remove(previous)
+    return stats
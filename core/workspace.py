@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import shutil
+import threading
+from pathlib import Path
+
+
+class Workspace:
+    """Workdirs and exports kept between the builds of a long-running process (`mapack watch`/`serve`).
+
+    Builds place their workdirs under `root` instead of a temporary directory.
+    A workdir whose artifact key is unchanged since it was last populated is
+    reused as-is, and exports whose artifact and export options are unchanged
+    are not written again.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self._workdirs: dict[Path, str] = {}
+        self._exports: dict[Path, tuple[str, str, dict[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    def holds(self, workdir: Path, key: str) -> bool:
+        with self._lock:
+            return self._workdirs.get(workdir) == key and workdir.is_dir()
+
+    def reset(self, workdir: Path) -> None:
+        """Empty `workdir` before it is populated again."""
+        with self._lock:
+            self._workdirs.pop(workdir, None)
+        shutil.rmtree(workdir, ignore_errors=True)
+        workdir.mkdir(parents=True, exist_ok=True)
+
+    def record(self, workdir: Path, key: str) -> None:
+        with self._lock:
+            self._workdirs[workdir] = key
+
+    def exported(self, dest: Path, key: str, output_key: str) -> dict[str, str] | None:
+        """The digests recorded with the export written to `dest` if it is up to date, else None.
+
+        `dest` is the path actually written (e.g. the archive), which must still exist.
+        """
+        with self._lock:
+            recorded = self._exports.get(dest)
+        if recorded is None or recorded[:2] != (key, output_key) or not dest.exists():
+            return None
+        return recorded[2]
+
+    def record_export(self, dest: Path, key: str, output_key: str, digests: dict[str, str]) -> None:
+        with self._lock:
+            self._exports[dest] = (key, output_key, digests)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._workdirs.clear()
+            self._exports.clear()
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import io
+import zipfile
+import zlib
+from pathlib import Path
+
+import pytest
+
+from core.archive import (
+    DEFLATED,
+    STORED,
+    CompressionRule,
+    RawRange,
+    ZipEntry,
+    ZipWriter,
+    parse_compression,
+    rule_for,
+    write_zip,
+)
+
+
+def _tree(root: Path, files: dict[str, bytes]) -> Path:
+    for rel, data in files.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return root
+
+
+FILES = {
+    "level.dat": b"\x0a" * 2000,
+    "region/r.0.0.mca": bytes(range(256)) * 64,
+    "data/pack.mcmeta": b'{"pack": {"pack_format": 15}}',
+    "data/functions/load.mcfunction": b"say hello\n" * 100,
+}
+
+
+def test_parse_compression() -> None:
+    rules = parse_compression({"*.mca": "store", "*.json": "deflate:9"})
+    assert rules == (
+        CompressionRule("*.mca", STORED, 6),
+        CompressionRule("*.json", DEFLATED, 9),
+        CompressionRule("**", DEFLATED, 6),
+    )
+    assert rule_for("region/r.0.0.mca", rules).method == STORED
+    assert rule_for("assets/x.json", rules).level == 9
+    assert rule_for("level.dat", rules) == CompressionRule("**")
+
+    listed = parse_compression([{"glob": "*.png", "method": "store"}])
+    assert listed[0] == CompressionRule("*.png", STORED, 6)
+
+
+@pytest.mark.parametrize("spec", [{"*.mca": "lzma"}, {"*.mca": "deflate:10"}, [{"method": "store"}], "store"])
+def test_parse_compression_rejects_invalid_settings(spec) -> None:
+    with pytest.raises(ValueError):
+        parse_compression(spec)
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_write_zip_round_trip(tmp_path: Path, jobs: int) -> None:
+    source = _tree(tmp_path / "src", FILES)
+    rules = parse_compression({"*.mca": "store"})
+    result = write_zip(source, tmp_path / "out.zip", compression=rules, jobs=jobs, digests=("sha1",))
+
+    with zipfile.ZipFile(result.path) as zf:
+        assert zf.testzip() is None
+        infos = {info.filename: info for info in zf.infolist() if not info.is_dir()}
+        assert sorted(infos) == sorted(FILES)
+        for rel, data in FILES.items():
+            assert zf.read(rel) == data
+            assert infos[rel].CRC == zlib.crc32(data)
+        assert infos["region/r.0.0.mca"].compress_type == STORED
+        assert infos["level.dat"].compress_type == DEFLATED
+        assert infos["level.dat"].compress_size < len(FILES["level.dat"])
+    assert result.size == result.path.stat().st_size
+    assert len(result.digests["sha1"]) == 40
+    assert not list(tmp_path.glob(".*.partial"))
+
+
+def test_zip_writer_switches_to_zip64_past_the_entry_limit() -> None:
+    buffer = io.BytesIO()
+    writer = ZipWriter(buffer)
+    count = 0x10000
+    for i in range(count):
+        writer.add(ZipEntry(name=f"{i}.txt"))
+    writer.close()
+
+    assert b"PK\x06\x06" in buffer.getvalue()[-200:]
+    with zipfile.ZipFile(buffer) as zf:
+        names = zf.namelist()
+    assert len(names) == count
+    assert names[-1] == f"{count - 1}.txt"
+
+
+def test_reproducible_archives_are_byte_identical(tmp_path: Path) -> None:
+    first = _tree(tmp_path / "a", FILES)
+    second = _tree(tmp_path / "b", FILES)
+    (second / "level.dat").chmod(0o600)
+    (second / "data/functions/load.mcfunction").chmod(0o755)
+    (first / "data/functions/load.mcfunction").chmod(0o700)
+
+    a = write_zip(first, tmp_path / "a.zip", reproducible=True, source_date_epoch=1700000000, jobs=1)
+    b = write_zip(second, tmp_path / "b.zip", reproducible=True, source_date_epoch=1700000000, jobs=4)
+    assert a.path.read_bytes() == b.path.read_bytes()
+
+    with zipfile.ZipFile(a.path) as zf:
+        info = zf.getinfo("data/functions/load.mcfunction")
+        assert info.date_time == (2023, 11, 14, 22, 13, 20)
+        assert info.external_attr >> 16 == 0o100755
+        assert zf.getinfo("level.dat").external_attr >> 16 == 0o100644
+
+
+def test_reproducible_archive_is_kept_when_unchanged(tmp_path: Path) -> None:
+    source = _tree(tmp_path / "src", FILES)
+    first = write_zip(source, tmp_path / "out.zip", reproducible=True, digests=("sha256",))
+    mtime = first.path.stat().st_mtime_ns
+
+    again = write_zip(source, tmp_path / "out.zip", reproducible=True, keep_if_sha256=first.digests["sha256"])
+    assert not again.replaced
+    assert again.digests["sha256"] == first.digests["sha256"]
+    assert first.path.stat().st_mtime_ns == mtime
+
+
+def test_zip_writer_copies_raw_ranges(tmp_path: Path) -> None:
+    data = b"minecraft " * 500
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    blob = tmp_path / "blob"
+    blob.write_bytes(b"garbage" + deflated + b"trailer")
+
+    buffer = io.BytesIO()
+    writer = ZipWriter(buffer)
+    entry = ZipEntry("a.txt", DEFLATED, zlib.crc32(data), len(deflated), len(data))
+    writer.add(entry, RawRange(blob, len(b"garbage"), len(deflated)))
+    writer.close()
+    with zipfile.ZipFile(buffer) as zf:
+        assert zf.read("a.txt") == data
+
+    with pytest.raises(ValueError):
+        ZipWriter(io.BytesIO()).add(ZipEntry("b.txt"), RawRange(blob, blob.stat().st_size - 3, 10))
+
+
+def test_incremental_export_reuses_unchanged_entries(tmp_path: Path) -> None:
+    source = _tree(tmp_path / "src", FILES)
+    rules = parse_compression({"*.mca": "store"})
+    zip_path = tmp_path / "out.zip"
+    first = write_zip(source, zip_path, compression=rules, incremental=True)
+    assert first.reused == 0
+
+    # same size, different contents: caught by the CRC
+    (source / "level.dat").write_bytes(b"\x0b" * 2000)
+    (source / "data/new.json").write_bytes(b"{}")
+    second = write_zip(source, zip_path, compression=rules, incremental=True)
+    # pack.mcmeta and load.mcfunction; stored entries are never reused
+    assert second.reused == 2
+
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.testzip() is None
+        assert zf.read("level.dat") == b"\x0b" * 2000
+        assert zf.read("data/new.json") == b"{}"
+        assert zf.read("data/functions/load.mcfunction") == FILES["data/functions/load.mcfunction"]
+
+
+def test_incremental_export_ignores_archives_with_other_settings(tmp_path: Path) -> None:
+    source = _tree(tmp_path / "src", FILES)
+    zip_path = tmp_path / "out.zip"
+    write_zip(source, zip_path, incremental=True)
+
+    result = write_zip(source, zip_path, compression=parse_compression({"**": "deflate:9"}), incremental=True)
+    assert result.reused == 0
+    assert write_zip(source, zip_path, incremental=False).reused == 0
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from config.parser import ConfigSyntaxError, _strip_jsonc, load_json_or_jsonc
+
+
+def _load(tmp_path: Path, text: str, **kwargs) -> dict:
+    path = tmp_path / "config.jsonc"
+    path.write_text(text, encoding="utf-8")
+    return load_json_or_jsonc(path, **kwargs)
+
+
+def test_plain_json(tmp_path: Path) -> None:
+    assert _load(tmp_path, '{"a": [1, 2], "b": {"c": null}}') == {"a": [1, 2], "b": {"c": None}}
+
+
+def test_comments_and_trailing_commas(tmp_path: Path) -> None:
+    text = """{
+        // line comment
+        "a": [1, 2, /* inline */ 3,],
+        /* block
+           comment */
+        "b": {"c": true,}, // after
+    }"""
+    assert _load(tmp_path, text) == {"a": [1, 2, 3], "b": {"c": True}}
+
+
+def test_comment_markers_in_strings_are_kept(tmp_path: Path) -> None:
+    text = '{"url": "https://example.com/a", "glob": "a/*.json", "s": "x,]", "q": "\\"//\\""} // c'
+    assert _load(tmp_path, text) == {"url": "https://example.com/a", "glob": "a/*.json", "s": "x,]", "q": '"//"'}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"a": 1, // list of [things]\n "b": 2}',
+        '{"a": 1, // closing }\n "b": 2}',
+        '{"a": [1, // ]\n 2]}',
+        '{"a": 1, /* not ] trailing */ "b": 2}',
+    ],
+)
+def test_brackets_in_comments_do_not_make_commas_trailing(tmp_path: Path, text: str) -> None:
+    data = _load(tmp_path, text)
+    assert data.get("b", 2) == 2
+    assert data["a"] in (1, [1, 2])
+
+
+def test_trailing_comma_before_comment_and_bracket(tmp_path: Path) -> None:
+    assert _load(tmp_path, '{"a": [1, 2, // last\n ],\n}') == {"a": [1, 2]}
+
+
+def test_stripping_preserves_positions() -> None:
+    text = '{\n  "a": 1, // c\n  /* x\n y */ "b": 2,\n}'
+    stripped = _strip_jsonc(text)
+    assert len(stripped) == len(text)
+    assert [i for i, ch in enumerate(stripped) if ch == "\n"] == [i for i, ch in enumerate(text) if ch == "\n"]
+    assert json.loads(stripped) == {"a": 1, "b": 2}
+
+
+def test_syntax_error_points_into_the_original_text(tmp_path: Path) -> None:
+    with pytest.raises(ConfigSyntaxError) as info:
+        _load(tmp_path, '{\n  // comment\n  "a": 1\n  "b": 2\n}')
+    assert (info.value.line, info.value.column) == (4, 3)
+
+
+def test_unterminated_string(tmp_path: Path) -> None:
+    with pytest.raises(ConfigSyntaxError):
+        _load(tmp_path, '{"a": "open, // ]\n}')
+
+
+def test_top_level_must_be_an_object(tmp_path: Path) -> None:
+    with pytest.raises(ValueError):
+        _load(tmp_path, "[1, 2]")
+
+
+def test_parse_cache(tmp_path: Path) -> None:
+    cache_dir = tmp_path / "cache"
+    assert _load(tmp_path, '{"a": 1,}', cache_dir=cache_dir, update_cache=False) == {"a": 1}
+    assert not cache_dir.exists()
+    assert _load(tmp_path, '{"a": 1,}', cache_dir=cache_dir) == {"a": 1}
+    assert len(list(cache_dir.glob("*.marshal"))) == 1
+    # a different content is another entry
+    assert _load(tmp_path, '{"a": 2,}', cache_dir=cache_dir) == {"a": 2}
+    assert len(list(cache_dir.glob("*.marshal"))) == 2
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from core.scheduler import DependencyCycleError, OnceMap, once, run_graph, topological_order
+
+GRAPH = {
+    "export": ["world", "rp"],
+    "world": ["base"],
+    "rp": ["base"],
+    "base": [],
+    "unrelated": [],
+}
+
+
+def _deps(node: str) -> list[str]:
+    return GRAPH[node]
+
+
+def _assert_dependencies_first(order: list[str]) -> None:
+    for node in order:
+        for dep in _deps(node):
+            assert order.index(dep) < order.index(node)
+
+
+def test_topological_order_lists_dependencies_first() -> None:
+    order = topological_order(["export"], _deps)
+    assert sorted(order) == ["base", "export", "rp", "world"]
+    _assert_dependencies_first(order)
+
+
+def test_topological_order_visits_shared_dependencies_once() -> None:
+    order = topological_order(["world", "rp", "export", "unrelated"], _deps)
+    assert len(order) == len(set(order)) == 5
+    _assert_dependencies_first(order)
+
+
+@pytest.mark.parametrize(
+    ("graph", "cycle"),
+    [
+        ({"a": ["a"]}, ["a", "a"]),
+        ({"a": ["b"], "b": ["c"], "c": ["a"]}, ["a", "b", "c", "a"]),
+        ({"root": ["a"], "a": ["b"], "b": ["a"]}, ["a", "b", "a"]),
+    ],
+)
+def test_topological_order_reports_cycles(graph: dict[str, list[str]], cycle: list[str]) -> None:
+    with pytest.raises(DependencyCycleError) as info:
+        topological_order(list(graph), graph.__getitem__)
+    assert info.value.cycle == cycle
+    assert isinstance(info.value, ValueError)
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_run_graph_runs_every_node_after_its_dependencies(jobs: int) -> None:
+    order = topological_order(list(GRAPH), _deps)
+    finished: list[str] = []
+    lock = threading.Lock()
+
+    def fn(node: str) -> str:
+        with lock:
+            assert all(dep in finished for dep in _deps(node))
+        time.sleep(0.01)
+        with lock:
+            finished.append(node)
+        return node.upper()
+
+    results = run_graph(order, _deps, fn, jobs=jobs)
+    assert results == {node: node.upper() for node in GRAPH}
+    _assert_dependencies_first(finished)
+
+
+def test_run_graph_runs_independent_nodes_concurrently() -> None:
+    graph = {name: [] for name in "abcd"}
+    barrier = threading.Barrier(4, timeout=5)
+    # deadlocks (and times out) unless all four run at the same time
+    run_graph(list(graph), graph.__getitem__, lambda node: barrier.wait(), jobs=4)
+
+
+def test_run_graph_stops_scheduling_after_a_failure() -> None:
+    graph = {"fails": [], "dependent": ["fails"]}
+    ran: list[str] = []
+
+    def fn(node: str) -> None:
+        ran.append(node)
+        if node == "fails":
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        run_graph(["fails", "dependent"], graph.__getitem__, fn, jobs=2)
+    assert ran == ["fails"]
+
+
+def test_once_map_runs_each_key_once_across_threads() -> None:
+    once_map: OnceMap[int] = OnceMap()
+    calls: list[str] = []
+    results: list[tuple[int, bool]] = []
+
+    def compute() -> int:
+        calls.append("run")
+        time.sleep(0.05)
+        return 42
+
+    threads = [threading.Thread(target=lambda: results.append(once_map.get_or_run("key", compute))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["run"]
+    assert sorted(results) == [(42, False)] * 7 + [(42, True)]
+
+
+def test_once_map_shares_failures() -> None:
+    once_map: OnceMap[int] = OnceMap()
+
+    def fail() -> int:
+        raise KeyError("missing")
+
+    with pytest.raises(KeyError):
+        once_map.get_or_run("key", fail)
+    with pytest.raises(KeyError):
+        once_map.get_or_run("key", lambda: 1)
+
+
+def test_once() -> None:
+    calls: list[int] = []
+    wrapped = once(lambda: calls.append(1))
+    wrapped()
+    wrapped()
+    assert calls == [1]
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import pytest
+
+from config.templating import VariableCycleError, get_dotted, lazy_scope, render_template
+
+
+def _variables() -> dict:
+    return {"v": "1.0", "map": {"name": "Skyblock", "version": "2.1", "meta": {"author": "Steve"}}}
+
+
+def test_precomputed_vars_may_reference_later_ones() -> None:
+    scope = lazy_scope(
+        _variables(),
+        {"map.title": "{map.name} {map.semver}", "map.semver": "v{map.version}", "zip": "{map.title}.zip"},
+    )
+    assert render_template("{zip}", scope) == "Skyblock v2.1.zip"
+    assert get_dotted(scope, "map.semver") == "v2.1"
+
+
+def test_self_reference_sees_the_shadowed_value() -> None:
+    scope = lazy_scope(_variables(), {"a": "{v}", "v": "{v}-beta", "map.version": "{map.version}.1"})
+    assert render_template("{a} {v}", scope) == "1.0-beta 1.0-beta"
+    assert get_dotted(scope, "map.version") == "2.1.1"
+
+
+@pytest.mark.parametrize(
+    ("precomputed", "cycle"),
+    [
+        ({"a": "{b}", "b": "{a}"}, ["a", "b", "a"]),
+        ({"a": "x{b}", "b": "{c}", "c": "{a}"}, ["a", "b", "c", "a"]),
+        # without a variable to shadow, a self-reference is a cycle too
+        ({"new": "{new}!"}, ["new", "new"]),
+    ],
+)
+def test_cycles_are_reported(precomputed: dict, cycle: list[str]) -> None:
+    scope = lazy_scope(_variables(), precomputed)
+    with pytest.raises(VariableCycleError) as info:
+        render_template(f"{{{next(iter(precomputed))}}}", scope)
+    assert info.value.cycle == cycle
+    assert isinstance(info.value, ValueError)
+
+
+def test_unused_vars_are_never_rendered() -> None:
+    scope = lazy_scope(_variables(), {"broken": "{does.not.exist}", "loop": "{loop2}", "loop2": "{loop}", "ok": "{v}"})
+    assert render_template("{ok}", scope) == "1.0"
+    with pytest.raises(KeyError):
+        render_template("{broken}", scope)
+
+
+def test_variables_are_not_modified() -> None:
+    variables = _variables()
+    scope = lazy_scope(variables, {"map.version": "{map.version}-rc", "map.meta.pack": "{map.name}", "extra.a": "1"})
+    assert render_template("{map.version} {map.meta.pack} {map.meta.author}", scope) == "2.1-rc Skyblock Steve"
+    assert variables == _variables()
+    # untouched subtrees are shared rather than copied
+    scope_only = lazy_scope(variables, {"x": "{v}"})
+    assert scope_only["map"] is variables["map"]
+
+
+def test_non_string_values_are_set_as_is() -> None:
+    scope = lazy_scope(_variables(), {"map.flags": {"hardcore": True}, "count": 3})
+    assert render_template("{map.flags.hardcore} {count}", scope) == "True 3"
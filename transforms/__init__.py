@@ -1,13 +1,14 @@
-from .registry import registry
+from .registry import BUILTIN_TRANSFORMS, ENTRY_POINT_GROUP, registry
 
 
 def load_builtin_transforms() -> None:
-    # import side-effects for registration
-    from . import conditional  # noqa: F401
-    from . import copy  # noqa: F401
-    from . import git_ops  # noqa: F401
-    from . import log  # noqa: F401
-    from . import mc_feature  # noqa: F401
+    """Import every built-in transform module now.
 
+    Not needed: built-in transforms are registered lazily and imported on first
+    use. Kept for callers that expect them all to be loaded.
+    """
+    for name in BUILTIN_TRANSFORMS:
+        registry.info(name)
 
-__all__ = ["registry", "load_builtin_transforms"]
+
+__all__ = ["registry", "load_builtin_transforms", "ENTRY_POINT_GROUP"]
@@ -0,0 +1,348 @@
+from __future__ import annotations
+
+import gzip
+import multiprocessing
+import os
+import re
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+# Anvil region files (r.<x>.<z>.mca): a 4 KiB table of chunk locations, a 4 KiB table of
+# timestamps, then chunks aligned on 4 KiB sectors, each stored as
+# <u32 length><u8 compression><payload>. Chunks too large for 255 sectors live in
+# c.<x>.<z>.mcc files next to the region, flagged by the high bit of the compression byte.
+
+SECTOR_SIZE = 4096
+_HEADER_SIZE = 2 * SECTOR_SIZE
+_MAX_SECTORS = 0xFF
+
+_GZIP = 1
+_ZLIB = 2
+_UNCOMPRESSED = 3
+_EXTERNAL = 0x80
+
+_REGION_NAME = re.compile(r"r\.(-?\d+)\.(-?\d+)\.mca")
+# region folders sharing the chunk layout of `region/`
+_COMPANION_DIRS = ("entities", "poi")
+
+_FINISHED_STATUSES = {"full", "minecraft:full", "postprocessed", "fullchunk"}
+
+_U16 = struct.Struct(">H")
+_I32 = struct.Struct(">i")
+_U32 = struct.Struct(">I")
+_I64 = struct.Struct(">q")
+_FIXED_TAG_SIZES = {1: 1, 2: 2, 3: 4, 4: 8, 5: 4, 6: 8}
+_ARRAY_ITEM_SIZES = {7: 1, 11: 4, 12: 8}
+
+
+@dataclass(slots=True)
+class RegionOptions:
+    # chunks with a lower InhabitedTime (ticks players spent in them) are dropped
+    min_inhabited_time: int = 0
+    # drop chunks whose generation never reached the `full` status
+    drop_unfinished: bool = False
+    # inclusive chunk coordinates (min_x, min_z, max_x, max_z) of the chunks to keep
+    bounds: tuple[int, int, int, int] | None = None
+    # zlib level used to recompress chunks, None keeps the stored bytes
+    recompress_level: int | None = None
+
+    @property
+    def inspects_chunks(self) -> bool:
+        return self.min_inhabited_time > 0 or self.drop_unfinished
+
+
+@dataclass(slots=True)
+class RegionStats:
+    files: int = 0
+    removed_files: int = 0
+    chunks: int = 0
+    kept_chunks: int = 0
+    size_before: int = 0
+    size_after: int = 0
+
+    def add(self, other: "RegionStats") -> None:
+        self.files += other.files
+        self.removed_files += other.removed_files
+        self.chunks += other.chunks
+        self.kept_chunks += other.kept_chunks
+        self.size_before += other.size_before
+        self.size_after += other.size_after
+
+
+@dataclass(slots=True)
+class _Chunk:
+    compression: int
+    payload: bytes
+    timestamp: int
+
+
+def _skip_tag(data: bytes, pos: int, tag: int) -> int:
+    size = _FIXED_TAG_SIZES.get(tag)
+    if size is not None:
+        return pos + size
+    item_size = _ARRAY_ITEM_SIZES.get(tag)
+    if item_size is not None:
+        return pos + 4 + _I32.unpack_from(data, pos)[0] * item_size
+    if tag == 8:
+        return pos + 2 + _U16.unpack_from(data, pos)[0]
+    if tag == 9:
+        item = data[pos]
+        count = _I32.unpack_from(data, pos + 1)[0]
+        pos += 5
+        if count <= 0:
+            return pos
+        size = _FIXED_TAG_SIZES.get(item)
+        if size is not None:
+            return pos + count * size
+        for _ in range(count):
+            pos = _skip_tag(data, pos, item)
+        return pos
+    if tag == 10:
+        while (child := data[pos]) != 0:
+            pos = _skip_tag(data, pos + 3 + _U16.unpack_from(data, pos + 1)[0], child)
+        return pos + 1
+    raise ValueError(f"Invalid NBT tag type: {tag}")
+
+
+def _scan_compound(data: bytes, pos: int, found: dict[str, object]) -> int:
+    while (tag := data[pos]) != 0:
+        name_length = _U16.unpack_from(data, pos + 1)[0]
+        name = data[pos + 3 : pos + 3 + name_length]
+        pos += 3 + name_length
+        if tag == 4 and name == b"InhabitedTime":
+            found["InhabitedTime"] = _I64.unpack_from(data, pos)[0]
+        elif tag == 8 and name == b"Status":
+            length = _U16.unpack_from(data, pos)[0]
+            found["Status"] = data[pos + 2 : pos + 2 + length].decode("utf-8", "replace")
+        elif tag == 10 and name == b"Level":
+            # chunks written before 1.18 nest their data in a `Level` compound
+            pos = _scan_compound(data, pos, found)
+            if len(found) == 2:
+                return pos
+            continue
+        if len(found) == 2:
+            return pos
+        pos = _skip_tag(data, pos, tag)
+    return pos + 1
+
+
+def chunk_fields(nbt: bytes) -> dict[str, object]:
+    """Read `InhabitedTime` and `Status` from uncompressed chunk NBT, skipping everything else."""
+    if not nbt or nbt[0] != 10:
+        raise ValueError("Chunk NBT does not start with a compound tag")
+    found: dict[str, object] = {}
+    _scan_compound(nbt, 3 + _U16.unpack_from(nbt, 1)[0], found)
+    return found
+
+
+def _decompress(compression: int, payload: bytes) -> bytes | None:
+    if compression == _ZLIB:
+        return zlib.decompress(payload)
+    if compression == _GZIP:
+        return gzip.decompress(payload)
+    if compression == _UNCOMPRESSED:
+        return payload
+    # LZ4 (1.20.5+) and custom algorithms
+    return None
+
+
+def _read_region(data: bytes) -> dict[int, _Chunk]:
+    chunks: dict[int, _Chunk] = {}
+    if len(data) < _HEADER_SIZE:
+        return chunks
+    for index in range(1024):
+        location = _U32.unpack_from(data, index * 4)[0]
+        offset, sectors = location >> 8, location & 0xFF
+        if offset < 2 or sectors == 0:
+            continue
+        start = offset * SECTOR_SIZE
+        if start + 5 > len(data):
+            continue
+        length = _U32.unpack_from(data, start)[0]
+        # Minecraft treats chunks pointing past the end of the file as missing
+        if length == 0 or start + 4 + length > len(data):
+            continue
+        chunks[index] = _Chunk(
+            compression=data[start + 4],
+            payload=data[start + 5 : start + 4 + length],
+            timestamp=_U32.unpack_from(data, SECTOR_SIZE + index * 4)[0],
+        )
+    return chunks
+
+
+def _encode_region(chunks: dict[int, _Chunk]) -> bytes | None:
+    header = bytearray(_HEADER_SIZE)
+    body = bytearray()
+    sector = 2
+    for index in sorted(chunks):
+        chunk = chunks[index]
+        record = _U32.pack(len(chunk.payload) + 1) + bytes((chunk.compression,)) + chunk.payload
+        sectors = -(-len(record) // SECTOR_SIZE)
+        if sectors > _MAX_SECTORS:
+            return None
+        _U32.pack_into(header, index * 4, (sector << 8) | sectors)
+        _U32.pack_into(header, SECTOR_SIZE + index * 4, chunk.timestamp)
+        body += record
+        body += bytes(sectors * SECTOR_SIZE - len(record))
+        sector += sectors
+    return bytes(header + body)
+
+
+def _external_path(region: Path, chunk_x: int, chunk_z: int) -> Path:
+    return region.with_name(f"c.{chunk_x}.{chunk_z}.mcc")
+
+
+def _keep_chunk(region: Path, chunk: _Chunk, chunk_x: int, chunk_z: int, options: RegionOptions) -> bool:
+    if options.bounds is not None:
+        min_x, min_z, max_x, max_z = options.bounds
+        if not (min_x <= chunk_x <= max_x and min_z <= chunk_z <= max_z):
+            return False
+    if not options.inspects_chunks:
+        return True
+
+    compression, payload = chunk.compression, chunk.payload
+    try:
+        if compression & _EXTERNAL:
+            compression &= ~_EXTERNAL
+            payload = _external_path(region, chunk_x, chunk_z).read_bytes()
+        nbt = _decompress(compression, payload)
+        fields = chunk_fields(nbt) if nbt is not None else None
+    except (OSError, EOFError, zlib.error, struct.error, IndexError, ValueError):
+        fields = None
+    if fields is None:
+        # undecodable chunks are kept as they are rather than guessed about
+        return True
+
+    if int(fields.get("InhabitedTime", 0)) < options.min_inhabited_time:
+        return False
+    status = fields.get("Status")
+    if options.drop_unfinished and status is not None and status not in _FINISHED_STATUSES:
+        return False
+    return True
+
+
+def _recompress(chunk: _Chunk, level: int) -> bool:
+    if chunk.compression & _EXTERNAL:
+        return False
+    try:
+        nbt = _decompress(chunk.compression, chunk.payload)
+    except (EOFError, zlib.error, OSError):
+        return False
+    if nbt is None:
+        return False
+    payload = zlib.compress(nbt, level)
+    if chunk.compression != _UNCOMPRESSED and len(payload) >= len(chunk.payload):
+        return False
+    chunk.compression, chunk.payload = _ZLIB, payload
+    return True
+
+
+def _optimize_file(
+    path: Path,
+    region_x: int,
+    region_z: int,
+    options: RegionOptions,
+    keep: set[int] | None,
+) -> tuple[set[int], RegionStats]:
+    data = path.read_bytes()
+    chunks = _read_region(data)
+    stats = RegionStats(files=1, chunks=len(chunks), size_before=len(data))
+
+    changed = False
+    kept: dict[int, _Chunk] = {}
+    for index, chunk in chunks.items():
+        chunk_x = region_x * 32 + (index & 31)
+        chunk_z = region_z * 32 + (index >> 5)
+        if keep is not None:
+            retained = index in keep
+        else:
+            retained = _keep_chunk(path, chunk, chunk_x, chunk_z, options)
+        if not retained:
+            if chunk.compression & _EXTERNAL:
+                _external_path(path, chunk_x, chunk_z).unlink(missing_ok=True)
+            changed = True
+            continue
+        if options.recompress_level is not None and _recompress(chunk, options.recompress_level):
+            changed = True
+        kept[index] = chunk
+    stats.kept_chunks = len(kept)
+
+    if not kept:
+        path.unlink()
+        stats.removed_files = 1
+        return set(), stats
+
+    encoded = _encode_region(kept)
+    if encoded is None or (not changed and len(encoded) >= len(data)):
+        stats.size_after = len(data)
+        return set(kept), stats
+
+    # a new inode: hardlinked or cached copies of the region are left untouched
+    tmp = path.with_name(f".{path.name}.mapack-tmp")
+    tmp.write_bytes(encoded)
+    os.replace(tmp, path)
+    stats.size_after = len(encoded)
+    return set(kept), stats
+
+
+def optimize_region(region: str, companions: tuple[str, ...], options: RegionOptions) -> RegionStats:
+    """Optimize one region file and drop the same chunks from its entities/poi counterparts.
+
+    `region` may be empty when only counterparts exist; they are then filtered by `bounds` alone.
+    """
+    name = Path(region or companions[0]).name
+    match = _REGION_NAME.fullmatch(name)
+    if match is None:
+        raise ValueError(f"Not a region file name: {name}")
+    region_x, region_z = int(match.group(1)), int(match.group(2))
+
+    stats = RegionStats()
+    keep: set[int] | None = None
+    if region:
+        keep, region_stats = _optimize_file(Path(region), region_x, region_z, options, None)
+        stats.add(region_stats)
+    companion_options = RegionOptions(bounds=options.bounds, recompress_level=options.recompress_level)
+    for companion in companions:
+        _, companion_stats = _optimize_file(Path(companion), region_x, region_z, companion_options, keep)
+        stats.add(companion_stats)
+    return stats
+
+
+def _region_jobs(dimension_dir: Path) -> list[tuple[str, tuple[str, ...]]]:
+    names: set[str] = set()
+    for folder in ("region", *_COMPANION_DIRS):
+        directory = dimension_dir / folder
+        if directory.is_dir():
+            names.update(p.name for p in directory.iterdir() if _REGION_NAME.fullmatch(p.name))
+
+    jobs = []
+    for name in sorted(names):
+        region = dimension_dir / "region" / name
+        companions = tuple(
+            str(dimension_dir / folder / name) for folder in _COMPANION_DIRS if (dimension_dir / folder / name).is_file()
+        )
+        jobs.append((str(region) if region.is_file() else "", companions))
+    return jobs
+
+
+def optimize_regions(dimension_dirs: list[Path], options: RegionOptions, *, jobs: int | None = None) -> RegionStats:
+    """Optimize every region file of the given dimension folders, in parallel across files."""
+    work = [job for directory in dimension_dirs for job in _region_jobs(directory)]
+    workers = min(jobs or os.cpu_count() or 1, len(work))
+
+    stats = RegionStats()
+    if workers <= 1:
+        for region, companions in work:
+            stats.add(optimize_region(region, companions, options))
+        return stats
+
+    # builds run transforms from threads, which `fork` does not mix well with
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method)) as pool:
+        futures = [pool.submit(optimize_region, region, companions, options) for region, companions in work]
+        for future in futures:
+            stats.add(future.result())
+    return stats
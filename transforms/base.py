@@ -1,11 +1,14 @@
 from __future__ import annotations
 
+from pathlib import Path
 from typing import Any, Protocol
 
 
 class TransformContextProtocol(Protocol):
     def run_nested_transform(self, spec: dict[str, Any]) -> None: ...
 
+    def break_links(self, path: Path) -> None: ...
+
 
 class TransformHandler(Protocol):
     def __call__(self, ctx: TransformContextProtocol, spec: dict[str, Any]) -> None: ...
@@ -34,7 +34,7 @@ def _run_transform_or_list(ctx, block):
     raise ValueError("conditional transform expects dict or list for then/else")
 
 
-@register_transform("conditional")
+@register_transform("conditional", cacheable=True, link_safe=True, read_only=True, virtual=True)
 def transform_conditional(ctx, spec: dict) -> None:
     op = str(spec.get("op", "=="))
     a = ctx.resolve_expr_or_value(spec.get("a"))
@@ -1,44 +1,47 @@
 from __future__ import annotations
 
-import shutil
 from pathlib import Path
 
 from .registry import register_transform
 
 
-def _copy_file(src: Path, dst: Path) -> None:
+def _copy_file(ctx, src: Path, dst: Path) -> None:
     dst.parent.mkdir(parents=True, exist_ok=True)
-    shutil.copy2(src, dst)
+    ctx.copy_file(src, dst)
 
 
-def _copy_tree_contents(src: Path, dst: Path) -> None:
-    dst.mkdir(parents=True, exist_ok=True)
-    for child in src.iterdir():
-        target = dst / child.name
-        if child.is_dir():
-            shutil.copytree(child, target, dirs_exist_ok=True)
-        else:
-            _copy_file(child, target)
+def _copy_into_overlay(ctx, overlay, src: Path, dest: str, spec: dict) -> None:
+    if src.is_file():
+        overlay.add_file(src, f"{dest}/{src.name}".lstrip("/") if overlay.is_dir(dest) else dest)
+        return
+    if overlay.is_file(dest):
+        raise ValueError(f"Cannot copy directory into file: {ctx.tree.path / dest}")
+    overlay.add_tree(src, dest, ctx.path_filter(spec, "copy"))
 
 
-@register_transform("copy")
+@register_transform("copy", cacheable=True, link_safe=True, virtual=True)
 def transform_copy(ctx, spec: dict) -> None:
     src = ctx.resolve_source(spec.get("src"), allow_artifact_output=True)
     dest_rel = str(ctx.resolve_value(spec.get("dest", ".")))
-    dest = (ctx.workdir / dest_rel).resolve()
 
     if not src.exists():
         raise FileNotFoundError(f"copy transform source does not exist: {src}")
 
+    overlay = ctx.overlay
+    if overlay is not None and (dest_key := overlay.normalize(dest_rel)) is not None:
+        _copy_into_overlay(ctx, overlay, src, dest_key, spec)
+        return
+
+    dest = (ctx.workdir / dest_rel).resolve()
     if src.is_file():
         if dest.exists() and dest.is_dir():
-            _copy_file(src, dest / src.name)
+            _copy_file(ctx, src, dest / src.name)
         else:
-            _copy_file(src, dest)
+            _copy_file(ctx, src, dest)
         return
 
     # directory source
     if dest.exists() and dest.is_file():
         raise ValueError(f"Cannot copy directory into file: {dest}")
 
-    _copy_tree_contents(src, dest)
+    ctx.copy_tree(src, dest, ctx.path_filter(spec, "copy"))
@@ -1,15 +1,95 @@
 from __future__ import annotations
 
+import hashlib
+import logging
+import re
+import shutil
 import subprocess
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
 
 from .registry import register_transform
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger("mapack")
+
+_mirror_locks: dict[Path, threading.Lock] = {}
+_mirror_locks_guard = threading.Lock()
+
 
 def _run_git(args: list[str], cwd) -> None:
     subprocess.run(["git", *args], cwd=str(cwd), check=True)
 
 
-@register_transform("git:clone")
+def _git_output(args: list[str], cwd) -> str:
+    return subprocess.run(["git", *args], cwd=str(cwd), check=True, capture_output=True, text=True).stdout.strip()
+
+
+def _mirror_path(root: Path, repo_url: str) -> Path:
+    name = re.sub(r"[^A-Za-z0-9._-]+", "-", repo_url.rstrip("/").rsplit("/", 1)[-1].removesuffix(".git")) or "repo"
+    return root / f"{name}-{hashlib.sha256(repo_url.encode('utf-8')).hexdigest()[:12]}.git"
+
+
+@contextmanager
+def _mirror_lock(mirror: Path) -> Iterator[None]:
+    # threads of this build, then other mapack processes sharing the cache
+    with _mirror_locks_guard:
+        lock = _mirror_locks.setdefault(mirror, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        with open(mirror.with_name(mirror.name + ".lock"), "w") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _update_mirror(ctx, repo_url: str) -> Path | None:
+    """Clone or fetch the bare mirror of `repo_url` in the cache and return its path.
+
+    Returns None when the cache is disabled.
+    """
+    root = ctx.cache_dir("git")
+    if root is None:
+        return None
+    mirror = _mirror_path(root, repo_url)
+    with _mirror_lock(mirror):
+        if (mirror / "HEAD").is_file():
+            logger.info("git mirror: fetching %s", repo_url)
+            _run_git(["remote", "set-url", "origin", repo_url], cwd=mirror)
+            _run_git(["fetch", "--prune", "origin"], cwd=mirror)
+        else:
+            logger.info("git mirror: cloning %s", repo_url)
+            partial = mirror.with_name(mirror.name + ".partial")
+            shutil.rmtree(partial, ignore_errors=True)
+            _run_git(["clone", "--mirror", repo_url, str(partial)], cwd=root)
+            # let checkouts request partial (`filter`) clones from the mirror
+            _run_git(["config", "uploadpack.allowFilter", "true"], cwd=partial)
+            partial.rename(mirror)
+    return mirror
+
+
+def _clone_source(mirror: Path | None, repo_url: str, *, depth: int | None, filter_spec: str | None) -> str:
+    if mirror is None:
+        return repo_url
+    if depth is None and filter_spec is None:
+        # a local path clone hardlinks the (immutable) objects of the mirror
+        return str(mirror)
+    # shallow and partial clones only apply through a transport
+    return mirror.as_uri()
+
+
+# clones only create files (objects cloned from a local mirror are hardlinked by git itself, and immutable)
+@register_transform("git:clone", link_safe=True)
 def transform_git_clone(ctx, spec: dict) -> None:
     repo_url = str(ctx.resolve_value(spec.get("repo_url")))
     branch = spec.get("branch")
@@ -17,28 +97,62 @@ def transform_git_clone(ctx, spec: dict) -> None:
     dest = (ctx.workdir / dest_rel).resolve()
     dest.parent.mkdir(parents=True, exist_ok=True)
 
+    depth = spec.get("depth")
+    depth = int(ctx.resolve_value(depth)) if depth is not None else None
+    filter_spec = spec.get("filter")
+    filter_spec = str(ctx.resolve_value(filter_spec)) if filter_spec is not None else None
+    sparse_paths = spec.get("sparse_paths")
+    if sparse_paths is not None and not isinstance(sparse_paths, list):
+        raise ValueError("git:clone sparse_paths must be a list")
+
+    mirror = _update_mirror(ctx, repo_url) if ctx.resolve_value(spec.get("mirror", True)) else None
+
     args = ["clone"]
     if branch:
         args.extend(["--branch", str(ctx.resolve_value(branch))])
+    if depth is not None:
+        args.extend(["--depth", str(depth)])
+    if filter_spec is not None:
+        args.append(f"--filter={filter_spec}")
+    if sparse_paths is not None:
+        args.append("--sparse")
+    args.append(_clone_source(mirror, repo_url, depth=depth, filter_spec=filter_spec))
     if dest_rel in {"", "."}:
-        args.extend([repo_url, "."])
+        args.append(".")
     else:
-        args.extend([repo_url, str(dest)])
+        args.append(str(dest))
     _run_git(args, cwd=ctx.workdir)
 
+    if sparse_paths is not None:
+        _run_git(["sparse-checkout", "set", *(str(ctx.resolve_value(p)) for p in sparse_paths)], cwd=dest)
+    if mirror is not None:
+        # the checkout tracks the real remote; git:pull goes through the mirror again
+        _run_git(["remote", "set-url", "origin", repo_url], cwd=dest)
+
 
-@register_transform("git:pull")
+@register_transform("git:pull", link_safe=True)
 def transform_git_pull(ctx, spec: dict) -> None:
     repo_dir_rel = str(ctx.resolve_value(spec.get("repo_dir", ".")))
     branch = spec.get("branch")
     repo_dir = (ctx.workdir / repo_dir_rel).resolve()
     catch = spec.get("catch")
 
-    args = ["pull"]
-    if branch:
-        args.extend(["origin", str(ctx.resolve_value(branch))])
-
     try:
+        # git replaces the worktree files it updates, but appends to reflogs and rewrites FETCH_HEAD in place
+        ctx.break_links(Path(_git_output(["rev-parse", "--absolute-git-dir"], cwd=repo_dir)))
+        mirror = None
+        if ctx.resolve_value(spec.get("mirror", True)):
+            mirror = _update_mirror(ctx, _git_output(["remote", "get-url", "origin"], cwd=repo_dir))
+
+        if mirror is None:
+            args = ["pull"]
+            if branch:
+                args.extend(["origin", str(ctx.resolve_value(branch))])
+        else:
+            # refresh the remote-tracking refs from the mirror, then pull as from origin
+            _run_git(["fetch", "--prune", str(mirror), "+refs/heads/*:refs/remotes/origin/*"], cwd=repo_dir)
+            target = str(ctx.resolve_value(branch)) if branch else _git_output(["branch", "--show-current"], cwd=repo_dir)
+            args = ["pull", str(mirror), target]
         _run_git(args, cwd=repo_dir)
     except Exception:
         if catch is None:
@@ -7,7 +7,7 @@ from .registry import register_transform
 logger = logging.getLogger("mapack")
 
 
-@register_transform("log")
+@register_transform("log", cacheable=True, link_safe=True, read_only=True, virtual=True)
 def transform_log(ctx, spec: dict) -> None:
     message = ctx.resolve_value(spec.get("message", ""))
     logger.info("[transform:log] %s", message)
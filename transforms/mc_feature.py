@@ -1,10 +1,15 @@
 from __future__ import annotations
 
+import logging
 import shutil
 from pathlib import Path
+from typing import Any
 
+from .anvil import RegionOptions, optimize_regions
 from .registry import register_transform
 
+logger = logging.getLogger("mapack")
+
 
 _DIMENSION_PATHS = {
     "minecraft:the_nether": [
@@ -28,7 +33,84 @@ def _remove_dimension_folders(workdir: Path, keep: set[str]) -> None:
                 shutil.rmtree(path, ignore_errors=True)
 
 
-@register_transform("mc:feature")
+def _remove_dimension_entries(overlay, keep: set[str]) -> None:
+    # virtual workdir: nothing is on disk yet, drop the entries instead
+    for dim, folders in _DIMENSION_PATHS.items():
+        if dim in keep:
+            continue
+        for parts in folders:
+            overlay.remove("/".join(parts))
+
+
+def _dimension_dirs(workdir: Path, dimensions: list[str] | None) -> list[Path]:
+    if dimensions is None:
+        candidates = [workdir, workdir / "DIM-1", workdir / "DIM1"]
+        candidates += sorted(p.parent for p in workdir.glob("dimensions/**/region"))
+    else:
+        candidates = []
+        for dim in dimensions:
+            if dim == "minecraft:overworld":
+                candidates.append(workdir)
+            elif dim in _DIMENSION_PATHS:
+                candidates += [workdir.joinpath(*parts) for parts in _DIMENSION_PATHS[dim]]
+            else:
+                namespace, _, path = dim.partition(":")
+                candidates.append(workdir.joinpath("dimensions", namespace, *path.split("/")))
+    return [p for p in dict.fromkeys(candidates) if p.is_dir()]
+
+
+def _region_options(ctx, args: dict[str, Any]) -> RegionOptions:
+    options = RegionOptions(
+        min_inhabited_time=int(ctx.resolve_value(args.get("min_inhabited_time", 0))),
+        drop_unfinished=bool(ctx.resolve_value(args.get("drop_unfinished", False))),
+    )
+    if ctx.resolve_value(args.get("drop_uninhabited", False)):
+        options.min_inhabited_time = max(options.min_inhabited_time, 1)
+
+    bounds = args.get("bounds")
+    if bounds is not None:
+        if not isinstance(bounds, dict) or not {"min_x", "min_z", "max_x", "max_z"} <= bounds.keys():
+            raise ValueError("mc:feature optimize_regions args.bounds must define min_x, min_z, max_x and max_z")
+        # block coordinates -> chunk coordinates
+        min_x, min_z, max_x, max_z = (int(ctx.resolve_value(bounds[k])) >> 4 for k in ("min_x", "min_z", "max_x", "max_z"))
+        options.bounds = (min_x, min_z, max_x, max_z)
+
+    level = ctx.resolve_value(args.get("recompress_level"))
+    if level is not None:
+        level = int(level)
+        if not 0 <= level <= 9:
+            raise ValueError("mc:feature optimize_regions args.recompress_level must be between 0 and 9")
+        options.recompress_level = level
+    return options
+
+
+def _optimize_regions(ctx, args: dict[str, Any]) -> None:
+    dimensions = args.get("dimensions")
+    if dimensions is not None and not isinstance(dimensions, list):
+        raise ValueError("mc:feature optimize_regions args.dimensions must be a list")
+    if dimensions is not None:
+        dimensions = [str(ctx.resolve_value(v)) for v in dimensions]
+    jobs = ctx.resolve_value(args.get("jobs"))
+
+    stats = optimize_regions(
+        _dimension_dirs(ctx.workdir, dimensions),
+        _region_options(ctx, args),
+        jobs=int(jobs) if jobs is not None else None,
+    )
+    logger.info(
+        "target=%s artifact=%s optimize_regions: kept %d/%d chunks in %d region files (%d removed), %d -> %d bytes",
+        ctx.state.target_name,
+        ctx.artifact_name,
+        stats.kept_chunks,
+        stats.chunks,
+        stats.files,
+        stats.removed_files,
+        stats.size_before,
+        stats.size_after,
+    )
+
+
+@register_transform("mc:feature", cacheable=True, link_safe=True, virtual=True)
 def transform_mc_feature(ctx, spec: dict) -> None:
     feature = str(ctx.resolve_value(spec.get("feature", "")))
     args = spec.get("args") or {}
@@ -40,7 +122,14 @@ def transform_mc_feature(ctx, spec: dict) -> None:
         if not isinstance(keep_raw, list):
             raise ValueError("mc:feature delete_dimensions args.keep must be a list")
         keep = {str(ctx.resolve_value(v)) for v in keep_raw}
-        _remove_dimension_folders(ctx.workdir, keep)
+        if ctx.overlay is not None:
+            _remove_dimension_entries(ctx.overlay, keep)
+        else:
+            _remove_dimension_folders(ctx.workdir, keep)
+        return
+
+    if feature == "optimize_regions":
+        _optimize_regions(ctx, args)
         return
 
     raise ValueError(f"Unsupported mc:feature value: {feature}")
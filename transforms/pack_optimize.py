@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from .registry import register_transform
+
+logger = logging.getLogger("mapack")
+
+# bump when the optimizations change so that stored results are not reused
+_VERSION = 1
+
+_JSON_SUFFIXES = {".json", ".mcmeta"}
+_SKIPPED_DIRS = {".git"}
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# ancillary chunks without effect on the decoded pixels
+_PNG_METADATA = {b"tEXt", b"zTXt", b"iTXt", b"tIME", b"pHYs"}
+_U32 = struct.Struct(">I")
+
+# model keys a child model inherits from its `parent` (besides ones the game ignores)
+_ALIASABLE_MODEL_KEYS = {"parent", "elements", "textures", "display", "ambientocclusion", "gui_light", "credit", "texture_size"}
+
+
+@dataclass(slots=True)
+class _Options:
+    json: bool = True
+    png: bool = True
+    strip_png_metadata: bool = True
+
+    @property
+    def tag(self) -> bytes:
+        return f"pack:optimize/{_VERSION}/{int(self.json)}{int(self.png)}{int(self.strip_png_metadata)}\0".encode()
+
+
+@dataclass(slots=True)
+class _Stats:
+    files: int = 0
+    optimized: int = 0
+    cached: int = 0
+    aliased: int = 0
+    size_before: int = 0
+    size_after: int = 0
+
+
+def minify_json(data: bytes) -> bytes | None:
+    """Return `data` re-serialized without whitespace, or None if it is not smaller or not plain JSON."""
+    try:
+        value = json.loads(data.decode("utf-8-sig"))
+        out = json.dumps(value, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+    except ValueError:
+        return None
+    return out if len(out) < len(data) else None
+
+
+def optimize_png(data: bytes, *, strip_metadata: bool = True) -> bytes | None:
+    """Recompress the image data of a PNG at zlib level 9, or return None if that does not make it smaller.
+
+    Pixels, palette and color chunks are kept bit for bit; only the deflate stream (and,
+    with `strip_metadata`, text/time/physical-size chunks) change.
+    """
+    if not data.startswith(_PNG_SIGNATURE):
+        return None
+    chunks: list[tuple[bytes, bytes]] = []
+    pos = len(_PNG_SIGNATURE)
+    while pos + 12 <= len(data):
+        length = _U32.unpack_from(data, pos)[0]
+        kind = data[pos + 4 : pos + 8]
+        body = data[pos + 8 : pos + 8 + length]
+        if len(body) != length or _U32.unpack_from(data, pos + 8 + length)[0] != zlib.crc32(kind + body):
+            return None
+        chunks.append((kind, body))
+        pos += 12 + length
+        if kind == b"IEND":
+            break
+    else:
+        return None
+
+    try:
+        raw = zlib.decompress(b"".join(body for kind, body in chunks if kind == b"IDAT"))
+    except zlib.error:
+        return None
+    candidates = []
+    for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+        candidates.append(compressor.compress(raw) + compressor.flush())
+    idat = min(candidates, key=len)
+
+    out = bytearray(_PNG_SIGNATURE)
+    wrote_idat = False
+    for kind, body in chunks:
+        if kind == b"IDAT":
+            if wrote_idat:
+                continue
+            body, wrote_idat = idat, True
+        elif strip_metadata and kind in _PNG_METADATA:
+            continue
+        out += _U32.pack(len(body)) + kind + body + _U32.pack(zlib.crc32(kind + body))
+    return bytes(out) if len(out) < len(data) else None
+
+
+def _optimize_bytes(path: Path, data: bytes, options: _Options) -> bytes | None:
+    suffix = path.suffix.lower()
+    if options.json and suffix in _JSON_SUFFIXES:
+        return minify_json(data)
+    if options.png and suffix == ".png":
+        return optimize_png(data, strip_metadata=options.strip_png_metadata)
+    return None
+
+
+def _replace_file(path: Path, data: bytes) -> None:
+    # a new inode: hardlinked copies of the file are left untouched
+    tmp = path.with_name(f".{path.name}.mapack-tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _process_file(path: Path, options: _Options, store) -> tuple[int, int, bool, bool]:
+    """Optimize one file in place. Returns (size before, size after, optimized, served from store)."""
+    data = path.read_bytes()
+    if not data:
+        return 0, 0, False, False
+
+    key = None
+    if store is not None:
+        key = hashlib.sha256(options.tag + path.suffix.lower().encode() + b"\0" + data).hexdigest()
+    cached = store.get(key) if key is not None else None
+    if cached is not None:
+        # an empty blob records that the file could not be made smaller
+        result = cached or None
+    else:
+        result = _optimize_bytes(path, data, options)
+        if key is not None:
+            store.put(key, result or b"")
+
+    if result is None:
+        return len(data), len(data), False, cached is not None
+    _replace_file(path, result)
+    return len(data), len(result), True, cached is not None
+
+
+def _model_reference(rel: Path) -> str | None:
+    # assets/<namespace>/models/<path>.json -> <namespace>:<path>
+    parts = rel.parts
+    if len(parts) < 4 or parts[0] != "assets" or parts[2] != "models" or rel.suffix != ".json":
+        return None
+    return f"{parts[1]}:{'/'.join(parts[3:])[: -len('.json')]}"
+
+
+def _alias_duplicate_models(root: Path, files: list[Path]) -> int:
+    """Replace models identical to another one by a reference to it through `parent`."""
+    groups: dict[bytes, list[tuple[str, Path]]] = {}
+    for path in files:
+        reference = _model_reference(path.relative_to(root))
+        if reference is None:
+            continue
+        data = path.read_bytes()
+        try:
+            model = json.loads(data.decode("utf-8-sig"))
+        except ValueError:
+            continue
+        # `overrides`, custom loaders, ... are not inherited from parents
+        if not isinstance(model, dict) or not model.keys() <= _ALIASABLE_MODEL_KEYS:
+            continue
+        groups.setdefault(hashlib.sha256(data).digest(), []).append((reference, path))
+
+    aliased = 0
+    for models in groups.values():
+        if len(models) < 2:
+            continue
+        models.sort()
+        canonical = models[0][0]
+        alias = json.dumps({"parent": canonical}, separators=(",", ":")).encode("utf-8")
+        for _reference, path in models[1:]:
+            if len(alias) < path.stat().st_size:
+                _replace_file(path, alias)
+                aliased += 1
+    return aliased
+
+
+def _walk_files(root: Path) -> list[Path]:
+    found: list[Path] = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in _SKIPPED_DIRS)
+        found.extend(Path(dirpath) / name for name in sorted(filenames))
+    return found
+
+
+@register_transform("pack:optimize", cacheable=True, link_safe=True)
+def transform_pack_optimize(ctx, spec: dict) -> None:
+    root_rel = str(ctx.resolve_value(spec.get("path", ".")))
+    root = (ctx.workdir / root_rel).resolve()
+    if not root.is_dir():
+        raise FileNotFoundError(f"pack:optimize path does not exist: {root}")
+
+    options = _Options(
+        json=bool(ctx.resolve_value(spec.get("json", True))),
+        png=bool(ctx.resolve_value(spec.get("png", True))),
+        strip_png_metadata=bool(ctx.resolve_value(spec.get("strip_png_metadata", True))),
+    )
+    jobs = ctx.resolve_value(spec.get("jobs"))
+    workers = max(1, int(jobs) if jobs is not None else os.cpu_count() or 1)
+    store = ctx.blob_store("pack-optimize")
+
+    files = _walk_files(root)
+    candidates = [
+        p
+        for p in files
+        if (options.json and p.suffix.lower() in _JSON_SUFFIXES) or (options.png and p.suffix.lower() == ".png")
+    ]
+
+    stats = _Stats(files=len(candidates))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mapack-pack") as pool:
+        for before, after, optimized, cached in pool.map(lambda p: _process_file(p, options, store), candidates):
+            stats.size_before += before
+            stats.size_after += after
+            stats.optimized += optimized
+            stats.cached += cached
+
+    # changes what the model files contain (not just their encoding), so only on request
+    if ctx.resolve_value(spec.get("dedupe_models", False)):
+        stats.aliased = _alias_duplicate_models(root, [p for p in files if p.suffix == ".json"])
+
+    logger.info(
+        "target=%s artifact=%s pack:optimize: %d/%d files smaller (%d from cache), %d -> %d bytes, %d duplicate models aliased",
+        ctx.state.target_name,
+        ctx.artifact_name,
+        stats.optimized,
+        stats.files,
+        stats.cached,
+        stats.size_before,
+        stats.size_after,
+        stats.aliased,
+    )
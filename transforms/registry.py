@@ -1,35 +1,137 @@
 from __future__ import annotations
 
+import importlib
+import threading
+from dataclasses import dataclass
 from typing import Any
 
 from .base import TransformHandler
 
+# third-party transforms: `<type> = "package.module"` (registering itself with `register_transform`)
+# or `<type> = "package.module:handler"` (registered with the default, conservative flags)
+ENTRY_POINT_GROUP = "mapack.transforms"
+
+# built-in transform type -> module registering it, imported when the type is first used
+BUILTIN_TRANSFORMS = {
+    "conditional": ".conditional",
+    "copy": ".copy",
+    "git:clone": ".git_ops",
+    "git:pull": ".git_ops",
+    "log": ".log",
+    "mc:feature": ".mc_feature",
+    "pack:optimize": ".pack_optimize",
+}
+
+
+@dataclass(frozen=True, slots=True)
+class TransformInfo:
+    name: str
+    handler: TransformHandler
+    # effect depends only on the resolved spec, local sources and the workdir
+    cacheable: bool = False
+    # never writes into existing workdir files in place (replaces or deletes them instead), or calls
+    # `ctx.break_links(path)` on a file before doing so; otherwise the whole workdir is un-linked first
+    link_safe: bool = False
+    # never writes into the workdir (nested transforms report their own writes)
+    read_only: bool = False
+    # handles virtual workdirs itself (through `ctx.overlay`), so they are not written to disk first
+    virtual: bool = False
+
 
 class TransformRegistry:
-    def __init__(self) -> None:
-        self._handlers: dict[str, TransformHandler] = {}
+    """Transforms by type name. Modules are only imported once one of their types is looked up."""
+
+    def __init__(self, modules: dict[str, str] | None = None) -> None:
+        self._transforms: dict[str, TransformInfo] = {}
+        self._modules = dict(modules or {})
+        self._entry_points: dict[str, Any] | None = None
+        # artifacts built concurrently may look up the same type first
+        self._lock = threading.RLock()
 
-    def register(self, name: str, handler: TransformHandler) -> None:
+    def register(
+        self,
+        name: str,
+        handler: TransformHandler,
+        *,
+        cacheable: bool = False,
+        link_safe: bool = False,
+        read_only: bool = False,
+        virtual: bool = False,
+    ) -> None:
         key = name.strip()
         if not key:
             raise ValueError("Transform name cannot be empty")
-        self._handlers[key] = handler
+        self._transforms[key] = TransformInfo(
+            name=key,
+            handler=handler,
+            cacheable=cacheable,
+            link_safe=link_safe,
+            read_only=read_only,
+            virtual=virtual,
+        )
 
-    def get(self, name: str) -> TransformHandler:
-        if name not in self._handlers:
+    def _plugins(self) -> dict[str, Any]:
+        if self._entry_points is None:
+            # scanning installed distributions is slow: only done for types that are not built in
+            from importlib.metadata import entry_points
+
+            self._entry_points = {ep.name: ep for ep in entry_points(group=ENTRY_POINT_GROUP)}
+        return self._entry_points
+
+    def _load(self, name: str) -> None:
+        with self._lock:
+            if name in self._transforms:
+                return
+            module = self._modules.get(name)
+            if module is not None:
+                importlib.import_module(module, __package__)
+                return
+            entry_point = self._plugins().get(name)
+            if entry_point is None:
+                return
+            try:
+                loaded = entry_point.load()
+            except Exception as exc:
+                raise ImportError(f"Transform plugin {name!r} ({entry_point.value}) failed to load: {exc}") from exc
+            if name not in self._transforms and callable(loaded):
+                self.register(name, loaded)
+
+    def info(self, name: str) -> TransformInfo:
+        if name not in self._transforms:
+            self._load(name)
+        if name not in self._transforms:
             raise KeyError(f"Unknown transform type: {name}")
-        return self._handlers[name]
+        return self._transforms[name]
+
+    def get(self, name: str) -> TransformHandler:
+        return self.info(name).handler
+
+    def is_cacheable(self, name: str) -> bool:
+        try:
+            return self.info(name).cacheable
+        except KeyError:
+            return False
 
     def names(self) -> list[str]:
-        return sorted(self._handlers.keys())
+        """All known types, including those of modules and plugins that are not loaded yet."""
+        return sorted({*self._transforms, *self._modules, *self._plugins()})
 
 
-registry = TransformRegistry()
+registry = TransformRegistry(BUILTIN_TRANSFORMS)
 
 
-def register_transform(name: str):
+def register_transform(
+    name: str,
+    *,
+    cacheable: bool = False,
+    link_safe: bool = False,
+    read_only: bool = False,
+    virtual: bool = False,
+):
     def wrapper(func: TransformHandler) -> TransformHandler:
-        registry.register(name, func)
+        registry.register(
+            name, func, cacheable=cacheable, link_safe=link_safe, read_only=read_only, virtual=virtual
+        )
         return func
 
     return wrapper